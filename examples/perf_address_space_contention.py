@@ -0,0 +1,105 @@
+"""
+Contention benchmark of the server address space: N reader threads
+read attributes and browse while M writer threads set values in batches.
+Readers of the variables with a value callback simulate a slow device, the
+address space lock must not serialize them.
+The readers first read the variables of namespace 2 set by the writers, then
+variables of namespace 0, which never wait on the writers: the worst latency of
+a read shows it.
+
+usage: python perf_address_space_contention.py [nb_readers] [nb_writers] [duration]
+"""
+import sys
+sys.path.insert(0, "..")
+import time
+import threading
+
+from opcua import ua, Server
+
+
+NB_VARIABLES = 1000
+
+
+def slow_value():
+    # simulate reading from a device, the GIL is released while waiting
+    time.sleep(0.001)
+    return ua.DataValue(ua.Variant(1.0, ua.VariantType.Double))
+
+
+def reader(aspace, view, nodeids, slow_nodeid, stop, counts, latencies, idx):
+    browse = ua.BrowseDescription()
+    browse.NodeId = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+    browse.BrowseDirection = ua.BrowseDirection.Forward
+    browse.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+    browse.IncludeSubtypes = True
+    params = ua.BrowseParameters()
+    params.NodesToBrowse = [browse]
+    n = 0
+    latency = 0
+    while not stop.is_set():
+        for nodeid in nodeids:
+            start = time.time()
+            aspace.get_attribute_value(nodeid, ua.AttributeIds.Value)
+            latency = max(latency, time.time() - start)
+        aspace.get_attribute_value(slow_nodeid, ua.AttributeIds.Value)
+        view.browse(params)
+        n += len(nodeids) + 2
+    counts[idx] = n
+    latencies[idx] = latency
+
+
+def writer(aspace, nodeids, stop, counts, idx):
+    n = 0
+    while not stop.is_set():
+        aspace.set_attribute_values([(nodeid, ua.AttributeIds.Value,
+                                      ua.DataValue(ua.Variant(float(n), ua.VariantType.Double)))
+                                     for nodeid in nodeids])
+        n += len(nodeids)
+    counts[idx] = n
+
+
+def run(nb_readers, nb_writers, duration):
+    server = Server()
+    folder = server.nodes.objects.add_folder(2, "Contention")
+    nodeids = [folder.add_variable(2, "Var{0}".format(i), 0.0).nodeid for i in range(NB_VARIABLES)]
+    slow = folder.add_variable(2, "Slow", 0.0)
+    iserver = server.iserver
+    node = iserver.aspace[slow.nodeid]
+    node.attributes[ua.AttributeIds.Value].value_callback = slow_value
+    ns0_nodeids = [child.nodeid for child in server.get_node(ua.ObjectIds.Server_ServerStatus).get_children()]
+    ns0_nodeids = (ns0_nodeids * NB_VARIABLES)[:NB_VARIABLES]
+
+    print("readers of namespace 2")
+    bench(iserver, nodeids, nodeids, slow.nodeid, nb_readers, nb_writers, duration)
+    print("readers of namespace 0")
+    bench(iserver, ns0_nodeids, nodeids, slow.nodeid, nb_readers, nb_writers, duration)
+
+
+def bench(iserver, read_nodeids, write_nodeids, slow_nodeid, nb_readers, nb_writers, duration):
+    stop = threading.Event()
+    counts = [0] * (nb_readers + nb_writers)
+    latencies = [0] * nb_readers
+    threads = []
+    for i in range(nb_readers):
+        threads.append(threading.Thread(target=reader, args=(iserver.aspace, iserver.view_service, read_nodeids,
+                                                             slow_nodeid, stop, counts, latencies, i)))
+    for i in range(nb_writers):
+        threads.append(threading.Thread(target=writer, args=(iserver.aspace, write_nodeids, stop, counts,
+                                                             nb_readers + i)))
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    reads = sum(counts[:nb_readers])
+    writes = sum(counts[nb_readers:])
+    print("{0} readers, {1} writers: {2:.0f} reads/s, {3:.0f} writes/s, worst read {4:.1f} ms".format(
+        nb_readers, nb_writers, reads / duration, writes / duration, max(latencies) * 1000))
+
+
+if __name__ == "__main__":
+    nb_readers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    nb_writers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    run(nb_readers, nb_writers, duration)
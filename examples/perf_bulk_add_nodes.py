@@ -0,0 +1,83 @@
+"""
+Benchmark of loading a large model in the server address space:
+NodeManagementService.add_nodes, which adds the items one by one, against
+bulk_add_nodes, which validates them as a set and inserts them at once.
+The model is a tree of folders with variables, each variable has an extra reference.
+
+usage: python perf_bulk_add_nodes.py [nb_variables]
+"""
+import sys
+sys.path.insert(0, "..")
+import time
+
+from opcua import ua, Server
+
+
+VARIABLES_PER_FOLDER = 100
+
+
+def make_item(nodeid, parent, name, nodeclass, reftype, typedef, attrs):
+    item = ua.AddNodesItem()
+    item.RequestedNewNodeId = nodeid
+    item.BrowseName = ua.QualifiedName(name, nodeid.NamespaceIndex)
+    item.NodeClass = nodeclass
+    item.ParentNodeId = parent
+    item.ReferenceTypeId = ua.NodeId(reftype)
+    item.TypeDefinition = ua.NodeId(typedef)
+    attrs.DisplayName = ua.LocalizedText(name)
+    item.NodeAttributes = attrs
+    return item
+
+
+def make_model(idx, nb_variables):
+    items = []
+    refs = []
+    folder = None
+    for i in range(nb_variables):
+        if i % VARIABLES_PER_FOLDER == 0:
+            folder = ua.NodeId("Folder{0}".format(i), idx)
+            items.append(make_item(folder, ua.NodeId(ua.ObjectIds.ObjectsFolder), "Folder{0}".format(i),
+                                   ua.NodeClass.Object, ua.ObjectIds.Organizes, ua.ObjectIds.FolderType,
+                                   ua.ObjectAttributes()))
+        attrs = ua.VariableAttributes()
+        attrs.Value = ua.Variant(float(i), ua.VariantType.Double)
+        attrs.DataType = ua.NodeId(ua.ObjectIds.Double)
+        nodeid = ua.NodeId("Var{0}".format(i), idx)
+        items.append(make_item(nodeid, folder, "Var{0}".format(i), ua.NodeClass.Variable,
+                               ua.ObjectIds.HasComponent, ua.ObjectIds.BaseDataVariableType, attrs))
+        ref = ua.AddReferencesItem()
+        ref.SourceNodeId = nodeid
+        ref.TargetNodeId = folder
+        ref.ReferenceTypeId = ua.NodeId(ua.ObjectIds.Organizes)
+        ref.IsForward = True
+        refs.append(ref)
+    return items, refs
+
+
+def run(nb_variables):
+    server = Server()
+    service = server.iserver.node_mgt_service
+
+    items, refs = make_model(2, nb_variables)
+    start = time.time()
+    for result in service.add_nodes(items):
+        result.StatusCode.check()
+    for result in service.add_references(refs):
+        result.check()
+    duration = time.time() - start
+    print("add_nodes:      {0:.2f} s, {1:.0f} nodes/s".format(duration, len(items) / duration))
+
+    items, refs = make_model(3, nb_variables)
+    start = time.time()
+    results, ref_results = service.bulk_add_nodes(items, refs)
+    for result in results:
+        result.StatusCode.check()
+    for result in ref_results:
+        result.check()
+    duration = time.time() - start
+    print("bulk_add_nodes: {0:.2f} s, {1:.0f} nodes/s".format(duration, len(items) / duration))
+
+
+if __name__ == "__main__":
+    nb_variables = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    run(nb_variables)
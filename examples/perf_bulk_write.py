@@ -0,0 +1,59 @@
+"""
+Benchmark of server side value updates, as done by a thread ingesting PLC tags:
+Node.set_value for each tag against one Server.set_values call per cycle.
+All the variables are monitored by a subscription, so datachange notifications
+are queued too.
+
+usage: python perf_bulk_write.py [nb_variables] [nb_cycles]
+"""
+import sys
+sys.path.insert(0, "..")
+import time
+
+from opcua import Server
+
+
+class SubHandler(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def datachange_notification(self, node, val, data):
+        self.count += 1
+
+
+def run(nb_variables, nb_cycles):
+    server = Server()
+    server.set_endpoint("opc.tcp://127.0.0.1:48490")
+    server.start()
+    try:
+        folder = server.nodes.objects.add_folder(2, "Tags")
+        nodes = [folder.add_variable(2, "Tag{0}".format(i), 0.0) for i in range(nb_variables)]
+        handler = SubHandler()
+        sub = server.create_subscription(100, handler)
+        sub.subscribe_data_change(nodes)
+
+        value = 0.0
+        start = time.time()
+        for _ in range(nb_cycles):
+            value += 1
+            for node in nodes:
+                node.set_value(value)
+        duration = time.time() - start
+        print("set_value:  {0:.0f} values/s".format(nb_variables * nb_cycles / duration))
+
+        start = time.time()
+        for _ in range(nb_cycles):
+            value += 1
+            server.set_values(nodes, [value] * nb_variables)
+        duration = time.time() - start
+        print("set_values: {0:.0f} values/s".format(nb_variables * nb_cycles / duration))
+        sub.delete()
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    nb_variables = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    nb_cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    run(nb_variables, nb_cycles)
@@ -0,0 +1,65 @@
+"""
+Benchmark of the core ua types: memory used per node and
+construction and decoding throughput.
+Run it on two versions of the library to compare them.
+"""
+import sys
+sys.path.insert(0, "..")
+import time
+import gc
+import tracemalloc
+from datetime import datetime
+
+from opcua import ua
+from opcua.ua.ua_binary import struct_to_binary, struct_from_binary
+from opcua.common.utils import Buffer
+
+
+NB_NODES = 100000
+
+
+def make_node(i):
+    """
+    the values kept in memory by the server for a typical variable node
+    """
+    nodeid = ua.NodeId(i, 2)
+    browsename = ua.QualifiedName("Variable{0}".format(i), 2)
+    displayname = ua.LocalizedText("Variable{0}".format(i))
+    dv = ua.DataValue(ua.Variant(float(i), ua.VariantType.Double))
+    dv.SourceTimestamp = dv.ServerTimestamp = datetime.utcnow()
+    return nodeid, browsename, displayname, dv
+
+
+def bench_memory():
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    nodes = [make_node(i) for i in range(NB_NODES)]
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("memory: {0:.0f} bytes per node".format((end - start) / len(nodes)))
+
+
+def bench_construct():
+    start = time.time()
+    for i in range(NB_NODES):
+        make_node(i)
+    duration = time.time() - start
+    print("construct: {0:.0f} nodes/s".format(NB_NODES / duration))
+
+
+def bench_decode():
+    resp = ua.ReadResponse()
+    resp.Results = [make_node(i)[3] for i in range(1000)]
+    data = struct_to_binary(resp)
+    start = time.time()
+    for _ in range(NB_NODES // 1000):
+        struct_from_binary(ua.ReadResponse, Buffer(data))
+    duration = time.time() - start
+    print("decode: {0:.0f} DataValues/s".format(NB_NODES / duration))
+
+
+if __name__ == "__main__":
+    bench_memory()
+    bench_construct()
+    bench_decode()
@@ -0,0 +1,62 @@
+"""
+Startup benchmark of the server: time to construct a Server in a fresh
+interpreter when the standard address space is built from code (cold),
+loaded from a shelve cache file and loaded from a binary snapshot (warm).
+The first start with a cache file also creates it.
+
+usage: python perf_server_startup.py [nb_runs]
+"""
+import sys
+sys.path.insert(0, "..")
+import os
+import shutil
+import subprocess
+import tempfile
+
+
+STARTUP = """
+import sys, time
+sys.path.insert(0, {path!r})
+start = time.time()
+from opcua import ua, Server
+from opcua.server.standard_address_space import standard_address_space
+standard_address_space.SNAPSHOT_PATH = ""  # ignore a bundled snapshot
+server = Server(shelffile={shelffile!r}, snapshotfile={snapshotfile!r})
+created = time.time()
+# reading a node after startup, the snapshot decodes it now
+server.get_node(ua.NodeId(ua.ObjectIds.Server_ServerStatus)).get_browse_name()
+print(created - start, time.time() - start)
+"""
+
+
+def startup(shelffile=None, snapshotfile=None):
+    code = STARTUP.format(path=os.path.abspath(".."), shelffile=shelffile, snapshotfile=snapshotfile)
+    out = subprocess.check_output([sys.executable, "-c", code])
+    return [float(v) for v in out.split()[-2:]]
+
+
+def bench(name, nb_runs, **kwargs):
+    times = [startup(**kwargs) for _ in range(nb_runs)]
+    created = min(t[0] for t in times)
+    first_read = min(t[1] for t in times)
+    print("{0:<30} {1:8.3f} s {2:8.3f} s".format(name, created, first_read))
+
+
+def run(nb_runs):
+    tmpdir = tempfile.mkdtemp()
+    shelffile = os.path.join(tmpdir, "aspace_shelf")
+    snapshotfile = os.path.join(tmpdir, "aspace.snapshot")
+    try:
+        print("{0:<30} {1:>10} {2:>10}".format("", "Server()", "first read"))
+        bench("cold, from code", nb_runs)
+        bench("first start, creating shelf", 1, shelffile=shelffile)
+        bench("warm, from shelf", nb_runs, shelffile=shelffile)
+        bench("first start, creating snapshot", 1, snapshotfile=snapshotfile)
+        bench("warm, from snapshot", nb_runs, snapshotfile=snapshotfile)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    nb_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    run(nb_runs)
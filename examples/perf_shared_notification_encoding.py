@@ -0,0 +1,74 @@
+"""
+Benchmark of the encoding of publish responses when many subscriptions monitor the same tags,
+like HMI sessions showing the same screens: every subscription monitors all the tags,
+all the tags change once, then the publish response of each subscription is encoded.
+The values of a change are encoded once and shared by the notifications of all subscriptions,
+this is compared to encoding them for each subscription.
+
+usage: python perf_shared_notification_encoding.py [nb_subscriptions] [nb_tags]
+"""
+import sys
+sys.path.insert(0, "..")
+import time
+
+from opcua import ua, Server
+from opcua.ua import ua_binary
+from opcua.ua.ua_binary import CachedDataValue, struct_to_binary
+
+
+def make_items(nodes):
+    params = ua.CreateMonitoredItemsParameters()
+    for handle, node in enumerate(nodes):
+        item = ua.MonitoredItemCreateRequest()
+        item.ItemToMonitor.NodeId = node.nodeid
+        item.ItemToMonitor.AttributeId = ua.AttributeIds.Value
+        item.MonitoringMode = ua.MonitoringMode.Reporting
+        item.RequestedParameters.ClientHandle = handle
+        item.RequestedParameters.SamplingInterval = 100
+        params.ItemsToCreate.append(item)
+    return params
+
+
+def encode_all(subs):
+    start = time.time()
+    size = 0
+    for sub in subs:
+        response = ua.PublishResponse()
+        response.Parameters = sub._pop_publish_result()
+        size += len(struct_to_binary(response))
+    return time.time() - start, size
+
+
+def run(nb_subscriptions, nb_tags):
+    server = Server()
+    folder = server.nodes.objects.add_folder(2, "Tags")
+    nodes = [folder.add_variable(2, "Tag{0}".format(i), 0.0) for i in range(nb_tags)]
+    service = server.iserver.subscription_service
+    params = ua.CreateSubscriptionParameters()
+    params.RequestedPublishingInterval = 1000
+    params.RequestedLifetimeCount = 1000
+    params.RequestedMaxKeepAliveCount = 100
+    items = make_items(nodes)
+    subs = []
+    for _ in range(nb_subscriptions):
+        result = service.create_subscription(params, lambda result: None)
+        sub = service.subscriptions[result.SubscriptionId]
+        sub.monitored_item_srv.create_monitored_items(items)
+        sub._pop_publish_result()  # initial values
+        subs.append(sub)
+
+    value = 0.0
+    for name in ("shared encoding", "encoding per subscription"):
+        if name != "shared encoding":
+            ua_binary._struct_writers[CachedDataValue] = ua_binary._get_struct_writer(ua.DataValue)
+        value += 1
+        server.set_values(nodes, [value] * nb_tags)
+        duration, size = encode_all(subs)
+        print("{0:26s}: {1:.2f} s, {2:.0f} notifications/s, {3:.1f} MB".format(
+            name, duration, nb_subscriptions * nb_tags / duration, size / 1e6))
+
+
+if __name__ == "__main__":
+    nb_subscriptions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    nb_tags = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    run(nb_subscriptions, nb_tags)
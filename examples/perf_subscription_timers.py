@@ -0,0 +1,95 @@
+"""
+Benchmark of the server loop overhead of many subscriptions without notifications:
+the publish cycles driven by the timer wheel of the subscription service against
+one loop timer per subscription, rescheduled through ThreadLoop.call_later as before.
+For each number of subscriptions it prints the publish cycles run per second,
+the CPU used by the process and the worst delay of a callback posted to the loop.
+
+usage: python perf_subscription_timers.py [publishing_interval_ms] [duration_s]
+"""
+import sys
+sys.path.insert(0, "..")
+import functools
+import time
+
+from opcua import ua
+from opcua.common.utils import ThreadLoop
+from opcua.server.subscription_service import SubscriptionService
+
+
+NB_SUBSCRIPTIONS = (1000, 10000, 50000)
+
+
+def make_params(interval):
+    params = ua.CreateSubscriptionParameters()
+    params.RequestedPublishingInterval = interval
+    params.RequestedLifetimeCount = 10 ** 9
+    params.RequestedMaxKeepAliveCount = 10 ** 9
+    return params
+
+
+def call_later_cycle(loop, sub):
+    # the scheduling of a subscription before the timer wheel
+    if sub._stopev:
+        return
+    sub.publish_results()
+    loop.call_later(sub.data.RevisedPublishingInterval / 1000.0, functools.partial(call_later_cycle, loop, sub))
+
+
+def measure(loop, service, duration):
+    cycles = sum(sub._keep_alive_count for sub in service.subscriptions.values())
+    worst = 0.0
+    start = time.time()
+    cpu = time.process_time()
+    while time.time() - start < duration:
+        posted = time.time()
+        delays = []
+        loop.call_soon(lambda: delays.append(time.time() - posted))
+        while not delays:
+            time.sleep(0.001)
+        worst = max(worst, delays[0])
+        time.sleep(0.01)
+    cpu = time.process_time() - cpu
+    wall = time.time() - start
+    cycles = sum(sub._keep_alive_count for sub in service.subscriptions.values()) - cycles
+    return cycles / wall, 100 * cpu / wall, worst * 1000
+
+
+def run_one(nb_subscriptions, interval, duration, wheel):
+    loop = ThreadLoop()
+    loop.start()
+    service = SubscriptionService(None)
+    if wheel:
+        service.set_loop(loop)
+    else:
+        # subscriptions are scheduled by the benchmark, the timer wheel has no loop
+        service.loop = loop
+    params = make_params(interval)
+    for _ in range(nb_subscriptions):
+        result = service.create_subscription(params, lambda result: None)
+        if not wheel:
+            sub = service.subscriptions[result.SubscriptionId]
+            loop.call_later(interval / 1000.0, functools.partial(call_later_cycle, loop, sub))
+    time.sleep(2 * interval / 1000.0)  # let the first cycles run
+    try:
+        return measure(loop, service, duration)
+    finally:
+        service.delete_subscriptions(list(service.subscriptions.keys()))
+        service.set_loop(None)
+        loop.stop()
+        loop.join()
+        loop.close()
+
+
+def run(interval, duration):
+    for nb_subscriptions in NB_SUBSCRIPTIONS:
+        for name, wheel in (("call_later", False), ("timer wheel", True)):
+            rate, cpu, lag = run_one(nb_subscriptions, interval, duration, wheel)
+            print("{0:6d} subscriptions, {1:11s}: {2:8.0f} cycles/s, cpu {3:5.1f} %, "
+                  "worst loop delay {4:6.1f} ms".format(nb_subscriptions, name, rate, cpu, lag))
+
+
+if __name__ == "__main__":
+    interval = float(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    run(interval, duration)
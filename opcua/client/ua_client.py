@@ -10,7 +10,7 @@ from concurrent.futures import Future, CancelledError
 from functools import partial
 
 from opcua import ua
-from opcua.ua.ua_binary import struct_from_binary, uatcp_to_binary, struct_to_binary, nodeid_from_binary
+from opcua.ua.ua_binary import struct_from_binary, uatcp_to_binary, write_struct, nodeid_from_binary
 from opcua.ua.uaerrors import UaError, BadTimeout, BadNoSubscription, BadSessionClosed
 from opcua.common.connection import SecureConnection
 
@@ -52,7 +52,8 @@ class UASocketClient(object):
             request.RequestHeader = self._create_request_header(timeout)
             self.logger.debug("Sending: %s", request)
             try:
-                binreq = struct_to_binary(request)
+                binreq = bytearray()
+                write_struct(binreq, request)
             except Exception:
                 # reset reqeust handle if any error
                 # see self._create_request_header
@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 import logging
 import copy
 
-from opcua.ua.ua_binary import struct_from_binary, struct_to_binary, header_from_binary, header_to_binary
+from opcua.ua.ua_binary import struct_from_binary, struct_to_binary, write_struct, header_from_binary, header_to_binary
 from opcua import ua
 
 logger = logging.getLogger('opcua.uaprotocol')
@@ -46,8 +46,12 @@ class MessageChunk(ua.FrozenClass):
         obj = MessageChunk(crypto)
         obj.MessageHeader = header
         obj.SecurityHeader = security_header
-        decrypted = crypto.decrypt(data.read(len(data)))
+        encrypted = data.read(len(data))
         signature_size = crypto.vsignature_size()
+        if signature_size > 0:
+            # security is enabled, the cryptography backends expect bytes
+            encrypted = ua.utils.to_bytes(encrypted)
+        decrypted = crypto.decrypt(encrypted)
         if signature_size > 0:
             signature = decrypted[-signature_size:]
             decrypted = decrypted[:-signature_size]
@@ -66,13 +70,33 @@ class MessageChunk(ua.FrozenClass):
         return size // pbs * self.security_policy.encrypted_block_size()
 
     def to_binary(self):
-        security = struct_to_binary(self.SecurityHeader)
-        encrypted_part = struct_to_binary(self.SequenceHeader) + self.Body
-        encrypted_part += self.security_policy.padding(len(encrypted_part))
-        self.MessageHeader.body_size = len(security) + self.encrypted_size(len(encrypted_part))
-        header = header_to_binary(self.MessageHeader)
-        encrypted_part += self.security_policy.signature(header + security + encrypted_part)
-        return header + security + self.security_policy.encrypt(encrypted_part)
+        buf = bytearray()
+        self.write(buf)
+        return bytes(buf)
+
+    def write(self, buf):
+        """
+        Append the binary chunk to the bytearray buf.
+        The header is patched once the encrypted size is known and the
+        signature is computed on a view of buf instead of a concatenated copy.
+        """
+        start = len(buf)
+        buf += header_to_binary(self.MessageHeader)
+        header_end = len(buf)
+        write_struct(buf, self.SecurityHeader)
+        plain_start = len(buf)
+        write_struct(buf, self.SequenceHeader)
+        buf += self.Body
+        buf += self.security_policy.padding(len(buf) - plain_start)
+        self.MessageHeader.body_size = plain_start - header_end + self.encrypted_size(len(buf) - plain_start)
+        buf[start:header_end] = header_to_binary(self.MessageHeader)
+        if self.security_policy.signature_size() > 0:
+            view = memoryview(buf)
+            signature = self.security_policy.signature(view[start:])
+            view.release()
+            buf += signature
+            # the cryptography backends expect bytes for encryption
+            buf[plain_start:] = self.security_policy.encrypt(bytes(buf[plain_start:]))
 
     @staticmethod
     def max_body_size(crypto, max_chunk_size):
@@ -104,6 +128,8 @@ class MessageChunk(ua.FrozenClass):
         crypto = security_policy.symmetric_cryptography
         max_size = MessageChunk.max_body_size(crypto, max_chunk_size)
 
+        # chunk bodies are views on the message body, they are copied once into the output buffer
+        body = ua.utils.buffer_view(body)
         chunks = []
         for i in range(0, len(body), max_size):
             part = body[i:i + max_size]
@@ -241,7 +267,10 @@ class SecureConnection(object):
                 logger.debug("Wrapping sequence number: %d -> 1", self._sequence_number)
                 self._sequence_number = 1
             chunk.SequenceHeader.SequenceNumber = self._sequence_number
-        return b"".join([chunk.to_binary() for chunk in chunks])
+        buf = bytearray()
+        for chunk in chunks:
+            chunk.write(buf)
+        return buf
 
     def _check_sym_header(self, securityHeader):
         """
@@ -335,7 +364,7 @@ class SecureConnection(object):
         body = socket.read(header.body_size)
         if len(body) != header.body_size:
             raise ua.UaError("{0} bytes expected, {1} available".format(header.body_size, len(body)))
-        return self.receive_from_header_and_body(header, ua.utils.Buffer(body))
+        return self.receive_from_header_and_body(header, ua.utils.Buffer(ua.utils.buffer_view(body)))
 
     def _receive(self, msg):
         self._check_incoming_chunk(msg)
@@ -44,7 +44,8 @@ class Node(object):
         if isinstance(nodeid, Node):
             self.nodeid = nodeid.nodeid
         elif isinstance(nodeid, ua.NodeId):
-            self.nodeid = nodeid
+            # nodeid may be changed by the user, the shared nodeids of the address space cannot
+            self.nodeid = ua.mutable_nodeid(nodeid)
         elif type(nodeid) in (str, bytes):
             self.nodeid = ua.NodeId.from_string(nodeid)
         elif isinstance(nodeid, int):
@@ -207,11 +208,9 @@ class Node(object):
         if isinstance(value, ua.DataValue):
             datavalue = value
         elif isinstance(value, ua.Variant):
-            datavalue = ua.DataValue(value)
-            datavalue.SourceTimestamp = datetime.utcnow()
+            datavalue = ua.DataValue.from_trusted(value, source_timestamp=datetime.utcnow())
         else:
-            datavalue = ua.DataValue(ua.Variant(value, varianttype))
-            datavalue.SourceTimestamp = datetime.utcnow()
+            datavalue = ua.DataValue.from_trusted(ua.Variant(value, varianttype), source_timestamp=datetime.utcnow())
         self.set_attribute(ua.AttributeIds.Value, datavalue)
 
     set_data_value = set_value
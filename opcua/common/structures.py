@@ -15,7 +15,7 @@ from enum import Enum, IntEnum, EnumMeta
 
 from lxml import objectify
 
-from opcua.ua.ua_binary import Primitives
+from opcua.ua.ua_binary import Primitives, register_uatype_class
 from opcua import ua
 
 
@@ -289,6 +289,7 @@ def load_type_definitions(server, nodes=None):
         for key, val in structs_dict.items():
             if isinstance(val, EnumMeta) and key is not "IntEnum":
                 setattr(ua, key, val)
+                register_uatype_class(key, val)
 
     return generators, structs_dict
 
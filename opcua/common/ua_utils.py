@@ -19,11 +19,9 @@ def value_to_datavalue(val, varianttype=None):
     if isinstance(val, ua.DataValue):
         datavalue = val
     elif isinstance(val, ua.Variant):
-        datavalue = ua.DataValue(val)
-        datavalue.SourceTimestamp = datetime.utcnow()
+        datavalue = ua.DataValue.from_trusted(val, source_timestamp=datetime.utcnow())
     else:
-        datavalue = ua.DataValue(ua.Variant(val, varianttype))
-        datavalue.SourceTimestamp = datetime.utcnow()
+        datavalue = ua.DataValue.from_trusted(ua.Variant(val, varianttype), source_timestamp=datetime.utcnow())
     return datavalue
 
 
@@ -5,9 +5,11 @@ Helper function and classes depending on ua object are in ua_utils.py
 
 import logging
 import os
+import sys
 from concurrent.futures import Future
 import functools
 import threading
+import time
 from socket import error as SocketError
 
 try:
@@ -15,6 +17,15 @@ try:
 except ImportError:
     import trollius as asyncio
 
+try:
+    from threading import get_ident
+except ImportError:
+    from thread import get_ident
+
+try:
+    monotonic = time.monotonic
+except AttributeError:  # support for python2
+    monotonic = time.time
 
 from opcua.ua.uaerrors import UaError
 
@@ -33,11 +44,34 @@ class SocketClosedException(UaError):
     pass
 
 
+if sys.version_info.major > 2:
+    # received data is decoded from views on it, read() of a Buffer returns views
+    buffer_view = memoryview
+    to_bytes = bytes
+else:
+    # bytes() of a python2 memoryview is its repr and views cannot be joined,
+    # received data is decoded from the bytes, as before
+    def buffer_view(data):
+        return data
+
+    def to_bytes(data):
+        """
+        copy of data returned by read() of a Buffer, which might be a view
+        """
+        if isinstance(data, memoryview):
+            return data.tobytes()
+        return bytes(data)
+
+
 class Buffer(object):
 
     """
     alternative to io.BytesIO making debug easier
     and added a few conveniance methods
+
+    If data is a memoryview, read() and copy() return views on the
+    underlying memory and nothing is copied until leaf values
+    (strings, ByteStrings) are materialized by the decoders
     """
 
     def __init__(self, data, start_pos=0, size=-1):
@@ -51,7 +85,7 @@ class Buffer(object):
     def __str__(self):
         return "Buffer(size:{0}, data:{1})".format(
             self._size,
-            self._data[self._cur_pos:self._cur_pos + self._size])
+            bytes(self._data[self._cur_pos:self._cur_pos + self._size]))
     __repr__ = __str__
 
     def __len__(self):
@@ -102,7 +136,7 @@ class SocketWrapper(object):
         """
         Receive up to size bytes from socket
         """
-        data = b''
+        chunks = []
         while size > 0:
             try:
                 chunk = self.socket.recv(size)
@@ -110,9 +144,9 @@ class SocketWrapper(object):
                 raise SocketClosedException("Server socket has closed", ex)
             if not chunk:
                 raise SocketClosedException("Server socket has closed")
-            data += chunk
+            chunks.append(chunk)
             size -= len(chunk)
-        return data
+        return b''.join(chunks)
 
     def write(self, data):
         self.socket.sendall(data)
@@ -122,6 +156,110 @@ def create_nonce(size=32):
     return os.urandom(size)
 
 
+class ReadWriteLock(object):
+    """
+    A lock held either by any number of readers or by one writer.
+    Use it as ``with lock.read:`` or ``with lock.write:``.
+    Both are reentrant and the writer may also take the read lock, but a reader
+    cannot take the write lock. Waiting writers go before new readers, but the readers
+    waiting when a writer releases the lock go before the next writer, so neither starves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._readers = {}  # thread id: depth
+        self._readers_waiting = set()
+        self._writer = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+        self.read = _ReadLock(self)
+        self.write = _WriteLock(self)
+
+    def acquire_read(self):
+        me = get_ident()
+        with self._lock:
+            if me in self._readers:
+                self._readers[me] += 1
+            elif self._writer == me:
+                self._writer_depth += 1
+            else:
+                self._readers_waiting.add(me)
+                try:
+                    # a writer releasing the lock adds the waiting readers to _readers
+                    while me not in self._readers and (self._writer is not None or self._writers_waiting):
+                        self._cond.wait()
+                finally:
+                    self._readers_waiting.discard(me)
+                if me not in self._readers:
+                    self._readers[me] = 1
+
+    def release_read(self):
+        me = get_ident()
+        with self._lock:
+            if self._writer == me:
+                self._writer_depth -= 1
+                return
+            depth = self._readers.pop(me) - 1
+            if depth:
+                self._readers[me] = depth
+            elif not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = get_ident()
+        with self._lock:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("Cannot take the write lock while holding the read lock")
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        with self._lock:
+            self._writer_depth -= 1
+            if not self._writer_depth:
+                self._writer = None
+                for reader in self._readers_waiting:
+                    self._readers[reader] = 1
+                self._readers_waiting.clear()
+                self._cond.notify_all()
+
+
+class _ReadLock(object):
+    __slots__ = ("_rwlock",)
+
+    def __init__(self, rwlock):
+        self._rwlock = rwlock
+
+    def __enter__(self):
+        self._rwlock.acquire_read()
+
+    def __exit__(self, *args):
+        self._rwlock.release_read()
+
+
+class _WriteLock(object):
+    __slots__ = ("_rwlock",)
+
+    def __init__(self, rwlock):
+        self._rwlock = rwlock
+
+    def __enter__(self):
+        self._rwlock.acquire_write()
+
+    def __exit__(self, *args):
+        self._rwlock.release_write()
+
+
 class ThreadLoop(threading.Thread):
     """
     run an asyncio loop in a thread
@@ -25,6 +25,8 @@ class XmlImporter(object):
         self.namespaces = {}
         self.aliases = {}
         self.refs = None
+        self._bulk_nodes = None  # nodes and references collected for bulk_add_nodes
+        self._bulk_refs = None
 
     def _map_namespaces(self, namespaces_uris):
         """
@@ -48,7 +50,11 @@ class XmlImporter(object):
 
     def import_xml(self, xmlpath=None, xmlstring=None):
         """
-        import xml and return added nodes
+        import xml and return added nodes.
+        In a local server the nodes are all added or none: if one of them cannot be added
+        the error is raised and the address space is not modified. Through a client the nodes
+        are added one by one and the ones added before an error stay in the address space.
+        References which cannot be added are logged and kept in self.refs
         """
         self.logger.info("Importing XML file %s", xmlpath)
         self.parser = xmlparser.XMLParser(xmlpath, xmlstring)
@@ -59,6 +65,8 @@ class XmlImporter(object):
 
         dnodes = self.parser.get_node_datas()
         dnodes = self.make_objects(dnodes)
+        if isinstance(self.server, opcua.server.server.Server):
+            return self._import_bulk(dnodes)
         nodes_parsed = self._sort_nodes_by_parentid(dnodes)
 
         nodes = []
@@ -77,6 +85,30 @@ class XmlImporter(object):
 
         return nodes
 
+    def _import_bulk(self, dnodes):
+        """
+        add all the nodes and references to the address space of a local server at once,
+        the nodes do not need to be sorted since they are validated as a set.
+        No node is added if one of them is rejected
+        """
+        self._bulk_nodes, self._bulk_refs = [], []
+        try:
+            for nodedata in dnodes:
+                self._add_node_data(nodedata)
+            items, refs = self._bulk_nodes, self._bulk_refs
+        finally:
+            self._bulk_nodes = self._bulk_refs = None
+        results, ref_results = self.server.iserver.node_mgt_service.bulk_add_nodes(items, refs, atomic=True)
+        for item, res in zip(items, results):
+            # the nodes abandoned because of the rejected one are not reported
+            if not res.StatusCode.is_good() and res.StatusCode.value != ua.StatusCodes.BadOperationAbandoned:
+                self.logger.warning("failure adding node %s", item)
+                res.StatusCode.check()
+        self.refs = [ref for ref, sc in zip(refs, ref_results) if not sc.is_good()]
+        if len(self.refs) != 0:
+            self.logger.warning("The following references could not be imported and are probaly broken: %s", self.refs)
+        return [res.AddedNodeId for res in results]
+
     def _add_node_data(self, nodedata):
         if nodedata.nodetype == 'UAObject':
             node = self.add_object(nodedata)
@@ -97,12 +129,21 @@ class XmlImporter(object):
         return node
 
     def _add_node(self, node):
+        if self._bulk_nodes is not None:
+            # added by _import_bulk
+            self._bulk_nodes.append(node)
+            result = ua.AddNodesResult()
+            result.AddedNodeId = node.RequestedNewNodeId
+            return [result]
         if isinstance(self.server, opcua.server.server.Server):
             return self.server.iserver.isession.add_nodes([node])
         else:
             return self.server.uaclient.add_nodes([node])
 
     def _add_references(self, refs):
+        if self._bulk_refs is not None:
+            self._bulk_refs.extend(refs)
+            return
         if isinstance(self.server, opcua.server.server.Server):
             res = self.server.iserver.isession.add_references(refs)
         else:
@@ -1,8 +1,11 @@
-from threading import RLock
 import logging
 from datetime import datetime
 import collections
+import itertools
+import mmap
 import shelve
+import struct
+import threading
 try:
     import cPickle as pickle
 except:
@@ -10,6 +13,42 @@ except:
 
 from opcua import ua
 from opcua.server.user_manager import UserManager
+from opcua.common.utils import ReadWriteLock, Buffer, buffer_view
+from opcua.ua.ua_binary import Primitives, nodeid_to_binary, nodeid_from_binary, write_struct, struct_from_binary
+from opcua.ua.ua_binary import CachedDataValue
+
+
+_NULL_NODEID = ua.NodeId()
+_HAS_SUBTYPE = ua.intern_nodeid(ua.NodeId(ua.ObjectIds.HasSubtype))
+_HAS_TYPE_DEFINITION = ua.intern_nodeid(ua.NodeId(ua.ObjectIds.HasTypeDefinition))
+_NUMERIC_NODEID_TYPES = (ua.NodeIdType.Numeric, ua.NodeIdType.TwoByte, ua.NodeIdType.FourByte)
+# (name, NodeAttributesMask, AttributeId, VariantType, python type) of the attributes of AddNodesItem.NodeAttributes,
+# values of the python type need no validation
+_NODE_ATTRIBUTES = tuple((name, getattr(ua.NodeAttributesMask, name), getattr(ua.AttributeIds, name), vtype, pytype)
+                         for name, vtype, pytype in (
+    ("AccessLevel", ua.VariantType.Byte, int),
+    ("ArrayDimensions", ua.VariantType.UInt32, list),
+    ("BrowseName", ua.VariantType.QualifiedName, ua.QualifiedName),
+    ("ContainsNoLoops", ua.VariantType.Boolean, bool),
+    ("DataType", ua.VariantType.NodeId, ua.NodeId),
+    ("Description", ua.VariantType.LocalizedText, ua.LocalizedText),
+    ("DisplayName", ua.VariantType.LocalizedText, ua.LocalizedText),
+    ("EventNotifier", ua.VariantType.Byte, int),
+    ("Executable", ua.VariantType.Boolean, bool),
+    ("Historizing", ua.VariantType.Boolean, bool),
+    ("InverseName", ua.VariantType.LocalizedText, ua.LocalizedText),
+    ("IsAbstract", ua.VariantType.Boolean, bool),
+    ("MinimumSamplingInterval", ua.VariantType.Double, float),
+    ("NodeClass", ua.VariantType.Int32, int),
+    ("NodeId", ua.VariantType.NodeId, ua.NodeId),
+    ("Symmetric", ua.VariantType.Boolean, bool),
+    ("UserAccessLevel", ua.VariantType.Byte, int),
+    ("UserExecutable", ua.VariantType.Boolean, bool),
+    ("UserWriteMask", ua.VariantType.UInt32, int),
+    ("ValueRank", ua.VariantType.Int32, int),
+    ("WriteMask", ua.VariantType.UInt32, int),
+    ("Value", None, None),
+))
 
 
 class AttributeValue(object):
@@ -30,8 +69,58 @@ class NodeData(object):
         self.nodeid = nodeid
         self.attributes = {}
         self.references = []
+        # references by (ReferenceTypeId, IsForward) then by target nodeid, in insertion order
+        self.reference_index = {}
+        # first reference added by (ReferenceTypeId, IsForward) then by target BrowseName
+        self.browse_name_index = {}
         self.call = None
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "browse_name_index" not in state:
+            # node dumped before references were indexed
+            self.reference_index = {}
+            self.browse_name_index = {}
+            for ref in self.references:
+                self._index_reference(ref)
+
+    def _index_reference(self, ref):
+        key = (ref.ReferenceTypeId, ref.IsForward)
+        self.reference_index.setdefault(key, {})[ref.NodeId] = ref
+        self.browse_name_index.setdefault(key, {}).setdefault(ref.BrowseName, ref)
+
+    def add_reference(self, ref):
+        self.references.append(ref)
+        self._index_reference(ref)
+
+    def remove_reference(self, ref):
+        self.references.remove(ref)
+        key = (ref.ReferenceTypeId, ref.IsForward)
+        bucket = self.reference_index.get(key)
+        if bucket is None or bucket.get(ref.NodeId) is not ref:
+            return
+        del bucket[ref.NodeId]
+        names = self.browse_name_index[key]
+        if names.get(ref.BrowseName) is ref:
+            del names[ref.BrowseName]
+            # another reference may have the same browse name
+            for other in bucket.values():
+                if other.BrowseName == ref.BrowseName:
+                    names[ref.BrowseName] = other
+                    break
+        if not bucket:
+            del self.reference_index[key]
+            del self.browse_name_index[key]
+
+    def find_reference(self, reftype, isforward, target):
+        """
+        return the reference of type reftype in direction isforward to target or None
+        """
+        bucket = self.reference_index.get((reftype, isforward))
+        if bucket is None:
+            return None
+        return bucket.get(target)
+
     def __str__(self):
         return "NodeData(id:{0}, attrs:{1}, refs:{2})".format(self.nodeid, self.attributes, self.references)
     __repr__ = __str__
@@ -52,18 +141,24 @@ class AttributeService(object):
 
     def write(self, params, user=UserManager.User.Admin):
         self.logger.debug("write %s as user %s", params, user)
-        res = []
-        for writevalue in params.NodesToWrite:
+        res = [None] * len(params.NodesToWrite)
+        writes = []
+        indexes = []
+        for idx, writevalue in enumerate(params.NodesToWrite):
             if user != UserManager.User.Admin:
                 if writevalue.AttributeId != ua.AttributeIds.Value:
-                    res.append(ua.StatusCode(ua.StatusCodes.BadUserAccessDenied))
+                    res[idx] = ua.StatusCode(ua.StatusCodes.BadUserAccessDenied)
                     continue
                 al = self._aspace.get_attribute_value(writevalue.NodeId, ua.AttributeIds.AccessLevel)
                 ual = self._aspace.get_attribute_value(writevalue.NodeId, ua.AttributeIds.UserAccessLevel)
                 if not ua.ua_binary.test_bit(al.Value.Value, ua.AccessLevel.CurrentWrite) or not ua.ua_binary.test_bit(ual.Value.Value, ua.AccessLevel.CurrentWrite):
-                    res.append(ua.StatusCode(ua.StatusCodes.BadUserAccessDenied))
+                    res[idx] = ua.StatusCode(ua.StatusCodes.BadUserAccessDenied)
                     continue
-            res.append(self._aspace.set_attribute_value(writevalue.NodeId, writevalue.AttributeId, writevalue.Value))
+            writes.append((writevalue.NodeId, writevalue.AttributeId, writevalue.Value))
+            indexes.append(idx)
+        # all the allowed values are set at once
+        for idx, status in zip(indexes, self._aspace.set_attribute_values(writes)):
+            res[idx] = status
         return res
 
 
@@ -82,33 +177,42 @@ class ViewService(object):
 
     def _browse(self, desc):
         res = ua.BrowseResult()
-        if desc.NodeId not in self._aspace:
+        node = self._aspace.get(desc.NodeId)
+        if node is None:
             res.StatusCode = ua.StatusCode(ua.StatusCodes.BadNodeIdInvalid)
             return res
-        node = self._aspace[desc.NodeId]
-        for ref in node.references:
-            if not self._is_suitable_ref(desc, ref):
-                continue
-            res.References.append(ref)
+        # reference type and direction are checked once per bucket of the index, not per reference.
+        # list() copies are atomic, the node may be modified by other threads
+        buckets = list(node.reference_index.items())
+        keys = [key for key, bucket in buckets
+                if self._is_suitable_bucket(key, desc.BrowseDirection, desc.ReferenceTypeId, desc.IncludeSubtypes)]
+        if len(keys) == len(buckets):
+            refs = list(node.references)
+        elif len(keys) == 1:
+            refs = list(node.reference_index.get(keys[0], {}).values())
+        else:
+            # keep the order in which references were added
+            keys = set(keys)
+            refs = [ref for ref in list(node.references) if (ref.ReferenceTypeId, ref.IsForward) in keys]
+        if desc.NodeClassMask:
+            refs = [ref for ref in refs if desc.NodeClassMask & ref.NodeClass]
+        res.References = refs
         return res
 
-    def _is_suitable_ref(self, desc, ref):
-        if not self._suitable_direction(desc.BrowseDirection, ref.IsForward):
-            self.logger.debug("%s is not suitable due to direction", ref)
-            return False
-        if not self._suitable_reftype(desc.ReferenceTypeId, ref.ReferenceTypeId, desc.IncludeSubtypes):
-            self.logger.debug("%s is not suitable due to type", ref)
+    def _is_suitable_bucket(self, key, direction, reftypeid, subtypes):
+        reftype, isforward = key
+        if not self._suitable_direction(direction, isforward):
+            self.logger.debug("%s references are not suitable due to direction", reftype)
             return False
-        if desc.NodeClassMask and ((desc.NodeClassMask & ref.NodeClass) == 0):
-            self.logger.debug("%s is not suitable due to class", ref)
+        if not self._suitable_reftype(reftypeid, reftype, subtypes):
+            self.logger.debug("%s references are not suitable due to type", reftype)
             return False
-        self.logger.debug("%s is a suitable ref for desc %s", ref, desc)
         return True
 
     def _suitable_reftype(self, ref1, ref2, subtypes):
         """
         """
-        if ref1 == ua.NodeId(ua.ObjectIds.Null):
+        if ref1 == _NULL_NODEID:
             # If ReferenceTypeId is not specified in the BrowseDescription,
             # all References are returned and includeSubtypes is ignored.
             return True
@@ -116,20 +220,7 @@ class ViewService(object):
             return False
         if ref1.Identifier == ref2.Identifier:
             return True
-        oktypes = self._get_sub_ref(ref1)
-        if not subtypes and ua.NodeId(ua.ObjectIds.HasSubtype) in oktypes:
-            oktypes.remove(ua.NodeId(ua.ObjectIds.HasSubtype))
-        return ref2 in oktypes
-
-    def _get_sub_ref(self, ref):
-        res = []
-        nodedata = self._aspace[ref]
-        if nodedata is not None:
-            for ref in nodedata.references:
-                if ref.ReferenceTypeId.Identifier == ua.ObjectIds.HasSubtype and ref.IsForward:
-                    res.append(ref.NodeId)
-                    res += self._get_sub_ref(ref.NodeId)
-        return res
+        return ref2 in self._aspace.get_reference_subtypes(ref1)
 
     def _suitable_direction(self, direction, isforward):
         if direction == ua.BrowseDirection.Both:
@@ -168,9 +259,10 @@ class ViewService(object):
 
     def _find_element_in_node(self, el, nodeid):
         nodedata = self._aspace[nodeid]
-        for ref in nodedata.references:
-            # FIXME: here we should check other arguments!!
-            if ref.BrowseName == el.TargetName:
+        direction = ua.BrowseDirection.Inverse if el.IsInverse else ua.BrowseDirection.Forward
+        for key, names in list(nodedata.browse_name_index.items()):
+            ref = names.get(el.TargetName)
+            if ref is not None and self._is_suitable_bucket(key, direction, el.ReferenceTypeId, el.IncludeSubtypes):
                 return ref.NodeId
         self.logger.info("element %s was not found in node %s", el, nodeid)
         return None
@@ -194,6 +286,117 @@ class NodeManagementService(object):
             if not ret.StatusCode.is_good():
                 yield item
 
+    def bulk_add_nodes(self, addnodeitems, addrefs=None, user=UserManager.User.Admin, check=True, atomic=False):
+        """
+        Add many nodes and references at once, typically to load a large model.
+        The items are validated as a set: parents and the source and target of addrefs,
+        a list of AddReferencesItem, may be nodes of the same call in any order.
+        All the nodes are built first and inserted taking the lock of each namespace once,
+        then the references are added.
+        If atomic, the nodes are all added or none: when one is rejected the address space
+        is not modified and the other nodes and the references get BadOperationAbandoned.
+        References which cannot be added do not prevent the nodes from being added.
+        Return the list of AddNodesResult and the list of StatusCode of addrefs
+        """
+        addrefs = addrefs or []
+        results = [ua.AddNodesResult() for _ in addnodeitems]
+        if user != UserManager.User.Admin:
+            for result in results:
+                result.StatusCode = ua.StatusCode(ua.StatusCodes.BadUserAccessDenied)
+            return results, [ua.StatusCode(ua.StatusCodes.BadUserAccessDenied) for _ in addrefs]
+
+        # nodeids, requested ones first so generated ones do not take them
+        items = {}  # nodeid: (item, result)
+        for item, result in zip(addnodeitems, results):
+            nodeid = item.RequestedNewNodeId
+            if nodeid.has_null_identifier():
+                continue
+            if nodeid in items or nodeid in self._aspace:
+                self.logger.warning("AddNodesItem: Requested NodeId %s already exists", nodeid)
+                result.StatusCode = ua.StatusCode(ua.StatusCodes.BadNodeIdExists)
+                continue
+            items[nodeid] = (item, result)
+        for item, result in zip(addnodeitems, results):
+            if item.RequestedNewNodeId.has_null_identifier():
+                nodeid = self._aspace.generate_nodeid(item.RequestedNewNodeId.NamespaceIndex)
+                while nodeid in items:
+                    nodeid = self._aspace.generate_nodeid(nodeid.NamespaceIndex)
+                item.RequestedNewNodeId = nodeid
+                items[nodeid] = (item, result)
+
+        # parents, until the nodes whose parent is rejected are rejected too
+        rejected = True
+        while rejected:
+            rejected = []
+            for nodeid, (item, result) in items.items():
+                if item.ParentNodeId.is_null():
+                    if check:
+                        rejected.append(nodeid)
+                elif item.ParentNodeId not in items and item.ParentNodeId not in self._aspace:
+                    self.logger.info("add_node: while adding node %s, requested parent node %s does not exists",
+                                     nodeid, item.ParentNodeId)
+                    rejected.append(nodeid)
+            for nodeid in rejected:
+                items.pop(nodeid)[1].StatusCode = ua.StatusCode(ua.StatusCodes.BadParentNodeIdInvalid)
+        if atomic and len(items) != len(addnodeitems):
+            return self._abandon_bulk_add(results, addrefs)
+
+        nodes = []
+        for nodeid, (item, result) in items.items():
+            nodedata = NodeData(ua.intern_nodeid(nodeid))
+            self._add_node_attributes(nodedata, item, add_timestamps=check)
+            nodes.append(nodedata)
+        added = {}
+        for nodedata, ok in zip(nodes, self._aspace.add_nodes(nodes)):
+            item, result = items[nodedata.nodeid]
+            if ok:
+                added[nodedata.nodeid] = nodedata
+            else:
+                result.StatusCode = ua.StatusCode(ua.StatusCodes.BadNodeIdExists)
+        if atomic and len(added) != len(nodes):
+            # a node was added by someone else since the validation,
+            # the nodes of this call have no references yet
+            for nodeid in added:
+                del self._aspace[nodeid]
+            return self._abandon_bulk_add(results, addrefs)
+
+        # references, all nodes exist now
+        def get_node(nodeid):
+            nodedata = added.get(nodeid)
+            if nodedata is None:
+                nodedata = self._aspace.get(nodeid)
+            return nodedata
+
+        for nodeid, nodedata in added.items():
+            item, result = items[nodeid]
+            if item.NodeClass == ua.NodeClass.ReferenceType:
+                self._aspace.clear_reference_subtypes()
+            if not item.ParentNodeId.is_null():
+                parentdata = get_node(item.ParentNodeId)
+                self._add_ref_from_parent(nodedata, item, parentdata)
+                self._add_ref_to_parent(nodedata, item, parentdata)
+            if item.TypeDefinition != _NULL_NODEID:
+                self._add_type_definition(nodedata, item, get_node(item.TypeDefinition))
+            result.AddedNodeId = nodedata.nodeid
+
+        ref_results = []
+        for addref in addrefs:
+            sourcedata = get_node(addref.SourceNodeId)
+            targetdata = get_node(addref.TargetNodeId)
+            if sourcedata is None:
+                ref_results.append(ua.StatusCode(ua.StatusCodes.BadSourceNodeIdInvalid))
+            elif targetdata is None:
+                ref_results.append(ua.StatusCode(ua.StatusCodes.BadTargetNodeIdInvalid))
+            else:
+                ref_results.append(self._add_reference_no_check(sourcedata, addref, targetdata))
+        return results, ref_results
+
+    def _abandon_bulk_add(self, results, addrefs):
+        for result in results:
+            if result.StatusCode.is_good():
+                result.StatusCode = ua.StatusCode(ua.StatusCodes.BadOperationAbandoned)
+        return results, [ua.StatusCode(ua.StatusCodes.BadOperationAbandoned) for _ in addrefs]
+
     def _add_node(self, item, user, check=True):
         self.logger.debug("Adding node %s %s", item.RequestedNewNodeId, item.BrowseName)
         result = ua.AddNodesResult()
@@ -228,19 +431,21 @@ class NodeManagementService(object):
             result.StatusCode = ua.StatusCode(ua.StatusCodes.BadParentNodeIdInvalid)
             return result
 
-        nodedata = NodeData(item.RequestedNewNodeId)
+        nodedata = NodeData(ua.intern_nodeid(item.RequestedNewNodeId))
 
         self._add_node_attributes(nodedata, item, add_timestamps=check)
 
         # now add our node to db
         self._aspace[nodedata.nodeid] = nodedata
+        if item.NodeClass == ua.NodeClass.ReferenceType:
+            self._aspace.clear_reference_subtypes()
 
         if parentdata is not None:
             self._add_ref_from_parent(nodedata, item, parentdata)
             self._add_ref_to_parent(nodedata, item, parentdata)
 
         # add type definition
-        if item.TypeDefinition != ua.NodeId():
+        if item.TypeDefinition != _NULL_NODEID:
             self._add_type_definition(nodedata, item)
 
         result.StatusCode = ua.StatusCode()
@@ -251,36 +456,42 @@ class NodeManagementService(object):
     def _add_node_attributes(self, nodedata, item, add_timestamps):
         # add common attrs
         nodedata.attributes[ua.AttributeIds.NodeId] = AttributeValue(
-            ua.DataValue(ua.Variant(nodedata.nodeid, ua.VariantType.NodeId))
+            ua.DataValue.from_trusted(ua.Variant.from_trusted(nodedata.nodeid, ua.VariantType.NodeId))
         )
         nodedata.attributes[ua.AttributeIds.BrowseName] = AttributeValue(
-            ua.DataValue(ua.Variant(item.BrowseName, ua.VariantType.QualifiedName))
+            ua.DataValue.from_trusted(ua.Variant.from_trusted(item.BrowseName, ua.VariantType.QualifiedName))
         )
         nodedata.attributes[ua.AttributeIds.NodeClass] = AttributeValue(
-            ua.DataValue(ua.Variant(item.NodeClass, ua.VariantType.Int32))
+            ua.DataValue.from_trusted(ua.Variant.from_trusted(item.NodeClass, ua.VariantType.Int32))
         )
         # add requested attrs
         self._add_nodeattributes(item.NodeAttributes, nodedata, add_timestamps)
 
     def _add_unique_reference(self, nodedata, desc):
-        for r in nodedata.references:
-            if r.ReferenceTypeId == desc.ReferenceTypeId and r.NodeId == desc.NodeId:
-                if r.IsForward != desc.IsForward:
-                    self.logger.error("Cannot add conflicting reference %s ", str(desc))
-                    return ua.StatusCode(ua.StatusCodes.BadReferenceNotAllowed)
-                break  # ref already exists
-        else:
-            nodedata.references.append(desc)
+        if nodedata.find_reference(desc.ReferenceTypeId, not desc.IsForward, desc.NodeId) is not None:
+            self.logger.error("Cannot add conflicting reference %s ", str(desc))
+            return ua.StatusCode(ua.StatusCodes.BadReferenceNotAllowed)
+        if nodedata.find_reference(desc.ReferenceTypeId, desc.IsForward, desc.NodeId) is None:
+            nodedata.add_reference(desc)
+            self._aspace.node_changed(nodedata)
+            if desc.ReferenceTypeId == _HAS_SUBTYPE:
+                self._aspace.clear_reference_subtypes()
         return ua.StatusCode()
 
+    def _remove_reference(self, nodedata, rdesc):
+        nodedata.remove_reference(rdesc)
+        self._aspace.node_changed(nodedata)
+        if rdesc.ReferenceTypeId == _HAS_SUBTYPE:
+            self._aspace.clear_reference_subtypes()
+
     def _add_ref_from_parent(self, nodedata, item, parentdata):
         desc = ua.ReferenceDescription()
-        desc.ReferenceTypeId = item.ReferenceTypeId
+        desc.ReferenceTypeId = ua.intern_nodeid(item.ReferenceTypeId)
         desc.NodeId = nodedata.nodeid
         desc.NodeClass = item.NodeClass
         desc.BrowseName = item.BrowseName
         desc.DisplayName = item.NodeAttributes.DisplayName
-        desc.TypeDefinition = item.TypeDefinition
+        desc.TypeDefinition = ua.intern_nodeid(item.TypeDefinition)
         desc.IsForward = True
         self._add_unique_reference(parentdata, desc)
 
@@ -291,16 +502,16 @@ class NodeManagementService(object):
         addref.TargetNodeId = item.ParentNodeId
         addref.TargetNodeClass = parentdata.attributes[ua.AttributeIds.NodeClass].value.Value.Value
         addref.IsForward = False
-        self._add_reference_no_check(nodedata, addref)
+        self._add_reference_no_check(nodedata, addref, parentdata)
 
-    def _add_type_definition(self, nodedata, item):
+    def _add_type_definition(self, nodedata, item, typedata=None):
         addref = ua.AddReferencesItem()
         addref.SourceNodeId = nodedata.nodeid
         addref.IsForward = True
-        addref.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HasTypeDefinition)
+        addref.ReferenceTypeId = _HAS_TYPE_DEFINITION
         addref.TargetNodeId = item.TypeDefinition
         addref.TargetNodeClass = ua.NodeClass.DataType
-        self._add_reference_no_check(nodedata, addref)
+        self._add_reference_no_check(nodedata, addref, typedata)
 
     def delete_nodes(self, deletenodeitems, user=UserManager.User.Admin):
         results = []
@@ -317,14 +528,17 @@ class NodeManagementService(object):
             return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
 
         if item.DeleteTargetReferences:
-            for elem in self._aspace.keys():
-                for rdesc in self._aspace[elem].references:
-                    if rdesc.NodeId == item.NodeId:
-                        self._aspace[elem].references.remove(rdesc)
+            for elem in list(self._aspace.keys()):
+                nodedata = self._aspace[elem]
+                for rdesc in [r for r in nodedata.references if r.NodeId == item.NodeId]:
+                    self._remove_reference(nodedata, rdesc)
 
-        self._delete_node_callbacks(self._aspace[item.NodeId])
+        nodedata = self._aspace[item.NodeId]
+        self._delete_node_callbacks(nodedata)
 
         del(self._aspace[item.NodeId])
+        if nodedata.attributes[ua.AttributeIds.NodeClass].value.Value.Value == ua.NodeClass.ReferenceType:
+            self._aspace.clear_reference_subtypes()
 
         return ua.StatusCode()
 
@@ -358,19 +572,27 @@ class NodeManagementService(object):
             return ua.StatusCode(ua.StatusCodes.BadUserAccessDenied)
         return self._add_reference_no_check(sourcedata, addref)
 
-    def _add_reference_no_check(self, sourcedata, addref):
+    def _add_reference_no_check(self, sourcedata, addref, targetdata=None):
+        # the attributes of the target are read from targetdata if given, without taking the lock
+        if targetdata is None:
+            def get_value(attr):
+                return self._aspace.get_attribute_value(addref.TargetNodeId, attr).Value.Value
+        else:
+            def get_value(attr):
+                attval = targetdata.attributes.get(attr)
+                return attval.value.Value.Value if attval is not None else None
         rdesc = ua.ReferenceDescription()
-        rdesc.ReferenceTypeId = addref.ReferenceTypeId
+        rdesc.ReferenceTypeId = ua.intern_nodeid(addref.ReferenceTypeId)
         rdesc.IsForward = addref.IsForward
-        rdesc.NodeId = addref.TargetNodeId
+        rdesc.NodeId = ua.intern_nodeid(addref.TargetNodeId)
         if addref.TargetNodeClass == ua.NodeClass.Unspecified:
-            rdesc.NodeClass = self._aspace.get_attribute_value(addref.TargetNodeId, ua.AttributeIds.NodeClass).Value.Value
+            rdesc.NodeClass = get_value(ua.AttributeIds.NodeClass)
         else:
             rdesc.NodeClass = addref.TargetNodeClass
-        bname = self._aspace.get_attribute_value(addref.TargetNodeId, ua.AttributeIds.BrowseName).Value.Value
+        bname = get_value(ua.AttributeIds.BrowseName)
         if bname:
             rdesc.BrowseName = bname
-        dname = self._aspace.get_attribute_value(addref.TargetNodeId, ua.AttributeIds.DisplayName).Value.Value
+        dname = get_value(ua.AttributeIds.DisplayName)
         if dname:
             rdesc.DisplayName = dname
         return self._add_unique_reference(sourcedata, rdesc)
@@ -386,12 +608,12 @@ class NodeManagementService(object):
             source, target, forward = item.TargetNodeId, item.SourceNodeId, not item.IsForward
         else:
             source, target, forward = item.SourceNodeId, item.TargetNodeId, item.IsForward
-        for rdesc in self._aspace[source].references:
-            if rdesc.NodeId == target and rdesc.ReferenceTypeId == item.ReferenceTypeId:
-                if rdesc.IsForward == forward:
-                    self._aspace[source].references.remove(rdesc)
-                    return ua.StatusCode()
-        return ua.StatusCode(ua.StatusCodes.BadNotFound)
+        nodedata = self._aspace[source]
+        rdesc = nodedata.find_reference(item.ReferenceTypeId, forward, target)
+        if rdesc is None:
+            return ua.StatusCode(ua.StatusCodes.BadNotFound)
+        self._remove_reference(nodedata, rdesc)
+        return ua.StatusCode()
 
     def _delete_reference(self, item, user):
         if item.SourceNodeId not in self._aspace:
@@ -407,38 +629,20 @@ class NodeManagementService(object):
             self._delete_unique_reference(item, True)
         return self._delete_unique_reference(item)
 
-    def _add_node_attr(self, item, nodedata, name, vtype=None, add_timestamps=False):
-        if item.SpecifiedAttributes & getattr(ua.NodeAttributesMask, name):
-            dv = ua.DataValue(ua.Variant(getattr(item, name), vtype))
-            if add_timestamps:
-                # dv.ServerTimestamp = datetime.utcnow()  # Disabled until someone explains us it should be there
-                dv.SourceTimestamp = datetime.utcnow()
-            nodedata.attributes[getattr(ua.AttributeIds, name)] = AttributeValue(dv)
-
     def _add_nodeattributes(self, item, nodedata, add_timestamps):
-        self._add_node_attr(item, nodedata, "AccessLevel", ua.VariantType.Byte)
-        self._add_node_attr(item, nodedata, "ArrayDimensions", ua.VariantType.UInt32)
-        self._add_node_attr(item, nodedata, "BrowseName", ua.VariantType.QualifiedName)
-        self._add_node_attr(item, nodedata, "ContainsNoLoops", ua.VariantType.Boolean)
-        self._add_node_attr(item, nodedata, "DataType", ua.VariantType.NodeId)
-        self._add_node_attr(item, nodedata, "Description", ua.VariantType.LocalizedText)
-        self._add_node_attr(item, nodedata, "DisplayName", ua.VariantType.LocalizedText)
-        self._add_node_attr(item, nodedata, "EventNotifier", ua.VariantType.Byte)
-        self._add_node_attr(item, nodedata, "Executable", ua.VariantType.Boolean)
-        self._add_node_attr(item, nodedata, "Historizing", ua.VariantType.Boolean)
-        self._add_node_attr(item, nodedata, "InverseName", ua.VariantType.LocalizedText)
-        self._add_node_attr(item, nodedata, "IsAbstract", ua.VariantType.Boolean)
-        self._add_node_attr(item, nodedata, "MinimumSamplingInterval", ua.VariantType.Double)
-        self._add_node_attr(item, nodedata, "NodeClass", ua.VariantType.Int32)
-        self._add_node_attr(item, nodedata, "NodeId", ua.VariantType.NodeId)
-        self._add_node_attr(item, nodedata, "Symmetric", ua.VariantType.Boolean)
-        self._add_node_attr(item, nodedata, "UserAccessLevel", ua.VariantType.Byte)
-        self._add_node_attr(item, nodedata, "UserExecutable", ua.VariantType.Boolean)
-        self._add_node_attr(item, nodedata, "UserWriteMask", ua.VariantType.Byte)
-        self._add_node_attr(item, nodedata, "ValueRank", ua.VariantType.Int32)
-        self._add_node_attr(item, nodedata, "WriteMask", ua.VariantType.UInt32)
-        self._add_node_attr(item, nodedata, "UserWriteMask", ua.VariantType.UInt32)
-        self._add_node_attr(item, nodedata, "Value", add_timestamps=add_timestamps)
+        specified = item.SpecifiedAttributes
+        for name, mask, attr, vtype, pytype in _NODE_ATTRIBUTES:
+            if specified & mask:
+                value = getattr(item, name)
+                if pytype is not None and isinstance(value, pytype):
+                    variant = ua.Variant.from_trusted(value, vtype, is_array=pytype is list)
+                else:
+                    variant = ua.Variant(value, vtype)
+                dv = ua.DataValue.from_trusted(variant)
+                if add_timestamps and attr == ua.AttributeIds.Value:
+                    # dv.ServerTimestamp = datetime.utcnow()  # Disabled until someone explains us it should be there
+                    dv.SourceTimestamp = datetime.utcnow()
+                nodedata.attributes[attr] = AttributeValue(dv)
 
 
 class MethodService(object):
@@ -478,96 +682,363 @@ class MethodService(object):
         return res
 
 
+class NodeStoreInterface(object):
+    """
+    Interface of a backend keeping the nodes of the address space instead of a dict,
+    see AddressSpace.set_node_store and opcua.server.address_space_sql.NodeStoreSQLite.
+    The address space calls it with the lock of a namespace held, a store used for several namespaces
+    and several readers may call it concurrently.
+    NodeData objects returned by get() may be modified in place, node_changed() is then called
+    """
+
+    def get(self, nodeid, default=None):
+        """
+        Return the NodeData of nodeid or default
+        """
+        raise NotImplementedError
+
+    def __getitem__(self, nodeid):
+        nodedata = self.get(nodeid)
+        if nodedata is None:
+            raise KeyError(nodeid)
+        return nodedata
+
+    def __setitem__(self, nodeid, nodedata):
+        """
+        Add or replace a node
+        """
+        raise NotImplementedError
+
+    def __delitem__(self, nodeid):
+        """
+        Delete a node, raise KeyError if it does not exist
+        """
+        raise NotImplementedError
+
+    def __contains__(self, nodeid):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def keys(self, namespace=None):
+        """
+        Return the nodeids of all nodes, or of the nodes of a namespace index
+        """
+        raise NotImplementedError
+
+    def items(self, namespace=None):
+        """
+        Iterate over (nodeid, NodeData) of all nodes, or of the nodes of a namespace index
+        """
+        for nodeid in list(self.keys(namespace)):
+            nodedata = self.get(nodeid)
+            if nodedata is not None:
+                yield nodeid, nodedata
+
+    def node_changed(self, nodedata):
+        """
+        Called when a node was modified in place
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Make all changes persistent
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class _Shard(object):
+    """
+    The nodes of one namespace of the address space and the lock protecting them.
+    nodes is a dict, the cache of a shelf or the NodeStoreInterface store,
+    which may be shared with other namespaces
+    """
+
+    def __init__(self, idx, nodes=None, snapshot=None, store=None):
+        self.idx = idx
+        self.lock = ReadWriteLock()
+        self.store = store
+        if store is not None:
+            nodes = store
+        # highest numeric identifier in use, None until computed for a shelf or a store
+        self.max_id = None if nodes is not None else 0
+        self.nodes = {} if nodes is None else nodes
+        self.snapshot = snapshot  # nodes of a snapshot file not decoded yet
+        self.snapshot_lock = threading.Lock()
+        if snapshot is not None:
+            self.max_id = snapshot.max_id
+
+    def get_node(self, nodeid):
+        # to be called with the lock held
+        node = self.nodes.get(nodeid, None)
+        if node is None and self.snapshot is not None:
+            with self.snapshot_lock:
+                node = self.nodes.get(nodeid, None)
+                if node is None:
+                    node = self.snapshot.decode_node(nodeid)
+                    if node is not None:
+                        # readers not holding snapshot_lock look in the index first, then in nodes,
+                        # so the node is added to nodes before it leaves the index
+                        self.nodes[node.nodeid] = node
+                        self.snapshot.index.pop(nodeid, None)
+        return node
+
+    def contains(self, nodeid):
+        return (self.snapshot is not None and nodeid in self.snapshot.index) or nodeid in self.nodes
+
+    def set_node(self, nodeid, nodedata):
+        self.nodes[ua.intern_nodeid(nodeid)] = nodedata
+        if self.snapshot is not None:
+            self.snapshot.index.pop(nodeid, None)
+        if self.max_id is not None and nodeid.NodeIdType in _NUMERIC_NODEID_TYPES and nodeid.Identifier > self.max_id:
+            self.max_id = nodeid.Identifier
+
+    def get_max_id(self):
+        # to be called with the lock held, only a shelf or a store is scanned, once
+        if self.max_id is None:
+            self.max_id = max([nodeid.Identifier for nodeid in self.keys()
+                               if nodeid.NodeIdType in _NUMERIC_NODEID_TYPES] or [0])
+        return self.max_id
+
+    def delete_node(self, nodeid):
+        if self.snapshot is None or self.snapshot.index.pop(nodeid, None) is None:
+            del self.nodes[nodeid]
+
+    def keys(self):
+        if self.store is not None:
+            return self.store.keys(self.idx)
+        if self.snapshot is not None:
+            # a node being decoded may be in both
+            index = list(self.snapshot.index.keys())
+            nodes = list(self.nodes.keys())
+            decoded = set(nodes)
+            return nodes + [nodeid for nodeid in index if nodeid not in decoded]
+        return list(self.nodes.keys())
+
+    def items(self):
+        # decode all nodes of the snapshot, to be called with the lock held
+        if self.snapshot is not None:
+            for nodeid in list(self.snapshot.index.keys()):
+                self.get_node(nodeid)
+        if self.store is not None:
+            return list(self.store.items(self.idx))
+        return list(self.nodes.items())
+
+
 class AddressSpace(object):
 
     """
     The address space object stores all the nodes of the OPC-UA server
     and helper methods.
+    The nodes are partitioned by namespace index, each namespace has its own lock
+    and backend (dict, shelf, snapshot or node store), so readers of a namespace never
+    wait on writers to another one.
     The methods are thread safe
     """
 
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self._nodes = {}
-        self._lock = RLock()  # FIXME: should use multiple reader, one writter pattern
-        self._datachange_callback_counter = 200
+        self._shards = {}  # namespace index: _Shard
+        self._shards_lock = threading.Lock()
+        self._empty_shard = _Shard(None)  # returned for the namespaces without nodes
+        self._new_shard_nodes = None  # makes the nodes of a new namespace, a dict if None
+        self._default_store = None  # NodeStoreInterface of the namespaces without their own backend
+        self._datachange_handles = itertools.count(201)
         self._handle_to_attribute_map = {}
+        self._handle_to_batch_callback = {}
         self._default_idx = 2
         self._nodeid_counter = {0: 20000, 1: 2000}
+        self._reference_subtypes = {}
+
+    def _get_shard(self, idx, create=False):
+        shard = self._shards.get(idx)
+        if shard is not None:
+            return shard
+        if not create and self._new_shard_nodes is None and self._default_store is None:
+            return self._empty_shard
+        with self._shards_lock:
+            shard = self._shards.get(idx)
+            if shard is None:
+                nodes = self._new_shard_nodes() if self._new_shard_nodes is not None else None
+                shard = _Shard(idx, nodes, store=self._default_store)
+                self._shards[idx] = shard
+            return shard
+
+    def _reset(self, shards=None, new_shard_nodes=None, default_store=None):
+        # replace all the nodes, operations running on the previous shards are not affected
+        with self._shards_lock:
+            self._new_shard_nodes = new_shard_nodes
+            self._default_store = default_store
+            self._shards = shards if shards is not None else {}
+            self._reference_subtypes = {}
+
+    def _stores(self):
+        # the node stores in use, each one once
+        stores = [] if self._default_store is None else [self._default_store]
+        for shard in list(self._shards.values()):
+            if shard.store is not None and shard.store not in stores:
+                stores.append(shard.store)
+        return stores
+
+    def _items(self):
+        # (nodeid, NodeData) of all nodes, decoding the nodes of snapshots
+        items = []
+        for shard in list(self._shards.values()):
+            if shard.store is None:
+                with shard.lock.read:
+                    items.extend(shard.items())
+        for store in self._stores():
+            items.extend(store.items())
+        return items
 
     def __getitem__(self, nodeid):
-        with self._lock:
-            return self._nodes.__getitem__(nodeid)
+        node = self.get(nodeid)
+        if node is None:
+            raise KeyError(nodeid)
+        return node
 
     def get(self, nodeid):
-        with self._lock:
-            return self._nodes.get(nodeid, None)
+        shard = self._get_shard(nodeid.NamespaceIndex)
+        with shard.lock.read:
+            return shard.get_node(nodeid)
 
     def __setitem__(self, nodeid, value):
-        with self._lock:
-            return self._nodes.__setitem__(nodeid, value)
+        shard = self._get_shard(nodeid.NamespaceIndex, create=True)
+        with shard.lock.write:
+            shard.set_node(nodeid, value)
+
+    def add_nodes(self, nodes):
+        """
+        Add a list of NodeData taking the lock of each namespace once, a node whose nodeid
+        already exists is not added. Return a list of booleans, True if the node was added
+        """
+        added = [False] * len(nodes)
+        by_namespace = {}
+        for i, nodedata in enumerate(nodes):
+            by_namespace.setdefault(nodedata.nodeid.NamespaceIndex, []).append(i)
+        for idx, indexes in by_namespace.items():
+            shard = self._get_shard(idx, create=True)
+            with shard.lock.write:
+                for i in indexes:
+                    nodedata = nodes[i]
+                    if not shard.contains(nodedata.nodeid):
+                        shard.set_node(nodedata.nodeid, nodedata)
+                        added[i] = True
+        return added
 
     def __contains__(self, nodeid):
-        with self._lock:
-            return self._nodes.__contains__(nodeid)
+        shard = self._get_shard(nodeid.NamespaceIndex)
+        with shard.lock.read:
+            return shard.contains(nodeid)
 
     def __delitem__(self, nodeid):
-        with self._lock:
-            self._nodes.__delitem__(nodeid)
+        shard = self._get_shard(nodeid.NamespaceIndex)
+        with shard.lock.write:
+            shard.delete_node(nodeid)
+            ua.release_nodeid(nodeid)
 
     def generate_nodeid(self, idx=None):
         if idx is None:
             idx = self._default_idx
-        if idx in self._nodeid_counter:
-            self._nodeid_counter[idx] += 1
-        else:
-            # get the biggest identifier number from the existed nodes in address space
-            identifier_list = sorted([nodeid.Identifier for nodeid in self._nodes.keys()
-                                      if nodeid.NamespaceIndex == idx and nodeid.NodeIdType
-                                      in (ua.NodeIdType.Numeric, ua.NodeIdType.TwoByte, ua.NodeIdType.FourByte)])
-            if identifier_list:
-                self._nodeid_counter[idx] = identifier_list[-1]
-            else:
-                self._nodeid_counter[idx] = 1
-        nodeid = ua.NodeId(self._nodeid_counter[idx], idx)
-        with self._lock:  # OK since reentrant lock
-            while True:
-                if nodeid in self._nodes:
-                    nodeid = self.generate_nodeid(idx)
-                else:
-                    return nodeid
+        shard = self._get_shard(idx, create=True)
+        with shard.lock.write:
+            counter = self._nodeid_counter.get(idx)
+            if counter is None:
+                # start after the biggest identifier of the namespace
+                counter = shard.get_max_id()
+            counter += 1
+            nodeid = ua.NodeId(counter, idx)
+            if shard.contains(nodeid):
+                # identifiers above the biggest one in use are free
+                counter = shard.get_max_id() + 1
+                nodeid = ua.NodeId(counter, idx)
+            self._nodeid_counter[idx] = counter
+            return nodeid
 
     def keys(self):
-        with self._lock:
-            return self._nodes.keys()
+        keys = []
+        for shard in list(self._shards.values()):
+            if shard.store is None:
+                with shard.lock.read:
+                    keys.extend(shard.keys())
+        for store in self._stores():
+            keys.extend(store.keys())
+        return keys
+
+    def get_reference_subtypes(self, reftype):
+        """
+        Return the set of nodeids of all the subtypes of the reference type reftype,
+        found recursively through HasSubtype references.
+        Results are cached until clear_reference_subtypes is called
+        """
+        cache = self._reference_subtypes
+        subtypes = cache.get(reftype)
+        if subtypes is None:
+            subtypes = set()
+            stack = [reftype]
+            while stack:
+                nodedata = self.get(stack.pop())
+                if nodedata is None:
+                    continue
+                for nodeid in list(nodedata.reference_index.get((_HAS_SUBTYPE, True), ())):
+                    if nodeid not in subtypes:
+                        subtypes.add(nodeid)
+                        stack.append(nodeid)
+            subtypes = frozenset(subtypes)
+            # if the cache was cleared meanwhile the result is stored in the discarded dict
+            cache[reftype] = subtypes
+        return subtypes
+
+    def clear_reference_subtypes(self):
+        """
+        Clear the cache of get_reference_subtypes, to be called after a ReferenceType node
+        or a HasSubtype reference is added or deleted.
+        The dict is replaced even when it is empty, a closure being computed from the
+        old hierarchy is stored in the dict it started with
+        """
+        self._reference_subtypes = {}
 
     def empty(self):
         """
         Delete all nodes in address space
         """
-        with self._lock:
-            self._nodes = {}
+        self._reset()
 
     def dump(self, path):
         """
         Dump address space as binary to file; note that server must be stopped for this method to work
         DO NOT DUMP AN ADDRESS SPACE WHICH IS USING A SHELF (load_aspace_shelf), ONLY CACHED NODES WILL GET DUMPED!
         """
+        nodes = self._items()
         # prepare nodes in address space for being serialized
-        for nodeid, ndata in self._nodes.items():
+        for nodeid, ndata in nodes:
             # if the node has a reference to a method call, remove it so the object can be serialized
             if ndata.call is not None:
-                self._nodes[nodeid].call = None
+                ndata.call = None
 
         with open(path, 'wb') as f:
-            pickle.dump(self._nodes, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(dict(nodes), f, pickle.HIGHEST_PROTOCOL)
 
     def load(self, path):
         """
         Load address space from a binary file, overwriting everything in the current address space
         """
         with open(path, 'rb') as f:
-            self._nodes = pickle.load(f)
+            nodes = pickle.load(f)
+        shards = {}
+        for ndata in nodes.values():
+            ndata.nodeid = ua.intern_nodeid(ndata.nodeid)
+            idx = ndata.nodeid.NamespaceIndex
+            shard = shards.get(idx)
+            if shard is None:
+                shard = shards[idx] = _Shard(idx)
+            shard.set_node(ndata.nodeid, ndata)
+        self._reset(shards)
 
     def make_aspace_shelf(self, path):
         """
@@ -579,7 +1050,7 @@ class AddressSpace(object):
         Note: Intended for slow devices, such as Raspberry Pi, to greatly improve start up time
         """
         s = shelve.open(path, "n", protocol=pickle.HIGHEST_PROTOCOL)
-        for nodeid, ndata in self._nodes.items():
+        for nodeid, ndata in self._items():
             s[nodeid.to_string()] = ndata
         s.close()
 
@@ -594,10 +1065,13 @@ class AddressSpace(object):
             """
             Special dict that only loads nodes as they are accessed. If a node is accessed it gets copied from the
             shelve to the cache dict. All user nodes are saved in the cache ONLY. Saving data back to the shelf
-            is currently NOT supported
+            is currently NOT supported.
+            Nodes are read under the read lock of the namespace, the shelf is accessed with
+            source_lock held, which is shared by all the namespaces using the shelf
             """
-            def __init__(self, source):
+            def __init__(self, source, source_lock):
                 self.source = source  # python shelf
+                self.source_lock = source_lock
                 self.cache = {}  # internal dict
 
             def __getitem__(self, key):
@@ -605,7 +1079,15 @@ class AddressSpace(object):
                 try:
                     return self.cache[key]
                 except KeyError:
-                    node = self.cache[key] = self.source[key.to_string()]
+                    pass
+                with self.source_lock:
+                    # another reader may have loaded it meanwhile, there must be one copy of a node
+                    try:
+                        return self.cache[key]
+                    except KeyError:
+                        node = self.source[key.to_string()]
+                    node.nodeid = ua.intern_nodeid(node.nodeid)
+                    self.cache[node.nodeid] = node
                     return node
 
             def __setitem__(self, key, value):
@@ -613,7 +1095,10 @@ class AddressSpace(object):
                 self.cache[key] = value
 
             def __contains__(self, key):
-                return key in self.cache or key.to_string() in self.source
+                if key in self.cache:
+                    return True
+                with self.source_lock:
+                    return key.to_string() in self.source
 
             def __delitem__(self, key):
                 # only deleting items from the cache is allowed
@@ -627,29 +1112,97 @@ class AddressSpace(object):
                 # only returns the length of items in the cache, not unaccessed items in the shelf
                 return len(self.cache)
 
-        self._nodes = LazyLoadingDict(shelve.open(path, "r"))
+        # the namespaces share the shelf, each one caches its own nodes
+        source = shelve.open(path, "r")
+        source_lock = threading.Lock()
+        self._reset(new_shard_nodes=lambda: LazyLoadingDict(source, source_lock))
+
+    def make_aspace_snapshot(self, path):
+        """
+        Write all the nodes of the address space to a snapshot file, in OPC UA binary encoding.
+        Callbacks of nodes are not saved. The snapshot can be generated when building
+        the package, see schemas/generate_address_space.py, or on first start of the server.
+        """
+        nodes = [ndata for nodeid, ndata in self._items()]
+        with open(path, "wb") as f:
+            f.write(_snapshot_to_binary(nodes))
+
+    def load_aspace_snapshot(self, path):
+        """
+        Load the nodes of a snapshot file made by make_aspace_snapshot, overwriting everything in
+        the current address space. The file is memory mapped and only its index is read,
+        a node is decoded the first time it is accessed. Unlike a shelf, the nodes can be modified
+        and deleted and the address space can be dumped
+        """
+        snapshots = _open_snapshot(path)
+        self._reset(dict((idx, _Shard(idx, snapshot=snapshot)) for idx, snapshot in snapshots.items()))
+
+    def set_node_store(self, store, namespaces=None):
+        """
+        Keep the nodes of the address space in store, a NodeStoreInterface, instead of in memory.
+        If the store is empty, the current nodes are copied to it, otherwise the nodes of the store
+        replace the current ones, for example those saved by a previous run of the server.
+        If namespaces, a list of namespace indexes, is given only these namespaces use the store
+        and the other ones keep their nodes, for example the standard address space from a snapshot,
+        otherwise the store is used for all namespaces, including the ones created later.
+        Callbacks are not persisted and must be set again after a restart
+        """
+        if namespaces is None:
+            shards = list(self._shards.values())
+        else:
+            shards = [self._get_shard(idx, create=True) for idx in namespaces]
+        if not len(store):
+            for shard in shards:
+                with shard.lock.read:
+                    for nodeid, ndata in shard.items():
+                        store[nodeid] = ndata
+            store.flush()
+        if namespaces is None:
+            self._reset(default_store=store)
+        else:
+            with self._shards_lock:
+                for shard in shards:
+                    self._shards[shard.idx] = _Shard(shard.idx, store=store)
+                self._reference_subtypes = {}
+
+    def node_changed(self, nodedata):
+        """
+        Called after a node got by get() or [] has been modified in place, for the node store to save it
+        """
+        store = self._get_shard(nodedata.nodeid.NamespaceIndex).store
+        if store is not None:
+            store.node_changed(nodedata)
+
+    def flush(self):
+        """
+        Write the changes to the node stores, if any
+        """
+        for store in self._stores():
+            store.flush()
 
     def get_attribute_value(self, nodeid, attr):
-        with self._lock:
-            self.logger.debug("get attr val: %s %s", nodeid, attr)
-            if nodeid not in self._nodes:
-                dv = ua.DataValue()
-                dv.StatusCode = ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
-                return dv
-            node = self._nodes[nodeid]
-            if attr not in node.attributes:
-                dv = ua.DataValue()
-                dv.StatusCode = ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid)
-                return dv
-            attval = node.attributes[attr]
-            if attval.value_callback:
-                return attval.value_callback()
-            return attval.value
+        self.logger.debug("get attr val: %s %s", nodeid, attr)
+        shard = self._get_shard(nodeid.NamespaceIndex)
+        with shard.lock.read:
+            node = shard.get_node(nodeid)
+            if node is None:
+                return ua.DataValue.from_trusted(ua.Variant.from_trusted(None, ua.VariantType.Null),
+                                                 ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown))
+            attval = node.attributes.get(attr, None)
+            if attval is None:
+                return ua.DataValue.from_trusted(ua.Variant.from_trusted(None, ua.VariantType.Null),
+                                                 ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid))
+            value_callback = attval.value_callback
+            if not value_callback:
+                return attval.value
+        # callbacks may be slow or access the address space, do not hold the lock
+        return value_callback()
 
     def set_attribute_value(self, nodeid, attr, value):
-        with self._lock:
-            self.logger.debug("set attr val: %s %s %s", nodeid, attr, value)
-            node = self._nodes.get(nodeid, None)
+        self.logger.debug("set attr val: %s %s %s", nodeid, attr, value)
+        shard = self._get_shard(nodeid.NamespaceIndex)
+        with shard.lock.write:
+            node = shard.get_node(nodeid)
             if node is None:
                 return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
             attval = node.attributes.get(attr, None)
@@ -658,10 +1211,15 @@ class AddressSpace(object):
 
             old = attval.value
             attval.value = value
+            if shard.store is not None:
+                shard.store.node_changed(node)
             cbs = []
             if old.Value != value.Value:  # only send call callback when a value change has happend
                 cbs = list(attval.datachange_callbacks.items())
 
+        if cbs:
+            # the notifications of all subscriptions share the value and its encoding
+            value = CachedDataValue.from_datavalue(value)
         for k, v in cbs:
             try:
                 v(k, value)
@@ -670,28 +1228,259 @@ class AddressSpace(object):
 
         return ua.StatusCode()
 
-    def add_datachange_callback(self, nodeid, attr, callback):
-        with self._lock:
+    def set_attribute_values(self, writes):
+        """
+        Set the attribute values of several nodes taking the lock of each namespace once,
+        writes is a list of (nodeid, attr, datavalue). Datachange callbacks are called
+        after all values are set, callbacks registered with a batch_callback get
+        all their datachanges in one call. Return a list of StatusCode
+        """
+        self.logger.debug("set attr vals: %s values", len(writes))
+        results = [None] * len(writes)
+        changes = []
+        by_namespace = {}
+        for i, write in enumerate(writes):
+            by_namespace.setdefault(write[0].NamespaceIndex, []).append(i)
+        for idx, indexes in by_namespace.items():
+            shard = self._get_shard(idx)
+            with shard.lock.write:
+                for i in indexes:
+                    nodeid, attr, value = writes[i]
+                    node = shard.get_node(nodeid)
+                    if node is None:
+                        results[i] = ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
+                        continue
+                    attval = node.attributes.get(attr, None)
+                    if attval is None:
+                        results[i] = ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid)
+                        continue
+                    old = attval.value
+                    attval.value = value
+                    if shard.store is not None:
+                        shard.store.node_changed(node)
+                    if attval.datachange_callbacks and old.Value != value.Value:
+                        shared = CachedDataValue.from_datavalue(value)
+                        for handle, callback in attval.datachange_callbacks.items():
+                            changes.append((handle, callback, shared))
+                    results[i] = ua.StatusCode()
+
+        batches = {}
+        for handle, callback, value in changes:
+            batch_callback = self._handle_to_batch_callback.get(handle)
+            if batch_callback is not None:
+                batches.setdefault(batch_callback, []).append((handle, value))
+                continue
+            try:
+                callback(handle, value)
+            except Exception as ex:
+                self.logger.exception("Error calling datachange callback %s, %s, %s", handle, callback, ex)
+        for batch_callback, values in batches.items():
+            try:
+                batch_callback(values)
+            except Exception as ex:
+                self.logger.exception("Error calling datachange batch callback %s, %s", batch_callback, ex)
+
+        return results
+
+    def add_datachange_callback(self, nodeid, attr, callback, batch_callback=None):
+        """
+        Call callback(handle, datavalue) when the value of the attribute changes.
+        If batch_callback is given, set_attribute_values calls it instead with the list
+        of (handle, datavalue) of all the changes, for all the handles registered with it
+        """
+        shard = self._get_shard(nodeid.NamespaceIndex)
+        with shard.lock.write:
             self.logger.debug("set attr callback: %s %s %s", nodeid, attr, callback)
-            if nodeid not in self._nodes:
+            node = shard.get_node(nodeid)
+            if node is None:
                 return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown), 0
-            node = self._nodes[nodeid]
             if attr not in node.attributes:
                 return ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid), 0
             attval = node.attributes[attr]
-            self._datachange_callback_counter += 1
-            handle = self._datachange_callback_counter
+            handle = next(self._datachange_handles)
             attval.datachange_callbacks[handle] = callback
+            if shard.store is not None:
+                # the node may have left the cache of the store since it was got, it must be kept
+                shard.store.node_changed(node)
             self._handle_to_attribute_map[handle] = (nodeid, attr)
+            if batch_callback is not None:
+                self._handle_to_batch_callback[handle] = batch_callback
             return ua.StatusCode(), handle
 
     def delete_datachange_callback(self, handle):
-        with self._lock:
-            if handle in self._handle_to_attribute_map:
-                nodeid, attr = self._handle_to_attribute_map.pop(handle)
-                self._nodes[nodeid].attributes[attr].datachange_callbacks.pop(handle)
+        # the maps are shared by all namespaces, pop() is atomic
+        entry = self._handle_to_attribute_map.pop(handle, None)
+        if entry is None:
+            return
+        nodeid, attr = entry
+        self._handle_to_batch_callback.pop(handle, None)
+        shard = self._get_shard(nodeid.NamespaceIndex)
+        with shard.lock.write:
+            shard.get_node(nodeid).attributes[attr].datachange_callbacks.pop(handle)
+
+    def set_attribute_value_callback(self, nodeid, attr, callback):
+        """
+        Get the value of the attribute from callback(), which returns a DataValue,
+        instead of the stored value. Monitored items on the attribute are sampled.
+        Pass None to use the stored value again
+        """
+        shard = self._get_shard(nodeid.NamespaceIndex)
+        with shard.lock.write:
+            node = shard.get_node(nodeid)
+            if node is None:
+                return ua.StatusCode(ua.StatusCodes.BadNodeIdUnknown)
+            if attr not in node.attributes:
+                return ua.StatusCode(ua.StatusCodes.BadAttributeIdInvalid)
+            node.attributes[attr].value_callback = callback
+            if shard.store is not None:
+                shard.store.node_changed(node)
+            return ua.StatusCode()
+
+    def has_value_callback(self, nodeid, attr):
+        shard = self._get_shard(nodeid.NamespaceIndex)
+        with shard.lock.read:
+            node = shard.get_node(nodeid)
+            if node is None or attr not in node.attributes:
+                return False
+            return node.attributes[attr].value_callback is not None
+
+    def delete_datachange_callbacks(self, handles):
+        """
+        Delete several datachange callbacks taking the lock of each namespace once
+        """
+        by_namespace = {}
+        for handle in handles:
+            entry = self._handle_to_attribute_map.pop(handle, None)
+            if entry is not None:
+                self._handle_to_batch_callback.pop(handle, None)
+                by_namespace.setdefault(entry[0].NamespaceIndex, []).append((handle, entry))
+        for idx, entries in by_namespace.items():
+            shard = self._get_shard(idx)
+            with shard.lock.write:
+                for handle, (nodeid, attr) in entries:
+                    shard.get_node(nodeid).attributes[attr].datachange_callbacks.pop(handle)
 
     def add_method_callback(self, methodid, callback):
-        with self._lock:
-            node = self._nodes[methodid]
+        shard = self._get_shard(methodid.NamespaceIndex)
+        with shard.lock.write:
+            node = shard.get_node(methodid)
+            if node is None:
+                raise KeyError(methodid)
             node.call = callback
+            if shard.store is not None:
+                shard.store.node_changed(node)
+
+
+def nodedata_to_binary(buf, nodedata):
+    """
+    Append the binary encoding of a node to the bytearray buf:
+    Int32 number of attributes, then (UInt32 AttributeId, DataValue) for each attribute,
+    Int32 number of references, then a ReferenceDescription for each reference.
+    Callbacks are not encoded
+    """
+    buf += Primitives.Int32.pack(len(nodedata.attributes))
+    for attr, attval in nodedata.attributes.items():
+        buf += Primitives.UInt32.pack(attr)
+        write_struct(buf, attval.value)
+    buf += Primitives.Int32.pack(len(nodedata.references))
+    for ref in nodedata.references:
+        write_struct(buf, ref)
+
+
+def nodedata_from_binary(nodeid, data):
+    """
+    Decode a node encoded by nodedata_to_binary from the Buffer data
+    """
+    nodedata = NodeData(ua.intern_nodeid(nodeid))
+    for _ in range(Primitives.Int32.unpack(data)):
+        attr = ua.AttributeIds(Primitives.UInt32.unpack(data))
+        nodedata.attributes[attr] = AttributeValue(struct_from_binary(ua.DataValue, data))
+    # the address space stores the node class as the enum, binary encoding only keeps the number
+    attval = nodedata.attributes.get(ua.AttributeIds.NodeClass)
+    if attval is not None:
+        attval.value.Value.Value = ua.NodeClass(attval.value.Value.Value)
+    for _ in range(Primitives.Int32.unpack(data)):
+        nodedata.add_reference(struct_from_binary(ua.ReferenceDescription, data))
+    return nodedata
+
+
+# Address space snapshots
+#
+# A snapshot file holds the nodes of an address space in OPC UA binary encoding:
+#   header: magic, format version and offset of the index
+#   nodes: each node encoded by nodedata_to_binary
+#   index: Int32 number of nodes, then NodeId, offset and size for each node
+# The file is memory mapped and a node is only decoded when it is first accessed.
+
+_SNAPSHOT_MAGIC = b"UASNAPSH"
+_SNAPSHOT_VERSION = 1
+_snapshot_header = struct.Struct("<8sIQ")
+_snapshot_entry = struct.Struct("<QI")
+
+
+def _snapshot_to_binary(nodes):
+    buf = bytearray(_snapshot_header.size)
+    index = []
+    for nodedata in nodes:
+        start = len(buf)
+        nodedata_to_binary(buf, nodedata)
+        index.append((nodedata.nodeid, start, len(buf) - start))
+    _snapshot_header.pack_into(buf, 0, _SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, len(buf))
+    buf += Primitives.Int32.pack(len(index))
+    for nodeid, start, size in index:
+        buf += nodeid_to_binary(nodeid)
+        buf += _snapshot_entry.pack(start, size)
+    return bytes(buf)
+
+
+def _open_snapshot(path):
+    """
+    Read the index of a snapshot file, return a dict namespace index: _Snapshot
+    """
+    with open(path, "rb") as f:
+        # the mapping stays valid after the file is closed, python2 cannot make a
+        # memoryview of it, nodes are decoded from slices of the mapping then
+        data = buffer_view(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    if len(data) < _snapshot_header.size:
+        raise ua.UaError("{0} is not an address space snapshot".format(path))
+    magic, version, index_start = _snapshot_header.unpack_from(data, 0)
+    if magic != _SNAPSHOT_MAGIC:
+        raise ua.UaError("{0} is not an address space snapshot".format(path))
+    if version != _SNAPSHOT_VERSION:
+        raise ua.UaError("Address space snapshot {0} has unsupported version {1}".format(path, version))
+    indexes = {}
+    buf = Buffer(data, index_start)
+    for _ in range(Primitives.Int32.unpack(buf)):
+        nodeid = ua.intern_nodeid(nodeid_from_binary(buf))
+        index = indexes.get(nodeid.NamespaceIndex)
+        if index is None:
+            index = indexes[nodeid.NamespaceIndex] = {}
+        index[nodeid] = _snapshot_entry.unpack(buf.read(_snapshot_entry.size))
+    snapshots = {}
+    for idx, index in indexes.items():
+        snapshot = snapshots[idx] = _Snapshot(data, index)
+        snapshot.max_id = max([nodeid.Identifier for nodeid in index
+                               if nodeid.NodeIdType in _NUMERIC_NODEID_TYPES] or [0])
+    return snapshots
+
+
+class _Snapshot(object):
+    """
+    The nodes of a namespace in a snapshot file which have not been decoded yet
+    """
+
+    def __init__(self, data, index):
+        self._data = data
+        self.index = index  # nodeid: (offset, size)
+        self.max_id = 0  # highest numeric identifier of the index
+
+    def decode_node(self, nodeid):
+        """
+        decode the node, return None if it is not in the snapshot.
+        The caller removes it from the index once it is stored elsewhere
+        """
+        entry = self.index.get(nodeid, None)
+        if entry is None:
+            return None
+        start, size = entry
+        return nodedata_from_binary(nodeid, Buffer(self._data, start, size))
@@ -0,0 +1,198 @@
+import logging
+from collections import OrderedDict
+from threading import Lock
+import sqlite3
+
+from opcua import ua
+from opcua.ua.ua_binary import nodeid_to_binary, nodeid_from_binary
+from opcua.common.utils import Buffer, monotonic
+from opcua.server.address_space import NodeStoreInterface, nodedata_to_binary, nodedata_from_binary
+
+
+class NodeStoreSQLite(NodeStoreInterface):
+    """
+    node store which keeps the nodes of the address space in a SQLite database, in OPC UA binary encoding.
+    The most recently used nodes are kept in memory, up to cache_size, modified nodes are written back
+    when they leave the cache or when flush() is called.
+    Changes are committed once commit_size nodes are changed, at the first change made more than
+    commit_interval seconds after the last commit, and by flush() and close(). A running server
+    flushes its node stores every second, so a crash loses the changes of the last commit_interval
+    seconds or commit_size changed nodes, or of the last second when the server is running.
+    Nodes with callbacks are never removed from memory since callbacks cannot be saved.
+    usage: server = Server(nodestore=NodeStoreSQLite("address_space.db"))
+    """
+
+    def __init__(self, path="address_space.db", cache_size=100000, commit_interval=1.0, commit_size=1000):
+        self.logger = logging.getLogger(__name__)
+        self._db_file = path
+        self._cache_size = max(cache_size, 1)
+        self._commit_interval = commit_interval
+        self._commit_size = max(commit_size, 1)
+        self._changes = 0  # nodes changed since the last commit
+        self._last_commit = monotonic()
+        self._lock = Lock()
+        self._cache = OrderedDict()  # least recently used first
+        self._pinned = {}  # nodes with callbacks removed from the cache
+        self._dirty = set()  # nodeids of nodes in memory not written to the database yet
+
+        self._conn = sqlite3.connect(self._db_file, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS Nodes '
+                           '(NodeId BLOB PRIMARY KEY NOT NULL, Data BLOB, NamespaceIndex INTEGER)')
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(Nodes)')]
+        if 'NamespaceIndex' not in columns:
+            # database written before the namespace was stored
+            self._conn.execute('ALTER TABLE Nodes ADD COLUMN NamespaceIndex INTEGER')
+            rows = self._conn.execute('SELECT NodeId FROM Nodes').fetchall()
+            self._conn.executemany('UPDATE Nodes SET NamespaceIndex = ? WHERE NodeId = ?',
+                                   [(nodeid_from_binary(Buffer(bytes(row[0]))).NamespaceIndex, row[0])
+                                    for row in rows])
+        self._conn.execute('CREATE INDEX IF NOT EXISTS NodesNamespaceIndex ON Nodes (NamespaceIndex)')
+        self._conn.commit()
+
+    def get(self, nodeid, default=None):
+        with self._lock:
+            nodedata = self._cache.pop(nodeid, None)
+            if nodedata is None:
+                nodedata = self._pinned.pop(nodeid, None)
+            if nodedata is None:
+                row = self._conn.execute('SELECT Data FROM Nodes WHERE NodeId = ?', (self._key(nodeid),)).fetchone()
+                if row is None:
+                    return default
+                nodedata = nodedata_from_binary(nodeid, Buffer(bytes(row[0])))
+            self._cache[nodedata.nodeid] = nodedata
+            self._evict()
+            return nodedata
+
+    def __setitem__(self, nodeid, nodedata):
+        with self._lock:
+            self._pinned.pop(nodeid, None)
+            self._cache.pop(nodeid, None)
+            self._cache[nodeid] = nodedata
+            self._dirty.add(nodeid)
+            self._evict()
+            self._changed()
+
+    def __delitem__(self, nodeid):
+        with self._lock:
+            in_memory = self._cache.pop(nodeid, None) is not None
+            in_memory = self._pinned.pop(nodeid, None) is not None or in_memory
+            self._dirty.discard(nodeid)
+            cursor = self._conn.execute('DELETE FROM Nodes WHERE NodeId = ?', (self._key(nodeid),))
+            if not in_memory and cursor.rowcount == 0:
+                raise KeyError(nodeid)
+            self._changed()
+
+    def __contains__(self, nodeid):
+        with self._lock:
+            if nodeid in self._cache or nodeid in self._pinned:
+                return True
+            return self._conn.execute('SELECT 1 FROM Nodes WHERE NodeId = ?',
+                                      (self._key(nodeid),)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            self._write_dirty()
+            return self._conn.execute('SELECT COUNT(*) FROM Nodes').fetchone()[0]
+
+    def keys(self, namespace=None):
+        with self._lock:
+            self._write_dirty()
+            rows = self._select('SELECT NodeId FROM Nodes', namespace)
+            return [nodeid_from_binary(Buffer(bytes(row[0]))) for row in rows]
+
+    def items(self, namespace=None):
+        # nodes which are not in memory are decoded without being added to the cache
+        with self._lock:
+            self._write_dirty()
+            rows = self._select('SELECT NodeId, Data FROM Nodes', namespace).fetchall()
+            in_memory = dict(self._pinned)
+            in_memory.update(self._cache)
+        for key, data in rows:
+            nodeid = nodeid_from_binary(Buffer(bytes(key)))
+            nodedata = in_memory.get(nodeid)
+            if nodedata is None:
+                nodedata = nodedata_from_binary(nodeid, Buffer(bytes(data)))
+            yield nodeid, nodedata
+
+    def node_changed(self, nodedata):
+        with self._lock:
+            nodeid = nodedata.nodeid
+            if self._cache.get(nodeid) is not nodedata:
+                # the node left the cache since it was got, the modified copy is now the current one
+                self._pinned.pop(nodeid, None)
+                self._cache.pop(nodeid, None)
+                self._cache[nodeid] = nodedata
+                self._evict()
+            self._dirty.add(nodeid)
+            self._changed()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def _changed(self):
+        # to be called with the lock held after a node is changed
+        self._changes += 1
+        if self._changes >= self._commit_size or monotonic() - self._last_commit >= self._commit_interval:
+            self._commit()
+
+    def _commit(self):
+        self._write_dirty()
+        self._conn.commit()
+        self._changes = 0
+        self._last_commit = monotonic()
+
+    def _write_dirty(self):
+        if not self._dirty:
+            return
+        rows = []
+        for nodeid in self._dirty:
+            nodedata = self._cache.get(nodeid)
+            if nodedata is None:
+                nodedata = self._pinned[nodeid]
+            rows.append((self._key(nodeid), self._encode(nodedata), nodeid.NamespaceIndex))
+        self._conn.executemany(self._INSERT, rows)
+        self._dirty.clear()
+
+    def _evict(self):
+        while len(self._cache) > self._cache_size:
+            nodeid, nodedata = self._cache.popitem(last=False)
+            if nodeid in self._dirty:
+                self._conn.execute(self._INSERT, (self._key(nodeid), self._encode(nodedata), nodeid.NamespaceIndex))
+                self._dirty.discard(nodeid)
+            if self._has_callbacks(nodedata):
+                self._pinned[nodeid] = nodedata
+
+    _INSERT = 'INSERT OR REPLACE INTO Nodes (NodeId, Data, NamespaceIndex) VALUES (?, ?, ?)'
+
+    def _select(self, query, namespace):
+        if namespace is None:
+            return self._conn.execute(query)
+        return self._conn.execute(query + ' WHERE NamespaceIndex = ?', (namespace,))
+
+    @staticmethod
+    def _has_callbacks(nodedata):
+        if nodedata.call is not None:
+            return True
+        for attval in nodedata.attributes.values():
+            if attval.value_callback is not None or attval.datachange_callbacks:
+                return True
+        return False
+
+    @staticmethod
+    def _key(nodeid):
+        # equal nodeids may be encoded differently (TwoByte, FourByte or Numeric), only one is stored
+        nodeidtype = nodeid.NodeIdType
+        if nodeidtype in (ua.NodeIdType.TwoByte, ua.NodeIdType.FourByte):
+            nodeidtype = ua.NodeIdType.Numeric
+        return sqlite3.Binary(nodeid_to_binary(ua.NodeId(nodeid.Identifier, nodeid.NamespaceIndex, nodeidtype)))
+
+    @staticmethod
+    def _encode(nodedata):
+        buf = bytearray()
+        nodedata_to_binary(buf, nodedata)
+        return sqlite3.Binary(bytes(buf))
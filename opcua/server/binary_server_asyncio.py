@@ -38,7 +38,9 @@ class OPCUAProtocol(asyncio.Protocol):
         self.transport = transport
         self.processor = UaProcessor(self.iserver, self.transport)
         self.processor.set_policies(self.policies)
-        self.data = b""
+        self._buffered = []  # received data waiting for the rest of a message
+        self._buffered_size = 0
+        self._expected_size = 0
         self.iserver.asyncio_transports.append(transport)
         self.clients.append(self)
 
@@ -52,25 +54,37 @@ class OPCUAProtocol(asyncio.Protocol):
 
     def data_received(self, data):
         logger.debug("received %s bytes from socket", len(data))
-        if self.data:
-            data = self.data + data
-            self.data = b""
+        if self._buffered:
+            # a message is spanning several TCP segments, wait until we have
+            # all of it and only then concatenate the parts, once
+            self._buffered.append(data)
+            self._buffered_size += len(data)
+            if self._buffered_size < self._expected_size:
+                return
+            data = b"".join(self._buffered)
+            self._buffered = []
+            self._buffered_size = 0
         self._process_data(data)
 
+    def _wait_for_more(self, buf, expected_size):
+        logger.info("We did not receive enough data from client, waiting for more")
+        self._buffered = [buf.read(len(buf))]
+        self._buffered_size = len(self._buffered[0])
+        self._expected_size = expected_size
+
     def _process_data(self, data):
-        buf = ua.utils.Buffer(data)
+        # decode from a view on received data, only leaf values are copied
+        buf = ua.utils.Buffer(ua.utils.buffer_view(data))
         while True:
             try:
                 backup_buf = buf.copy()
                 try:
                     hdr = uabin.header_from_binary(buf)
                 except ua.utils.NotEnoughData:
-                    logger.info("We did not receive enough data from client, waiting for more")
-                    self.data = backup_buf.read(len(backup_buf))
+                    self._wait_for_more(backup_buf, ua.Header.max_size())
                     return
                 if len(buf) < hdr.body_size:
-                    logger.info("We did not receive enough data from client, waiting for more")
-                    self.data = backup_buf.read(len(backup_buf))
+                    self._wait_for_more(backup_buf, hdr.packet_size)
                     return
                 ret = self.processor.process(hdr, buf)
                 if not ret:
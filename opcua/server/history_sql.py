@@ -115,10 +115,8 @@ class HistorySQLite(HistoryStorageInterface):
                                            (start_time, end_time, limit,)):
 
                     # rebuild the data value object
-                    dv = ua.DataValue(variant_from_binary(Buffer(row[6])))
-                    dv.ServerTimestamp = row[1]
-                    dv.SourceTimestamp = row[2]
-                    dv.StatusCode = ua.StatusCode(row[3])
+                    dv = ua.DataValue.from_trusted(variant_from_binary(Buffer(row[6])), ua.StatusCode(row[3]),
+                                                   source_timestamp=row[2], server_timestamp=row[1])
 
                     results.append(dv)
 
@@ -39,7 +39,7 @@ class SessionState(Enum):
 
 class InternalServer(object):
 
-    def __init__(self, shelffile=None, parent=None, session_cls=None):
+    def __init__(self, shelffile=None, parent=None, session_cls=None, snapshotfile=None, nodestore=None):
         self.logger = logging.getLogger(__name__)
 
         self._parent = parent
@@ -56,7 +56,13 @@ class InternalServer(object):
         self.method_service = MethodService(self.aspace)
         self.node_mgt_service = NodeManagementService(self.aspace)
 
-        self.load_standard_address_space(shelffile)
+        if nodestore is not None and len(nodestore):
+            # nodes saved by a previous run of the server
+            self.aspace.set_node_store(nodestore)
+        else:
+            self.load_standard_address_space(shelffile, snapshotfile)
+            if nodestore is not None:
+                self.aspace.set_node_store(nodestore)
 
         self.loop = None
         self.asyncio_transports = []
@@ -86,7 +92,7 @@ class InternalServer(object):
     @property
     def local_discovery_service(self):
         if self._local_discovery_service is None:
-            self._local_discovery_service = LocalDiscoveryService(parent = self)
+            self._local_discovery_service = LocalDiscoveryService(parent=self)
             for edp in self.endpoints:
                 srvDesc = LocalDiscoveryService.ServerDescription(edp.Server)
                 self._local_discovery_service.add_server_description(srvDesc)
@@ -100,21 +106,45 @@ class InternalServer(object):
         ns_node = Node(self.isession, ua.NodeId(ua.ObjectIds.Server_NamespaceArray))
         ns_node.set_value(uries)
 
-    def load_standard_address_space(self, shelffile=None):
-        if (shelffile is not None) and (os.path.isfile(shelffile) or os.path.isfile(shelffile+".db")):
+    def load_standard_address_space(self, shelffile=None, snapshotfile=None):
+        if (snapshotfile is not None) and os.path.isfile(snapshotfile):
+            # import address space from snapshot, nodes are decoded when first accessed
+            self.aspace.load_aspace_snapshot(snapshotfile)
+        elif (shelffile is not None) and (os.path.isfile(shelffile) or os.path.isfile(shelffile+".db")):
             # import address space from shelf
             self.aspace.load_aspace_shelf(shelffile)
         else:
-            # import address space from code generated from xml
-            standard_address_space.fill_address_space(self.node_mgt_service)
+            if not self._load_standard_snapshot():
+                # import address space from code generated from xml
+                standard_address_space.fill_address_space(self.node_mgt_service)
             # import address space directly from xml, this has performance impact so disabled
             # importer = xmlimporter.XmlImporter(self.node_mgt_service)
             # importer.import_xml("/path/to/python-opcua/schemas/Opc.Ua.NodeSet2.xml", self)
 
-            # if a cache file was supplied a shelve of the standard address space can now be built for next start up
+            # if a cache file was supplied a shelve or snapshot of the standard address space
+            # can now be built for next start up
+            if snapshotfile:
+                self.aspace.make_aspace_snapshot(snapshotfile)
             if shelffile:
                 self.aspace.make_aspace_shelf(shelffile)
 
+    def _load_standard_snapshot(self):
+        """
+        Load the snapshot of the standard address space shipped with the package,
+        return False if it is missing or cannot be read
+        """
+        path = standard_address_space.SNAPSHOT_PATH
+        if not os.path.isfile(path):
+            return False
+        try:
+            self.aspace.load_aspace_snapshot(path)
+        except (ua.UaError, EnvironmentError, ValueError, TypeError) as ex:
+            # the address space is untouched when the snapshot cannot be opened
+            self.logger.warning("Could not load standard address space snapshot %s, building it from code: %s",
+                                path, ex)
+            return False
+        return True
+
     def _address_space_fixes(self):
         """
         Looks like the xml definition of address space has some error. This is a good place to fix them
@@ -181,12 +211,14 @@ class InternalServer(object):
         Node(self.isession, ua.NodeId(ua.ObjectIds.Server_ServerStatus_StartTime)).set_value(datetime.utcnow())
         if not self.disabled_clock:
             self._set_current_time()
+        self._flush_node_stores()
 
     def stop(self):
         self.logger.info("stopping internal server")
         self.isession.close_session()
         self.subscription_service.set_loop(None)
         self.history_manager.stop()
+        self.aspace.flush()
         if self.loop:
             self.loop.stop()
             # wait for ThreadLoop to finish before proceeding
@@ -201,6 +233,14 @@ class InternalServer(object):
         self.current_time_node.set_value(datetime.utcnow())
         self.loop.call_later(1, self._set_current_time)
 
+    def _flush_node_stores(self):
+        # commit the changes made since the last write to a node store, if any
+        try:
+            self.aspace.flush()
+        except Exception:
+            self.logger.exception("Error flushing the node stores")
+        self.loop.call_later(1, self._flush_node_stores)
+
     def get_new_channel_id(self):
         self._channel_id_counter += 1
         return self._channel_id_counter
@@ -283,6 +323,19 @@ class InternalServer(object):
         """
         self.aspace.set_attribute_value(nodeid, ua.AttributeIds.Value, datavalue)
 
+    def set_attribute_value_callback(self, nodeid, callback, attr=ua.AttributeIds.Value):
+        """
+        get the value of the Attribute from callback() instead of the stored value
+        """
+        return self.aspace.set_attribute_value_callback(nodeid, attr, callback)
+
+    def set_attribute_values(self, nodeids, datavalues, attr=ua.AttributeIds.Value):
+        """
+        directly write datavalues to the Attribute of several nodes at once, taking
+        the address space lock once and grouping the datachange notifications
+        """
+        return self.aspace.set_attribute_values([(nodeid, attr, dv) for nodeid, dv in zip(nodeids, datavalues)])
+
 
 class InternalSession(object):
     _counter = 10
@@ -2,6 +2,7 @@
 server side implementation of a subscription object
 """
 
+from collections import OrderedDict
 from threading import RLock
 import logging
 # import copy
@@ -10,17 +11,23 @@ import logging
 from opcua import ua
 
 
+_HAS_PROPERTY = ua.intern_nodeid(ua.NodeId(ua.ObjectIds.HasProperty))
+
+
 class MonitoredItemData(object):
 
     def __init__(self):
         self.client_handle = None
         self.callback_handle = None
+        self.nodeid = None
         self.monitored_item_id = None
         self.mode = None
         self.filter = None
         self.mvalue = MonitoredItemValues()
         self.where_clause_evaluator = None
         self.queue_size = 0
+        self.sampled = False
+        self.eu_range = None
 
 
 class MonitoredItemValues(object):
@@ -51,30 +58,28 @@ class MonitoredItemService(object):
         self.isub = isub
         self.aspace = aspace
         self._lock = RLock()
-        self._monitored_items = {}
-        self._monitored_events = {}
-        self._monitored_datachange = {}
+        self._monitored_items = {}  # mid: MonitoredItemData
+        self._monitored_events = {}  # event node: OrderedDict of mids
+        self._monitored_datachange = {}  # callback handle: mid
         self._monitored_item_counter = 111
 
     def delete_all_monitored_items(self):
-        self.delete_monitored_items([mdata.monitored_item_id for mdata in self._monitored_items.values()])
+        self.delete_monitored_items(list(self._monitored_items.keys()))
 
     def create_monitored_items(self, params):
         results = []
-        for item in params.ItemsToCreate:
-            with self._lock:
+        with self._lock:
+            for item in params.ItemsToCreate:
                 if item.ItemToMonitor.AttributeId == ua.AttributeIds.EventNotifier:
                     result = self._create_events_monitored_item(item)
                 else:
                     result = self._create_data_change_monitored_item(item)
-            results.append(result)
+                results.append(result)
         return results
 
     def modify_monitored_items(self, params):
-        results = []
-        for item in params.ItemsToModify:
-            results.append(self._modify_monitored_item(item))
-        return results
+        with self._lock:
+            return [self._modify_monitored_item(item) for item in params.ItemsToModify]
 
     def trigger_datachange(self, handle, nodeid, attr):
         self.logger.debug("triggering datachange for handle %s, nodeid %s, and attribute %s", handle, nodeid, attr)
@@ -83,17 +88,24 @@ class MonitoredItemService(object):
 
     def _modify_monitored_item(self, params):
         with self._lock:
-            for mdata in self._monitored_items.values():
-                result = ua.MonitoredItemModifyResult()
-                if mdata.monitored_item_id == params.MonitoredItemId:
-                    result.RevisedSamplingInterval = params.RequestedParameters.SamplingInterval
-                    result.RevisedQueueSize = params.RequestedParameters.QueueSize
-                    if params.RequestedParameters.Filter is not None:
-                        mdata.filter = params.RequestedParameters.Filter
-                    mdata.queue_size = params.RequestedParameters.QueueSize
-                    return result
             result = ua.MonitoredItemModifyResult()
-            result.StatusCode(ua.StatusCodes.BadMonitoredItemIdInvalid)
+            mdata = self._monitored_items.get(params.MonitoredItemId)
+            if mdata is None:
+                result.StatusCode = ua.StatusCode(ua.StatusCodes.BadMonitoredItemIdInvalid)
+                return result
+            result.RevisedSamplingInterval = params.RequestedParameters.SamplingInterval
+            result.RevisedQueueSize = params.RequestedParameters.QueueSize
+            if params.RequestedParameters.Filter is not None:
+                mdata.filter = params.RequestedParameters.Filter
+                if mdata.callback_handle is not None:
+                    mdata.eu_range = self._get_eu_range(mdata.filter, mdata.nodeid)
+            mdata.queue_size = params.RequestedParameters.QueueSize
+            if mdata.sampled:
+                sampler = self.isub.subservice.sampler
+                result.RevisedSamplingInterval = sampler.revise_interval(
+                    params.RequestedParameters.SamplingInterval, self.isub.data.RevisedPublishingInterval,
+                    self._get_minimum_sampling_interval(mdata.nodeid))
+                sampler.set_item_interval(mdata.callback_handle, result.RevisedSamplingInterval)
             return result
 
     def _commit_monitored_item(self, result, mdata):
@@ -131,10 +143,11 @@ class MonitoredItemService(object):
             return result
         # result.FilterResult = ua.EventFilterResult()  # spec says we can ignore if not error
         mdata.where_clause_evaluator = WhereClauseEvaluator(self.logger, self.aspace, mdata.filter.WhereClause)
+        mdata.nodeid = params.ItemToMonitor.NodeId
         self._commit_monitored_item(result, mdata)
-        if params.ItemToMonitor.NodeId not in self._monitored_events:
-            self._monitored_events[params.ItemToMonitor.NodeId] = []
-        self._monitored_events[params.ItemToMonitor.NodeId].append(result.MonitoredItemId)
+        if mdata.nodeid not in self._monitored_events:
+            self._monitored_events[mdata.nodeid] = OrderedDict()
+        self._monitored_events[mdata.nodeid][result.MonitoredItemId] = None
         return result
 
     def _create_data_change_monitored_item(self, params):
@@ -144,41 +157,86 @@ class MonitoredItemService(object):
 
         result, mdata = self._make_monitored_item_common(params)
         result.FilterResult = params.RequestedParameters.Filter
+        nodeid = params.ItemToMonitor.NodeId
+        attr = params.ItemToMonitor.AttributeId
         result.StatusCode, handle = self.aspace.add_datachange_callback(
-            params.ItemToMonitor.NodeId, params.ItemToMonitor.AttributeId, self.datachange_callback)
+            nodeid, attr, self.datachange_callback, self.datachanges_callback)
 
         self.logger.debug("adding callback return status %s and handle %s", result.StatusCode, handle)
         mdata.callback_handle = handle
+        mdata.nodeid = nodeid
         self._commit_monitored_item(result, mdata)
         if result.StatusCode.is_good():
             self._monitored_datachange[handle] = result.MonitoredItemId
-            # force data change event generation
-            self.trigger_datachange(handle, params.ItemToMonitor.NodeId, params.ItemToMonitor.AttributeId)
+            mdata.eu_range = self._get_eu_range(mdata.filter, nodeid)
+            if self.aspace.has_value_callback(nodeid, attr):
+                # the value is not written to the address space, it must be sampled
+                result.RevisedSamplingInterval = self._add_sampled_item(
+                    mdata, nodeid, attr, params.RequestedParameters.SamplingInterval)
+            else:
+                # force data change event generation
+                self.trigger_datachange(handle, nodeid, attr)
         return result
 
+    def _add_sampled_item(self, mdata, nodeid, attr, requested_interval):
+        sampler = self.isub.subservice.sampler
+        interval = sampler.revise_interval(requested_interval, self.isub.data.RevisedPublishingInterval,
+                                           self._get_minimum_sampling_interval(nodeid))
+        value = self.aspace.get_attribute_value(nodeid, attr)
+        sampler.add_item(mdata.callback_handle, nodeid, attr, interval, self.datachanges_callback, value)
+        mdata.sampled = True
+        self.datachange_callback(mdata.callback_handle, value)
+        return interval
+
+    def _get_minimum_sampling_interval(self, nodeid):
+        dv = self.aspace.get_attribute_value(nodeid, ua.AttributeIds.MinimumSamplingInterval)
+        if dv.StatusCode.is_good() and isinstance(dv.Value.Value, (int, float)):
+            return dv.Value.Value
+        return None
+
+    def _get_eu_range(self, flt, nodeid):
+        """
+        return the EURange property of the node used by percent deadband filters or None
+        """
+        if not isinstance(flt, ua.DataChangeFilter) or flt.DeadbandType != ua.DeadbandType.Percent:
+            return None
+        node = self.aspace.get(nodeid)
+        if node is None:
+            return None
+        for ref in node.references:
+            if ref.IsForward and ref.ReferenceTypeId == _HAS_PROPERTY and \
+                    ref.BrowseName.Name == "EURange":
+                eu_range = self.aspace.get_attribute_value(ref.NodeId, ua.AttributeIds.Value).Value.Value
+                if isinstance(eu_range, ua.Range):
+                    return eu_range
+        return None
+
     def delete_monitored_items(self, ids):
         self.logger.debug("delete monitored items %s", ids)
         with self._lock:
-            results = []
-            for mid in ids:
-                results.append(self._delete_monitored_items(mid))
+            handles = []
+            results = [self._delete_monitored_items(mid, handles) for mid in ids]
+            self.aspace.delete_datachange_callbacks(handles)
             return results
 
-    def _delete_monitored_items(self, mid):
-        if mid not in self._monitored_items:
+    def _delete_monitored_items(self, mid, handles):
+        """
+        forget monitored item mid, the datachange callback handle to delete from the address space
+        is appended to handles
+        """
+        mdata = self._monitored_items.pop(mid, None)
+        if mdata is None:
             return ua.StatusCode(ua.StatusCodes.BadMonitoredItemIdInvalid)
-        for k, v in self._monitored_events.items():
-            if mid in v:
-                v.remove(mid)
-                if not v:
-                    self._monitored_events.pop(k)
-                break
-        for k, v in self._monitored_datachange.items():
-            if v == mid:
-                self.aspace.delete_datachange_callback(k)
-                self._monitored_datachange.pop(k)
-                break
-        self._monitored_items.pop(mid)
+        if mdata.callback_handle is None:
+            mids = self._monitored_events[mdata.nodeid]
+            del mids[mid]
+            if not mids:
+                del self._monitored_events[mdata.nodeid]
+        else:
+            del self._monitored_datachange[mdata.callback_handle]
+            if mdata.sampled:
+                self.isub.subservice.sampler.remove_item(mdata.callback_handle)
+            handles.append(mdata.callback_handle)
         return ua.StatusCode()
 
     def datachange_callback(self, handle, value, error=None):
@@ -189,29 +247,57 @@ class MonitoredItemService(object):
         else:
             self.logger.info("subscription %s: datachange callback called with handle '%s' and value '%s'", self,
                              handle, value.Value)
-            event = ua.MonitoredItemNotification()
             with self._lock:
-                mid = self._monitored_datachange[handle]
-                mdata = self._monitored_items[mid]
-                mdata.mvalue.set_current_value(value.Value.Value)
-                if mdata.filter:
-                    deadband_flag_pass = self.deadband_callback(mdata.mvalue, mdata.filter)
-                else:
-                    deadband_flag_pass = True
-                if deadband_flag_pass:
-                    event.ClientHandle = mdata.client_handle
-                    event.Value = value
-                    self.isub.enqueue_datachange_event(mid, event, mdata.queue_size)
-
-    def deadband_callback(self, values, flt):
+                event = self._make_datachange_event(handle, value)
+                if event is not None:
+                    self.isub.enqueue_datachange_event(*event)
+
+    def datachanges_callback(self, changes):
+        """
+        called by the address space with the (handle, value) of several datachanges at once
+        """
+        self.logger.debug("subscription %s: datachanges callback called with %s values", self, len(changes))
+        events = []
+        with self._lock:
+            for handle, value in changes:
+                event = self._make_datachange_event(handle, value)
+                if event is not None:
+                    events.append(event)
+            self.isub.enqueue_datachange_events(events)
+
+    def _make_datachange_event(self, handle, value):
+        """
+        return the (monitored item id, notification, queue size) to enqueue for a datachange or None
+        """
+        mid = self._monitored_datachange.get(handle)
+        if mid is None:
+            # monitored item deleted since the value was set
+            return None
+        mdata = self._monitored_items[mid]
+        mdata.mvalue.set_current_value(value.Value.Value)
+        if mdata.filter and not self.deadband_callback(mdata.mvalue, mdata.filter, mdata.eu_range):
+            # compare the next values to the last reported one, not to this one,
+            # or a slow drift would never be reported
+            mdata.mvalue.current_value = mdata.mvalue.old_value
+            return None
+        # the default DataValue created by __init__ would be replaced at once
+        event = ua.MonitoredItemNotification.__new__(ua.MonitoredItemNotification)
+        event.ClientHandle = mdata.client_handle
+        event.Value = value
+        return mid, event, mdata.queue_size
+
+    def deadband_callback(self, values, flt, eu_range=None):
         if flt.DeadbandType == ua.DeadbandType.None_ or values.get_old_value() is None:
             return True
         elif flt.DeadbandType == ua.DeadbandType.Absolute and \
                 ((abs(values.get_current_value() - values.get_old_value())) > flt.DeadbandValue):
             return True
         elif flt.DeadbandType == ua.DeadbandType.Percent:
-            self.logger.warn("DeadbandType Percent is not implemented !")
-            return True
+            if eu_range is None:
+                self.logger.warning("DeadbandType Percent needs an EURange property, reporting all changes")
+                return True
+            deadband = flt.DeadbandValue / 100.0 * (eu_range.High - eu_range.Low)
+            return abs(values.get_current_value() - values.get_old_value()) > deadband
         else:
             return False
 
@@ -247,18 +333,21 @@ class MonitoredItemService(object):
 
 class InternalSubscription(object):
 
-    def __init__(self, subservice, data, addressspace, callback):
+    def __init__(self, subservice, data, addressspace, callback, max_notifications=0):
         self.logger = logging.getLogger(__name__)
         self.aspace = addressspace
         self.subservice = subservice
         self.data = data
         self.callback = callback
+        self.max_notifications = max_notifications  # per NotificationMessage, 0 for no limit
         self.monitored_item_srv = MonitoredItemService(self, addressspace)
         self.task = None
         self._lock = RLock()
-        self._triggered_datachanges = {}
-        self._triggered_events = {}
+        # queued notifications per monitored item, the items served last are at the end
+        self._triggered_datachanges = OrderedDict()
+        self._triggered_events = OrderedDict()
         self._triggered_statuschanges = []
+        self._odd_slot_to_events = False  # alternates when a limited message is split between both queues
         self._notification_seq = 1
         self._not_acknowledged_results = {}
         self._startup = True
@@ -285,9 +374,13 @@ class InternalSubscription(object):
 
     def _subscription_loop(self):
         if not self._stopev:
-            self.subservice.loop.call_later(self.data.RevisedPublishingInterval / 1000.0, self._sub_loop)
+            self.subservice.timer_wheel.schedule(self, self.data.RevisedPublishingInterval / 1000.0)
 
-    def _sub_loop(self):
+    def publish_cycle(self):
+        """
+        called by the timer wheel of the subscription service every publishing interval,
+        publish the notifications or count keep-alive and lifetime
+        """
         if self._stopev:
             return
         self.publish_results()
@@ -295,7 +388,7 @@ class InternalSubscription(object):
 
     def has_published_results(self):
         with self._lock:
-            if self._startup or self._triggered_datachanges or self._triggered_events:
+            if self._startup or self._has_queued_notifications():
                 return True
             if self._keep_alive_count > self.data.RevisedMaxKeepAliveCount:
                 self.logger.debug("keep alive count %s is > than max keep alive count %s, sending publish event",
@@ -323,8 +416,19 @@ class InternalSubscription(object):
     def _pop_publish_result(self):
         result = ua.PublishResult()
         result.SubscriptionId = self.data.SubscriptionId
-        self._pop_triggered_datachanges(result)
-        self._pop_triggered_events(result)
+        limit = self.max_notifications or None
+        datachange_limit = limit
+        if limit is not None and self._triggered_events:
+            # a flood of datachanges leaves at least half of the message to events, the odd slot
+            # goes to each queue in turn so that events are also published with a limit of 1
+            events_share = limit // 2
+            if limit % 2 and self._triggered_datachanges:
+                if self._odd_slot_to_events:
+                    events_share += 1
+                self._odd_slot_to_events = not self._odd_slot_to_events
+            datachange_limit = limit - min(events_share, self._count(self._triggered_events))
+        nb = self._pop_triggered_datachanges(result, datachange_limit)
+        self._pop_triggered_events(result, None if limit is None else limit - nb)
         self._pop_triggered_statuschanges(result)
         self._keep_alive_count = 0
         self._startup = False
@@ -332,26 +436,68 @@ class InternalSubscription(object):
         if len(result.NotificationMessage.NotificationData) != 0:
             self._notification_seq += 1
             self._not_acknowledged_results[result.NotificationMessage.SequenceNumber] = result
-        result.MoreNotifications = False
+        result.MoreNotifications = self._has_queued_notifications()
         result.AvailableSequenceNumbers = list(self._not_acknowledged_results.keys())
         return result
 
-    def _pop_triggered_datachanges(self, result):
-        if self._triggered_datachanges:
+    def _has_queued_notifications(self):
+        return bool(self._triggered_datachanges or self._triggered_events or self._triggered_statuschanges)
+
+    def _pop_triggered_datachanges(self, result, limit):
+        if self._triggered_datachanges and limit != 0:
             notif = ua.DataChangeNotification()
-            notif.MonitoredItems = [item for sublist in self._triggered_datachanges.values() for item in sublist]
-            self._triggered_datachanges = {}
+            notif.MonitoredItems = self._pop_notifications(self._triggered_datachanges, limit)
             self.logger.debug("sending datachanges notification with %s events", len(notif.MonitoredItems))
             result.NotificationMessage.NotificationData.append(notif)
+            return len(notif.MonitoredItems)
+        return 0
 
-    def _pop_triggered_events(self, result):
-        if self._triggered_events:
+    def _pop_triggered_events(self, result, limit):
+        if self._triggered_events and limit != 0:
             notif = ua.EventNotificationList()
-            notif.Events = [item for sublist in self._triggered_events.values() for item in sublist]
-            self._triggered_events = {}
+            notif.Events = self._pop_notifications(self._triggered_events, limit)
             result.NotificationMessage.NotificationData.append(notif)
             self.logger.debug("sending event notification with %s events", len(notif.Events))
 
+    @staticmethod
+    def _count(queue):
+        return sum(len(notifications) for notifications in queue.values())
+
+    @staticmethod
+    def _pop_notifications(queue, limit):
+        """
+        pop at most limit notifications from queue, None for no limit, taking them in turn
+        from each monitored item: the first notification of every item, then the second...
+        The items not served come first in the queue for the next message, then the items
+        with notifications left
+        """
+        if limit is None or InternalSubscription._count(queue) <= limit:
+            notifications = [item for sublist in queue.values() for item in sublist]
+            queue.clear()
+            return notifications
+        notifications = []
+        served = OrderedDict()  # mid: number of notifications popped
+        depth = 0
+        active = list(queue.items())
+        while len(notifications) < limit:
+            deeper = []
+            for mid, sublist in active:
+                notifications.append(sublist[depth])
+                served[mid] = depth + 1
+                if len(notifications) == limit:
+                    break
+                if depth + 1 < len(sublist):
+                    deeper.append((mid, sublist))
+            active = deeper
+            depth += 1
+        # the items served one time less, when the limit was reached in the middle
+        # of a round, go before the others. sorted() is stable and keeps the round order
+        for mid, nb in sorted(served.items(), key=lambda entry: entry[1]):
+            sublist = queue.pop(mid)
+            if nb < len(sublist):
+                queue[mid] = sublist[nb:]
+        return notifications
+
     def _pop_triggered_statuschanges(self, result):
         if self._triggered_statuschanges:
             notif = ua.StatusChangeNotification()
@@ -365,6 +511,10 @@ class InternalSubscription(object):
             self._publish_cycles_count = 0
             for nb in acks:
                 self._not_acknowledged_results.pop(nb, None)
+            if acks and self._has_queued_notifications() and self.subservice.loop is not None:
+                # the client got a message with MoreNotifications, send the next one
+                # without waiting for the publishing interval
+                self.subservice.loop.call_soon(self.publish_results)
 
     def republish(self, nb):
         self.logger.info("re-publish request for ack %s in subscription %s", nb, self)
@@ -380,6 +530,17 @@ class InternalSubscription(object):
     def enqueue_datachange_event(self, mid, eventdata, maxsize):
         self._enqueue_event(mid, eventdata, maxsize, self._triggered_datachanges)
 
+    def enqueue_datachange_events(self, events):
+        """
+        enqueue a list of (mid, eventdata, maxsize) datachanges taking the lock once
+        """
+        with self._lock:
+            triggered = False
+            for mid, eventdata, size in events:
+                triggered = self._enqueue(mid, eventdata, size, self._triggered_datachanges) or triggered
+            if triggered:
+                self._trigger_publish()
+
     def enqueue_event(self, mid, eventdata, maxsize):
         self._enqueue_event(mid, eventdata, maxsize, self._triggered_events)
 
@@ -389,14 +550,22 @@ class InternalSubscription(object):
 
     def _enqueue_event(self, mid, eventdata, size, queue):
         with self._lock:
-            if mid not in queue:
-                queue[mid] = [eventdata]
+            if self._enqueue(mid, eventdata, size, queue):
                 self._trigger_publish()
-                return
-            if size != 0:
-                if len(queue[mid]) >= size:
-                    queue[mid].pop(0)
-            queue[mid].append(eventdata)
+
+    @staticmethod
+    def _enqueue(mid, eventdata, size, queue):
+        """
+        add eventdata to the queue of mid, return True if the queue was empty
+        """
+        if mid not in queue:
+            queue[mid] = [eventdata]
+            return True
+        if size != 0:
+            if len(queue[mid]) >= size:
+                queue[mid].pop(0)
+        queue[mid].append(eventdata)
+        return False
 
 
 class WhereClauseEvaluator(object):
@@ -460,22 +629,22 @@ class WhereClauseEvaluator(object):
 
     def _eval_op(self, op, event):
         # seems spec says we should return Null if issues
-        if type(op) is ua.ElementOperand:
+        if isinstance(op, ua.ElementOperand):
             return self._eval_el(op.Index, event)
-        elif type(op) is ua.AttributeOperand:
+        elif isinstance(op, ua.AttributeOperand):
             if op.BrowsePath:
                 return getattr(event, op.BrowsePath.Elements[0].TargetName.Name)
             else:
                 return self._aspace.get_attribute_value(event.EventType, op.AttributeId).Value.Value
             # FIXME: check, this is probably broken
-        elif type(op) is ua.SimpleAttributeOperand:
+        elif isinstance(op, ua.SimpleAttributeOperand):
             if op.BrowsePath:
                 # we only support depth of 1
                 return getattr(event, op.BrowsePath[0].Name)
             else:
                 # TODO: write code for index range.... but doe it make any sense
                 return self._aspace.get_attribute_value(event.EventType, op.AttributeId).Value.Value
-        elif type(op) is ua.LiteralOperand:
+        elif isinstance(op, ua.LiteralOperand):
             return op.Value.Value
         else:
             self.logger.warning("Where clause element % is not of a known type", op)
@@ -0,0 +1,160 @@
+"""
+server side sampling of the attributes whose value is got from a value callback
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+
+from opcua.common.utils import monotonic
+from opcua.ua.ua_binary import CachedDataValue
+
+
+class _Source(object):
+    """
+    an attribute of a node sampled for one or more monitored items
+    """
+
+    def __init__(self, nodeid, attr, value):
+        self.nodeid = nodeid
+        self.attr = attr
+        self.value = value  # last sampled DataValue
+        self.items = {}  # handle: datachanges callback
+
+
+class _SamplingGroup(object):
+    """
+    the sources sampled at the same interval
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.sources = {}  # (nodeid, attr): _Source
+
+
+class SamplingEngine(object):
+    """
+    Sample the attributes whose value is got from a value callback, for the monitored
+    items of all subscriptions. Other attributes are reported by the address space
+    when they are written and do not need sampling.
+    Monitored items are grouped by sampling interval, at each tick of a group every source
+    (node and attribute) is read once whatever the number of monitored items on it,
+    and changed values are passed to the datachanges callback of the items, one call per subscription.
+    Sampling runs in its own thread since value callbacks may be slow.
+    """
+
+    min_interval = 50.0  # fastest sampling interval in milliseconds
+
+    def __init__(self, aspace):
+        self.logger = logging.getLogger(__name__)
+        self.aspace = aspace
+        self._cond = threading.Condition()
+        self._groups = {}  # interval: _SamplingGroup
+        self._handles = {}  # handle: (group, source)
+        self._ticks = []  # heap of (time, sequence, group)
+        self._sequence = itertools.count()
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="SamplingEngine")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._cond.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def revise_interval(self, requested, publishing_interval, minimum=None):
+        """
+        Return the sampling interval to use for a requested one: a negative interval means
+        the publishing interval, the interval is at least min_interval and minimum,
+        the MinimumSamplingInterval attribute of the node if any
+        """
+        interval = publishing_interval if requested < 0 else requested
+        return max(interval, self.min_interval, minimum or 0.0)
+
+    def add_item(self, handle, nodeid, attr, interval, callback, value):
+        """
+        Sample the attribute every interval milliseconds for the monitored item handle,
+        callback is called with a list of (handle, DataValue) of the changed values.
+        value is the current DataValue, already reported to the monitored item
+        """
+        with self._cond:
+            group = self._groups.get(interval)
+            if group is None:
+                group = self._groups[interval] = _SamplingGroup(interval)
+                heapq.heappush(self._ticks, (monotonic() + interval / 1000.0, next(self._sequence), group))
+                self._cond.notify()
+            source = group.sources.get((nodeid, attr))
+            if source is None:
+                source = group.sources[(nodeid, attr)] = _Source(nodeid, attr, value)
+            source.items[handle] = callback
+            self._handles[handle] = (group, source)
+
+    def set_item_interval(self, handle, interval):
+        with self._cond:
+            entry = self._handles.get(handle)
+            if entry is None or entry[0].interval == interval:
+                return
+            group, source = entry
+            callback = source.items[handle]
+            self.remove_item(handle)
+            self.add_item(handle, source.nodeid, source.attr, interval, callback, source.value)
+
+    def remove_item(self, handle):
+        with self._cond:
+            entry = self._handles.pop(handle, None)
+            if entry is None:
+                return
+            group, source = entry
+            del source.items[handle]
+            if not source.items:
+                del group.sources[(source.nodeid, source.attr)]
+                if not group.sources:
+                    # its pending tick is skipped
+                    del self._groups[group.interval]
+
+    def _run(self):
+        me = threading.current_thread()
+        while True:
+            with self._cond:
+                while self._thread is me and (not self._ticks or self._ticks[0][0] > monotonic()):
+                    self._cond.wait(self._ticks[0][0] - monotonic() if self._ticks else None)
+                if self._thread is not me:
+                    return
+                deadline, _, group = heapq.heappop(self._ticks)
+                if self._groups.get(group.interval) is not group:
+                    continue
+                # when sampling is late the missed ticks are skipped
+                deadline = max(deadline + group.interval / 1000.0, monotonic())
+                heapq.heappush(self._ticks, (deadline, next(self._sequence), group))
+                sources = list(group.sources.values())
+            self._sample(sources)
+
+    def _sample(self, sources):
+        changes = {}  # callback: [(handle, DataValue)]
+        for source in sources:
+            try:
+                value = self.aspace.get_attribute_value(source.nodeid, source.attr)
+            except Exception:
+                self.logger.exception("Error sampling attribute %s of node %s", source.attr, source.nodeid)
+                continue
+            old = source.value
+            if old is not None and old.StatusCode == value.StatusCode and old.Value == value.Value:
+                continue
+            # the notifications of all items share the value and its encoding
+            source.value = value = CachedDataValue.from_datavalue(value)
+            for handle, callback in list(source.items.items()):
+                changes.setdefault(callback, []).append((handle, value))
+        for callback, values in changes.items():
+            try:
+                callback(values)
+            except Exception:
+                self.logger.exception("Error calling datachanges callback %s", callback)
@@ -26,7 +26,7 @@ from opcua.common.shortcuts import Shortcuts
 from opcua.common.structures import load_type_definitions, load_enums
 from opcua.common.xmlexporter import XmlExporter
 from opcua.common.xmlimporter import XmlImporter
-from opcua.common.ua_utils import get_nodes_of_namespace
+from opcua.common.ua_utils import get_nodes_of_namespace, value_to_datavalue
 use_crypto = True
 try:
     from opcua.crypto import uacrypto
@@ -59,6 +59,16 @@ class Server(object):
     cache file or the file will be created if it does not exist yet.
     As a result the first startup will be even slower due to the cache file
     generation but all further start ups will be significantly faster.
+    The snapshotfile parameter works the same way with a binary snapshot file,
+    which is memory mapped and decoded lazily, node by node, when first accessed.
+    Unlike the shelve cache file, the snapshot is faster to load and the nodes
+    of the standard address space can be modified. If schemas/generate_address_space.py
+    bundled a snapshot with the package, it is used when neither file is given.
+
+    To keep a large address space out of memory and persist the nodes and values
+    created by the application, pass a node store, for example
+    opcua.server.address_space_sql.NodeStoreSQLite. The store is filled on first start
+    and used as is on later starts, changes are saved when the server is stopped.
 
     :ivar product_uri:
     :vartype product_uri: uri
@@ -75,7 +85,7 @@ class Server(object):
 
     """
 
-    def __init__(self, shelffile=None, iserver=None):
+    def __init__(self, shelffile=None, iserver=None, snapshotfile=None, nodestore=None):
         self.logger = logging.getLogger(__name__)
         self.endpoint = urlparse("opc.tcp://0.0.0.0:4840/freeopcua/server/")
         self._application_uri = "urn:freeopcua:python:server"
@@ -87,7 +97,8 @@ class Server(object):
         if iserver is not None:
             self.iserver = iserver
         else:
-            self.iserver = InternalServer(shelffile = shelffile, parent = self)
+            self.iserver = InternalServer(shelffile=shelffile, parent=self, snapshotfile=snapshotfile,
+                                          nodestore=nodestore)
         self.bserver = None
         self._policies = []
         self.nodes = Shortcuts(self.iserver.isession)
@@ -102,7 +113,7 @@ class Server(object):
         # enable all endpoints by default
         self.certificate = None
         self.private_key = None
-        self.user_manager = UserManager(parent = self)
+        self.user_manager = UserManager(parent=self)
         self._security_policy = [
                         ua.SecurityPolicyType.NoSecurity,
                         ua.SecurityPolicyType.Basic256Sha256_SignAndEncrypt,
@@ -624,3 +635,26 @@ class Server(object):
         so it is a little faster
         """
         return self.iserver.set_attribute_value(nodeid, datavalue, attr)
+
+    def set_attribute_value_callback(self, nodeid, callback, attr=ua.AttributeIds.Value):
+        """
+        Get the value of the Attribute from callback(), which returns a DataValue,
+        instead of the stored value, for values read from a device on demand.
+        Monitored items on the Attribute are sampled at their sampling interval.
+        Pass None as callback to use the stored value again
+        """
+        self.iserver.set_attribute_value_callback(nodeid, callback, attr).check()
+
+    def set_values(self, nodes, values):
+        """
+        Write the values of several nodes at once, counterpart of Client.set_values.
+        nodes are Node objects or NodeIds, values are python values, Variants or DataValues,
+        pass DataValues to set the timestamps.
+        The values are set under one lock of the address space and datachange notifications
+        are grouped per subscription, which is much faster than calling set_value for each node
+        """
+        nodeids = [node.nodeid if isinstance(node, Node) else node for node in nodes]
+        dvs = [value_to_datavalue(val) for val in values]
+        results = self.iserver.set_attribute_values(nodeids, dvs)
+        for result in results:
+            result.check()
@@ -3,14 +3,11 @@ import os.path
 
 import opcua
 
-from opcua.server.standard_address_space.standard_address_space_part3 import create_standard_address_space_Part3
-from opcua.server.standard_address_space.standard_address_space_part4 import create_standard_address_space_Part4
-from opcua.server.standard_address_space.standard_address_space_part5 import create_standard_address_space_Part5
-from opcua.server.standard_address_space.standard_address_space_part8 import create_standard_address_space_Part8
-from opcua.server.standard_address_space.standard_address_space_part9 import create_standard_address_space_Part9
-from opcua.server.standard_address_space.standard_address_space_part10 import create_standard_address_space_Part10
-from opcua.server.standard_address_space.standard_address_space_part11 import create_standard_address_space_Part11
-from opcua.server.standard_address_space.standard_address_space_part13 import create_standard_address_space_Part13
+
+# snapshot of the standard address space shipped with the package, regenerated with this
+# module by schemas/generate_address_space.py. It is used instead of fill_address_space
+# when it exists and can be read
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "standard_address_space.snapshot")
 
 class PostponeReferences(object):
     def __init__(self, server):
@@ -39,6 +36,15 @@ class PostponeReferences(object):
             assert len(remaining_refs) == 0, remaining_refs
 
 def fill_address_space(nodeservice):
+    # the generated modules are big and slow to import, they are not needed when starting from a snapshot
+    from opcua.server.standard_address_space.standard_address_space_part3 import create_standard_address_space_Part3
+    from opcua.server.standard_address_space.standard_address_space_part4 import create_standard_address_space_Part4
+    from opcua.server.standard_address_space.standard_address_space_part5 import create_standard_address_space_Part5
+    from opcua.server.standard_address_space.standard_address_space_part8 import create_standard_address_space_Part8
+    from opcua.server.standard_address_space.standard_address_space_part9 import create_standard_address_space_Part9
+    from opcua.server.standard_address_space.standard_address_space_part10 import create_standard_address_space_Part10
+    from opcua.server.standard_address_space.standard_address_space_part11 import create_standard_address_space_Part11
+    from opcua.server.standard_address_space.standard_address_space_part13 import create_standard_address_space_Part13
     with PostponeReferences(nodeservice) as server:
         create_standard_address_space_Part3(server)
         create_standard_address_space_Part4(server)
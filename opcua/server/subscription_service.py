@@ -8,10 +8,16 @@ import logging
 from opcua import ua
 from opcua.common import utils
 from opcua.server.internal_subscription import InternalSubscription
+from opcua.server.sampling import SamplingEngine
+from opcua.server.timer_wheel import TimerWheel
 
 
 class SubscriptionService(object):
 
+    # limit of notifications in a NotificationMessage, applied when the client
+    # asks for no limit or for more, 0 for no limit
+    max_notifications_per_publish = 10000
+
     def __init__(self, aspace):
         self.logger = logging.getLogger(__name__)
         self.loop = None
@@ -19,9 +25,26 @@ class SubscriptionService(object):
         self.subscriptions = {}
         self._sub_id_counter = 77
         self._lock = RLock()
+        self.sampler = SamplingEngine(aspace)
+        self.timer_wheel = TimerWheel(self._publish_cycles)
 
     def set_loop(self, loop):
         self.loop = loop
+        self.timer_wheel.set_loop(loop)
+        if loop is None:
+            self.sampler.stop()
+        else:
+            self.sampler.start()
+
+    def _publish_cycles(self, subs):
+        """
+        called by the timer wheel with the subscriptions whose publishing interval elapsed
+        """
+        for sub in subs:
+            try:
+                sub.publish_cycle()
+            except Exception:
+                self.logger.exception("Error in publish cycle of %s", sub)
 
     def create_subscription(self, params, callback):
         self.logger.info("create subscription with callback: %s", callback)
@@ -33,19 +56,29 @@ class SubscriptionService(object):
             self._sub_id_counter += 1
             result.SubscriptionId = self._sub_id_counter
 
-            sub = InternalSubscription(self, result, self.aspace, callback)
+            sub = InternalSubscription(self, result, self.aspace, callback,
+                                       self._revise_max_notifications(params.MaxNotificationsPerPublish))
             sub.start()
             self.subscriptions[result.SubscriptionId] = sub
 
             return result
 
+    def _revise_max_notifications(self, requested):
+        if not requested:
+            return self.max_notifications_per_publish
+        if not self.max_notifications_per_publish:
+            return requested
+        return min(requested, self.max_notifications_per_publish)
+
     def modify_subscription(self, params, callback):
-        # Requested params are ignored, result = params set during create_subscription.
+        # Requested params are ignored except MaxNotificationsPerPublish,
+        # result = params set during create_subscription.
         self.logger.info("modify subscription with callback: %s", callback)
         result = ua.ModifySubscriptionResult()
         try:
             with self._lock:
                 sub = self.subscriptions[params.SubscriptionId]
+                sub.max_notifications = self._revise_max_notifications(params.MaxNotificationsPerPublish)
                 result.RevisedPublishingInterval = sub.data.RevisedPublishingInterval
                 result.RevisedLifetimeCount = sub.data.RevisedLifetimeCount
                 result.RevisedMaxKeepAliveCount = sub.data.RevisedMaxKeepAliveCount
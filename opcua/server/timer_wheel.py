@@ -0,0 +1,129 @@
+"""
+hashed timer wheel driving the publish cycles of the subscriptions
+"""
+
+import functools
+import logging
+import threading
+
+from opcua.common.utils import monotonic
+
+
+_NEVER = float("inf")
+
+
+class TimerWheel(object):
+    """
+    Hashed timer wheel running in the server loop. Instead of one loop timer per
+    subscription, the wheel has one loop timer set to the next tick with a due timer,
+    it does not wake up at the ticks with nothing to do. A timer due after n ticks goes
+    to slot (current tick + n) % size, at each tick the due timers of the slot are passed
+    together to callback(objs), which reschedules the ones it wants to run again.
+    Timers are rounded to the tick, and a late tick fires everything due since the last one.
+    """
+
+    tick = 0.01  # seconds
+    size = 512
+
+    def __init__(self, callback):
+        self.logger = logging.getLogger(__name__)
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._slots = [[] for _ in range(self.size)]
+        self._earliest = [_NEVER] * self.size  # earliest deadline of the timers of each slot
+        self._count = 0
+        self._position = 0  # number of the last processed tick
+        self._start = monotonic()  # monotonic time of tick 0, the clock of the loop
+        self._loop = None
+        self._running = False
+        self._wakeup = 0  # number of the tick the loop timer is set to, while running
+        self._generation = 0
+
+    def set_loop(self, loop):
+        """
+        set the ThreadLoop running the wheel, None stops it
+        """
+        with self._lock:
+            self._loop = loop
+            self._generation += 1
+            self._running = False
+            self._start = monotonic() - self._position * self.tick
+            self._start_ticks()
+
+    def schedule(self, obj, delay):
+        """
+        pass obj to the callback in delay seconds, at least one tick
+        """
+        ticks = max(1, int(round(delay / self.tick)))
+        with self._lock:
+            if not self._running:
+                # idle wheel, its ticks restart from now
+                self._start = monotonic() - self._position * self.tick
+            deadline = self._position + ticks
+            index = deadline % self.size
+            self._slots[index].append((deadline, obj))
+            self._earliest[index] = min(self._earliest[index], deadline)
+            self._count += 1
+            if self._running and deadline < self._wakeup:
+                # the loop timer is set too late, the pending one is ignored
+                self._generation += 1
+                self._running = False
+            self._start_ticks()
+
+    def __len__(self):
+        return self._count
+
+    def _start_ticks(self):
+        if self._running or self._loop is None or not self._count:
+            return
+        self._running = True
+        self._loop.call_later(self._next_tick_delay(), functools.partial(self._tick, self._generation))
+
+    def _next_tick_delay(self):
+        # sets the tick the loop timer is set to
+        self._wakeup = self._next_deadline()
+        return max(0.0, self._start + self._wakeup * self.tick - monotonic())
+
+    def _next_deadline(self):
+        # the next tick with a due timer, if there is none in the next turn of the wheel
+        # the end of the turn, the timers of the next turns are found then
+        earliest = self._earliest
+        for position in range(self._position + 1, self._position + 1 + self.size):
+            if earliest[position % self.size] <= position:
+                return position
+        return self._position + self.size
+
+    def _tick(self, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            target = int((monotonic() - self._start) / self.tick)
+            due = []
+            # when late by more than a turn every slot is visited once
+            for position in range(self._position + 1, self._position + 1 + min(target - self._position, self.size)):
+                index = position % self.size
+                slot = self._slots[index]
+                if slot:
+                    waiting = []
+                    for timer in slot:
+                        if timer[0] <= target:
+                            due.append(timer[1])
+                        else:
+                            waiting.append(timer)
+                    slot[:] = waiting
+                    self._earliest[index] = min([timer[0] for timer in waiting] or [_NEVER])
+            self._position = max(self._position, target)
+            self._count -= len(due)
+        if due:
+            try:
+                self.callback(due)
+            except Exception:
+                self.logger.exception("Error calling timer wheel callback %s", self.callback)
+        with self._lock:
+            if generation != self._generation:
+                return
+            if not self._count:
+                self._running = False
+                return
+            # we run in the loop thread, no need for the thread safe call_later of ThreadLoop
+            self._loop.loop.call_later(self._next_tick_delay(), functools.partial(self._tick, generation))
@@ -5,7 +5,7 @@ import time
 
 from opcua import ua
 from opcua.ua.ua_binary import nodeid_from_binary, struct_from_binary
-from opcua.ua.ua_binary import struct_to_binary, uatcp_to_binary
+from opcua.ua.ua_binary import write_struct, uatcp_to_binary
 from opcua.common import utils
 from opcua.common.connection import SecureConnection
 
@@ -43,8 +43,9 @@ class UaProcessor(object):
     def send_response(self, requesthandle, seqhdr, response, msgtype=ua.MessageType.SecureMessage):
         with self._socketlock:
             response.ResponseHeader.RequestHandle = requesthandle
-            data = self._connection.message_to_binary(
-                struct_to_binary(response), message_type=msgtype, request_id=seqhdr.RequestId)
+            body = bytearray()
+            write_struct(body, response)
+            data = self._connection.message_to_binary(body, message_type=msgtype, request_id=seqhdr.RequestId)
 
             self.socket.write(data)
 
@@ -9,9 +9,14 @@ import uuid
 from enum import IntEnum, Enum
 
 from opcua.ua.uaerrors import UaError
-from opcua.common.utils import Buffer
+from opcua.common.utils import Buffer, to_bytes
 from opcua import ua
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 if sys.version_info.major > 2:
     unicode = str
 
@@ -44,6 +49,10 @@ class _DateTime(object):
         epch = Primitives.Int64.unpack(data)
         return ua.win_epoch_to_datetime(epch)
 
+    @staticmethod
+    def write(buf, dt):
+        buf += _DateTime.pack(dt)
+
 
 class _Bytes(object):
     @staticmethod
@@ -58,7 +67,17 @@ class _Bytes(object):
         length = Primitives.Int32.unpack(data)
         if length == -1:
             return None
-        return data.read(length)
+        # data might be a view on the received message, make a copy
+        return to_bytes(data.read(length))
+
+    @staticmethod
+    def write(buf, data):
+        # append data directly, without building the length prefixed copy of pack
+        if data is None:
+            buf += b'\xff\xff\xff\xff'
+        else:
+            buf += Primitives.Int32.pack(len(data))
+            buf += data
 
 
 class _String(object):
@@ -75,14 +94,24 @@ class _String(object):
 
     @staticmethod
     def unpack(data):
-        b = _Bytes.unpack(data)
         if sys.version_info.major < 3:
             # return unicode(b)  #might be correct for python2 but would complicate tests for python3
-            return b
+            return _Bytes.unpack(data)
         else:
-            if b is None:
-                return b
-            return b.decode("utf-8")
+            length = Primitives.Int32.unpack(data)
+            if length == -1:
+                return None
+            # decode directly from the buffer, without an intermediate bytes object
+            return str(data.read(length), "utf-8")
+
+    @staticmethod
+    def write(buf, string):
+        if string is not None:
+            if sys.version_info.major > 2:
+                string = string.encode('utf-8')
+            elif isinstance(string, unicode):
+                string = string.encode('utf-8')
+        _Bytes.write(buf, string)
 
 
 class _Null(object):
@@ -94,6 +123,10 @@ class _Null(object):
     def unpack(data):
         return None
 
+    @staticmethod
+    def write(buf, data):
+        pass
+
 
 class _Guid(object):
     @staticmethod
@@ -117,12 +150,16 @@ class _Guid(object):
         f1 = struct.pack('>I', Primitives.UInt32.unpack(data))
         f2 = struct.pack('>H', Primitives.UInt16.unpack(data))
         f3 = struct.pack('>H', Primitives.UInt16.unpack(data))
-        f4 = data.read(8)
+        f4 = to_bytes(data.read(8))
         # concat byte fields
         b = f1 + f2 + f3 + f4
 
         return uuid.UUID(bytes=b)
 
+    @staticmethod
+    def write(buf, guid):
+        buf += _Guid.pack(guid)
+
 
 class _Primitive1(object):
     def __init__(self, fmt):
@@ -130,6 +167,8 @@ class _Primitive1(object):
         st = struct.Struct(fmt.format(1))
         self.size = st.size
         self.format = st.format
+        # struct format character, Struct.format is bytes before python 3.7
+        self.code = fmt[-1]
 
     def pack(self, data):
         return struct.pack(self.format, data)
@@ -137,6 +176,9 @@ class _Primitive1(object):
     def unpack(self, data):
         return struct.unpack(self.format, data.read(self.size))[0]
 
+    def write(self, buf, data):
+        buf += struct.pack(self.format, data)
+
     def pack_array(self, data):
         if data is None:
             return Primitives.Int32.pack(-1)
@@ -177,122 +219,96 @@ class Primitives(Primitives1):
 
 
 def pack_uatype(vtype, value):
-    if hasattr(Primitives, vtype.name):
-        return getattr(Primitives, vtype.name).pack(value)
-    elif vtype.value > 25:
-        return Primitives.Bytes.pack(value)
-    elif vtype == ua.VariantType.ExtensionObject:
-        return extensionobject_to_binary(value)
-    elif vtype in (ua.VariantType.NodeId, ua.VariantType.ExpandedNodeId):
-        return nodeid_to_binary(value)
-    elif vtype == ua.VariantType.Variant:
-        return variant_to_binary(value)
-    else:
-        return struct_to_binary(value)
+    return _vtype_packers.get(vtype, Primitives.Bytes.pack)(value)
 
 
 def unpack_uatype(vtype, data):
-    if hasattr(Primitives, vtype.name):
-        st = getattr(Primitives, vtype.name)
-        return st.unpack(data)
-    elif vtype.value > 25:
-        return Primitives.Bytes.unpack(data)
-    elif vtype == ua.VariantType.ExtensionObject:
-        return extensionobject_from_binary(data)
-    elif vtype in (ua.VariantType.NodeId, ua.VariantType.ExpandedNodeId):
-        return nodeid_from_binary(data)
-    elif vtype == ua.VariantType.Variant:
-        return variant_from_binary(data)
-    else:
-        if hasattr(ua, vtype.name):
-            klass = getattr(ua, vtype.name)
-            return struct_from_binary(klass, data)
-        else:
-            raise UaError("Cannot unpack unknown variant type {0!s}".format(vtype))
+    return _vtype_unpackers.get(vtype, Primitives.Bytes.unpack)(data)
 
 
 def pack_uatype_array(vtype, array):
-    if hasattr(Primitives1, vtype.name):
-        dataType = getattr(Primitives1, vtype.name)
-        return dataType.pack_array(array)
+    pack_array = _vtype_array_packers.get(vtype)
+    if pack_array is not None:
+        return pack_array(array)
     if array is None:
         return b'\xff\xff\xff\xff'
-    length = len(array)
-    b = [pack_uatype(vtype, val) for val in array]
-    b.insert(0, Primitives.Int32.pack(length))
-    return b"".join(b)
+    buf = bytearray(Primitives.Int32.pack(len(array)))
+    write = _vtype_writers.get(vtype, Primitives.Bytes.write)
+    for val in array:
+        write(buf, val)
+    return bytes(buf)
+
+
+def write_uatype(buf, vtype, value):
+    """
+    Append the binary encoding of value, of VariantType vtype, to the bytearray buf
+    """
+    _vtype_writers.get(vtype, Primitives.Bytes.write)(buf, value)
+
+
+def write_uatype_array(buf, vtype, array):
+    """
+    Append the binary encoding of an array of VariantType vtype to the bytearray buf
+    """
+    pack_array = _vtype_array_packers.get(vtype)
+    if pack_array is not None:
+        buf += pack_array(array)
+        return
+    if array is None:
+        buf += b'\xff\xff\xff\xff'
+        return
+    buf += Primitives.Int32.pack(len(array))
+    write = _vtype_writers.get(vtype, Primitives.Bytes.write)
+    for val in array:
+        write(buf, val)
 
 
 def unpack_uatype_array(vtype, data):
     length = Primitives.Int32.unpack(data)
     if length == -1:
         return None
-    elif hasattr(Primitives1, vtype.name):
-        dataType = getattr(Primitives1, vtype.name)
+    unpack_array = _vtype_array_unpackers.get(vtype)
+    if unpack_array is not None:
         # Remark: works without tuple conversion to list.
-        return list(dataType.unpack_array(data, length))
+        return list(unpack_array(data, length))
     else:
         # Revert to slow serial unpacking.
-        return [unpack_uatype(vtype, data) for _ in range(length)]
+        unpack = _vtype_unpackers.get(vtype, Primitives.Bytes.unpack)
+        return [unpack(data) for _ in range(length)]
 
 
 def struct_to_binary(obj):
-    packet = []
-    has_switch = hasattr(obj, "ua_switches")
-    if has_switch:
-        for name, switch in obj.ua_switches.items():
-            member = getattr(obj, name)
-            container_name, idx = switch
-            if member is not None:
-                container_val = getattr(obj, container_name)
-                container_val = container_val | 1 << idx
-                setattr(obj, container_name, container_val)
-    for name, uatype in obj.ua_types:
-        val = getattr(obj, name)
-        if uatype.startswith("ListOf"):
-            packet.append(list_to_binary(uatype[6:], val))
-        else:
-            if has_switch and val is None and name in obj.ua_switches:
-                pass
-            else:
-                packet.append(to_binary(uatype, val))
-    return b''.join(packet)
+    """
+    Pack a python object having a ua_types member to binary
+    """
+    buf = bytearray()
+    write_struct(buf, obj)
+    return bytes(buf)
+
+
+def write_struct(buf, obj):
+    """
+    Append the binary encoding of a python object having a ua_types member
+    to the bytearray buf, using the writer compiled for its class
+    """
+    try:
+        writer = _struct_writers[obj.__class__]
+    except KeyError:
+        writer = _get_struct_writer(obj.__class__)
+    writer(buf, obj)
 
 
 def to_binary(uatype, val):
     """
     Pack a python object to binary given a string defining its type
     """
-    if uatype.startswith("ListOf"):
-        #if isinstance(val, (list, tuple)):
-        return list_to_binary(uatype[6:], val)
-    elif isinstance(uatype, (str, unicode)) and hasattr(ua.VariantType, uatype):
-        vtype = getattr(ua.VariantType, uatype)
-        return pack_uatype(vtype, val)
-    elif isinstance(uatype, (str, unicode)) and hasattr(Primitives, uatype):
-        return getattr(Primitives, uatype).pack(val)
-    elif isinstance(val, (IntEnum, Enum)):
-        return Primitives.UInt32.pack(val.value)
-    elif isinstance(val, ua.NodeId):
-        return nodeid_to_binary(val)
-    elif isinstance(val, ua.Variant):
-        return variant_to_binary(val)
-    elif hasattr(val, "ua_types"):
-        return struct_to_binary(val)
-    else:
-        raise UaError("No known way to pack {} of type {} to ua binary".format(val, uatype))
+    buf = bytearray()
+    _get_uatype_writer(uatype)(buf, val)
+    return bytes(buf)
 
 
 def list_to_binary(uatype, val):
-    if val is None:
-        return Primitives.Int32.pack(-1)
-    if hasattr(Primitives1, uatype):
-        dataType = getattr(Primitives1, uatype)
-        return dataType.pack_array(val)
-    datasize = Primitives.Int32.pack(len(val))
-    pack = [to_binary(uatype, el) for el in val]
-    pack.insert(0, datasize)
-    return b''.join(pack)
+    return to_binary("ListOf" + uatype, val)
 
 
 def nodeid_to_binary(nodeid):
@@ -328,28 +344,34 @@ def nodeid_to_binary(nodeid):
 
 
 def nodeid_from_binary(data):
-    nid = ua.NodeId()
-    encoding = ord(data.read(1))
-    nid.NodeIdType = ua.NodeIdType(encoding & 0b00111111)
-
-    if nid.NodeIdType == ua.NodeIdType.TwoByte:
-        nid.Identifier = ord(data.read(1))
-    elif nid.NodeIdType == ua.NodeIdType.FourByte:
-        nid.NamespaceIndex, nid.Identifier = struct.unpack("<BH", data.read(3))
-    elif nid.NodeIdType == ua.NodeIdType.Numeric:
-        nid.NamespaceIndex, nid.Identifier = struct.unpack("<HI", data.read(6))
-    elif nid.NodeIdType == ua.NodeIdType.String:
-        nid.NamespaceIndex = Primitives.UInt16.unpack(data)
-        nid.Identifier = Primitives.String.unpack(data)
-    elif nid.NodeIdType == ua.NodeIdType.ByteString:
-        nid.NamespaceIndex = Primitives.UInt16.unpack(data)
-        nid.Identifier = Primitives.Bytes.unpack(data)
-    elif nid.NodeIdType == ua.NodeIdType.Guid:
-        nid.NamespaceIndex = Primitives.UInt16.unpack(data)
-        nid.Identifier = Primitives.Guid.unpack(data)
+    encoding = Primitives.Byte.unpack(data)
+    nidtype = encoding & 0b00111111
+    nsidx = 0
+
+    if nidtype == ua.NodeIdType.TwoByte:
+        identifier = Primitives.Byte.unpack(data)
+    elif nidtype == ua.NodeIdType.FourByte:
+        nsidx, identifier = struct.unpack("<BH", data.read(3))
+    elif nidtype == ua.NodeIdType.Numeric:
+        nsidx, identifier = struct.unpack("<HI", data.read(6))
+    elif nidtype == ua.NodeIdType.String:
+        nsidx = Primitives.UInt16.unpack(data)
+        identifier = Primitives.String.unpack(data)
+    elif nidtype == ua.NodeIdType.ByteString:
+        nsidx = Primitives.UInt16.unpack(data)
+        identifier = Primitives.Bytes.unpack(data)
+    elif nidtype == ua.NodeIdType.Guid:
+        nsidx = Primitives.UInt16.unpack(data)
+        identifier = Primitives.Guid.unpack(data)
     else:
-        raise UaError("Unknown NodeId encoding: " + str(nid.NodeIdType))
-
+        raise UaError("Unknown NodeId encoding: " + str(nidtype))
+
+    if not encoding & 0b11000000:
+        # nodeids of the address space are shared instead of rebuilt, see ua.intern_nodeid
+        nid = ua.get_interned_nodeid(nidtype, nsidx, identifier)
+        if nid is not None:
+            return nid
+    nid = ua.NodeId(identifier, nsidx, ua.NodeIdType(nidtype))
     if test_bit(encoding, 7):
         nid.NamespaceUri = Primitives.String.unpack(data)
     if test_bit(encoding, 6):
@@ -359,30 +381,41 @@ def nodeid_from_binary(data):
 
 
 def variant_to_binary(var):
-    b = []
+    buf = bytearray()
+    write_variant(buf, var)
+    return bytes(buf)
+
+
+def write_variant(buf, var):
+    """
+    Append the binary encoding of a Variant to the bytearray buf
+    """
     encoding = var.VariantType.value & 0b111111
+    if numpy is not None and isinstance(var.Value, numpy.ndarray):
+        _write_ndarray_variant(buf, var, encoding)
+        return
     if var.is_array or isinstance(var.Value, (list, tuple)):
         var.is_array = True
         encoding = set_bit(encoding, 7)
         if var.Dimensions is not None:
             encoding = set_bit(encoding, 6)
-        b.append(Primitives.Byte.pack(encoding))
-        b.append(pack_uatype_array(var.VariantType, ua.flatten(var.Value)))
+        buf += Primitives.Byte.pack(encoding)
+        write_uatype_array(buf, var.VariantType, ua.flatten(var.Value))
         if var.Dimensions is not None:
-            b.append(pack_uatype_array(ua.VariantType.Int32, var.Dimensions))
+            write_uatype_array(buf, ua.VariantType.Int32, var.Dimensions)
     else:
-        b.append(Primitives.Byte.pack(encoding))
-        b.append(pack_uatype(var.VariantType, var.Value))
-
-    return b"".join(b)
+        buf += Primitives.Byte.pack(encoding)
+        write_uatype(buf, var.VariantType, var.Value)
 
 
 def variant_from_binary(data):
     dimensions = None
     array = False
-    encoding = ord(data.read(1))
+    encoding = Primitives.Byte.unpack(data)
     int_type = encoding & 0b00111111
     vtype = ua.datatype_to_varianttype(int_type)
+    if test_bit(encoding, 7) and _numpy_arrays and vtype in _numpy_dtypes:
+        return _ndarray_variant_from_binary(data, encoding, vtype)
     if test_bit(encoding, 7):
         value = unpack_uatype_array(vtype, data)
         array = True
@@ -391,7 +424,81 @@ def variant_from_binary(data):
     if test_bit(encoding, 6):
         dimensions = unpack_uatype_array(ua.VariantType.Int32, data)
         value = _reshape(value, dimensions)
-    return ua.Variant(value, vtype, dimensions, is_array=array)
+    # type and shape come from the encoding, no need to guess and validate them
+    return ua.Variant.from_trusted(value, vtype, dimensions, array)
+
+
+# numpy arrays in Variants
+#
+# Variants holding a numpy.ndarray of a numeric type are encoded directly from the
+# array buffer. Decoding primitive arrays to numpy.ndarray instead of lists is
+# opt-in, see use_numpy_arrays. Both avoid creating a Python object per element.
+
+_numpy_arrays = False
+
+_numpy_dtypes = {
+    ua.VariantType.Boolean: "?",
+    ua.VariantType.SByte: "i1",
+    ua.VariantType.Byte: "u1",
+    ua.VariantType.Int16: "<i2",
+    ua.VariantType.UInt16: "<u2",
+    ua.VariantType.Int32: "<i4",
+    ua.VariantType.UInt32: "<u4",
+    ua.VariantType.Int64: "<i8",
+    ua.VariantType.UInt64: "<u8",
+    ua.VariantType.Float: "<f4",
+    ua.VariantType.Double: "<f8",
+}
+
+
+def use_numpy_arrays(enable=True):
+    """
+    Decode arrays of numeric and boolean types in Variants as numpy.ndarray
+    instead of lists. Multi-dimensional arrays are reshaped from the Dimensions field.
+    """
+    global _numpy_arrays
+    if enable and numpy is None:
+        raise UaError("Can't decode arrays to numpy.ndarray, numpy module is not installed")
+    _numpy_arrays = bool(enable)
+
+
+def _write_ndarray_variant(buf, var, encoding):
+    array = var.Value
+    if var.VariantType not in _numpy_dtypes:
+        # no binary layout matching a numpy dtype, encode the elements one by one
+        write_variant(buf, ua.Variant(array.tolist(), var.VariantType, var.Dimensions, is_array=True))
+        return
+    var.is_array = True
+    dimensions = var.Dimensions
+    if dimensions is None and array.ndim > 1:
+        dimensions = list(array.shape)
+    encoding = set_bit(encoding, 7)
+    if dimensions is not None:
+        encoding = set_bit(encoding, 6)
+    buf += Primitives.Byte.pack(encoding)
+    buf += Primitives.Int32.pack(array.size)
+    # C order flattening is the one of the Dimensions field
+    buf += memoryview(numpy.ascontiguousarray(array, dtype=_numpy_dtypes[var.VariantType]))
+    if dimensions is not None:
+        write_uatype_array(buf, ua.VariantType.Int32, dimensions)
+
+
+def _ndarray_variant_from_binary(data, encoding, vtype):
+    dtype = numpy.dtype(_numpy_dtypes[vtype])
+    length = Primitives.Int32.unpack(data)
+    value = None
+    if length != -1:
+        # data might be a view on the received message, make a copy
+        value = numpy.frombuffer(data.read(length * dtype.itemsize), dtype=dtype).copy()
+    dimensions = None
+    if test_bit(encoding, 6):
+        dimensions = unpack_uatype_array(ua.VariantType.Int32, data)
+        # dimensions which do not match the number of elements leave the array flat,
+        # as _reshape tolerates them for lists
+        if (value is not None and dimensions and min(dimensions) >= 0 and
+                int(numpy.prod(dimensions)) == len(value)):
+            value = value.reshape(dimensions)
+    return ua.Variant.from_trusted(value, vtype, dimensions, True)
 
 
 def _reshape(flat, dims):
@@ -414,7 +521,7 @@ def extensionobject_from_binary(data):
     Returns an object, or None if TypeId is zero
     """
     typeid = nodeid_from_binary(data)
-    Encoding = ord(data.read(1))
+    Encoding = Primitives.Byte.unpack(data)
     body = None
     if Encoding & (1 << 0):
         length = Primitives.Int32.unpack(data)
@@ -429,13 +536,16 @@ def extensionobject_from_binary(data):
         klass = ua.extension_object_classes[typeid]
         if body is None:
             raise UaError("parsing ExtensionObject {0} without data".format(klass.__name__))
+        if _lazy_extension_objects:
+            # data might be a view on the received message, make a copy
+            return LazyExtensionObject(klass, to_bytes(body.read(len(body))))
         return from_binary(klass, body)
     else:
         e = ua.ExtensionObject()
         e.TypeId = typeid
         e.Encoding = Encoding
         if body is not None:
-            e.Body = body.read(len(body))
+            e.Body = to_bytes(body.read(len(body)))
         return e
 
 
@@ -445,42 +555,187 @@ def extensionobject_to_binary(obj):
     If obj is None, convert to empty ExtensionObject (TypeId=0, no Body).
     Returns a binary string
     """
+    buf = bytearray()
+    write_extensionobject(buf, obj)
+    return bytes(buf)
+
+
+def write_extensionobject(buf, obj):
+    """
+    Append the binary-coded ExtensionObject of a Python object to the bytearray buf.
+    The body is encoded in place and its length prefix patched afterwards
+    """
+    if type(obj) is LazyExtensionObject:
+        if obj._obj is None:
+            # never accessed, the received body is still valid
+            buf += nodeid_to_binary(ua.extension_object_ids[obj._klass.__name__])
+            buf += Primitives.Byte.pack(0x01)
+            if obj._body:
+                Primitives.Bytes.write(buf, obj._body)
+            return
+        obj = obj._obj
     if isinstance(obj, ua.ExtensionObject):
-        return struct_to_binary(obj)
+        write_struct(buf, obj)
+        return
     if obj is None:
-        TypeId = ua.NodeId()
-        Encoding = 0
-        Body = None
+        buf += nodeid_to_binary(ua.NodeId())
+        buf += Primitives.Byte.pack(0)
+        return
+    buf += nodeid_to_binary(ua.extension_object_ids[obj.__class__.__name__])
+    buf += Primitives.Byte.pack(0x01)
+    pos = len(buf)
+    buf += b'\x00\x00\x00\x00'
+    write_struct(buf, obj)
+    length = len(buf) - pos - 4
+    if length:
+        struct.pack_into("<i", buf, pos, length)
     else:
-        TypeId = ua.extension_object_ids[obj.__class__.__name__]
-        Encoding = 0x01
-        Body = struct_to_binary(obj)
-    packet = []
-    packet.append(nodeid_to_binary(TypeId))
-    packet.append(Primitives.Byte.pack(Encoding))
-    if Body:
-        packet.append(Primitives.Bytes.pack(Body))
-    return b''.join(packet)
+        # an empty body is written without length
+        del buf[pos:]
+
+
+# Lazy ExtensionObjects
+#
+# Forwarding or logging a message does not need the structures inside its
+# ExtensionObjects. When enabled with use_lazy_extension_objects, registered
+# ExtensionObjects are decoded to a proxy keeping the raw body, which is decoded
+# on first attribute access and re-emitted as is if never accessed.
+
+_lazy_extension_objects = False
+
+
+def use_lazy_extension_objects(enable=True):
+    """
+    Decode registered ExtensionObjects to LazyExtensionObject proxies
+    instead of decoding their body immediately
+    """
+    global _lazy_extension_objects
+    _lazy_extension_objects = bool(enable)
+
+
+class LazyExtensionObject(object):
+    """
+    Proxy for an ExtensionObject of class klass, the body is decoded on first
+    attribute access. isinstance checks against klass succeed without decoding
+    """
+    __slots__ = ("_klass", "_body", "_obj")
+
+    def __init__(self, klass, body):
+        object.__setattr__(self, "_klass", klass)
+        object.__setattr__(self, "_body", body)
+        object.__setattr__(self, "_obj", None)
+
+    @property
+    def __class__(self):
+        return self._klass
+
+    def is_decoded(self):
+        return self._obj is not None
+
+    def get_object(self):
+        """
+        return the decoded object, decode it if necessary
+        """
+        if self._obj is None:
+            object.__setattr__(self, "_obj", struct_from_binary(self._klass, Buffer(self._body)))
+            object.__setattr__(self, "_body", None)
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self.get_object(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get_object(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self.get_object(), name)
+
+    def __eq__(self, other):
+        if type(other) is LazyExtensionObject:
+            other = other.get_object()
+        return self.get_object() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = object.__hash__
+
+    def __reduce_ex__(self, protocol):
+        return self.get_object().__reduce_ex__(protocol)
+
+    def __str__(self):
+        return str(self.get_object())
+
+    __repr__ = __str__
+
+
+# Shared DataValue encoding
+#
+# A value change monitored by many subscriptions is sent in the notifications of all
+# of them. The server hands the same CachedDataValue to every subscription, it is
+# encoded by the first PublishResponse written and the bytes reused by the others.
+
+
+class CachedDataValue(ua.DataValue):
+    """
+    DataValue keeping its binary encoding once written.
+    It is shared by all the subscriptions and cannot be modified, the next value
+    change is a new object
+    """
+    __slots__ = ("_binary",)
+
+    @classmethod
+    def from_datavalue(cls, dv):
+        obj = cls.__new__(cls)
+        set_member = object.__setattr__
+        # the encoder sets the bits of the optional members, they are set now so
+        # that it does not change the value
+        encoding = dv.Encoding
+        for name, (_, bit) in ua.DataValue.ua_switches.items():
+            if getattr(dv, name) is not None:
+                encoding |= 1 << bit
+        set_member(obj, "Encoding", encoding)
+        set_member(obj, "Value", dv.Value)
+        set_member(obj, "StatusCode", dv.StatusCode)
+        set_member(obj, "SourceTimestamp", dv.SourceTimestamp)
+        set_member(obj, "SourcePicoseconds", dv.SourcePicoseconds)
+        set_member(obj, "ServerTimestamp", dv.ServerTimestamp)
+        set_member(obj, "ServerPicoseconds", dv.ServerPicoseconds)
+        set_member(obj, "_binary", None)
+        return obj
+
+    def __setattr__(self, key, value):
+        if key == "Encoding" and value == self.Encoding:
+            # written back unchanged by the encoder
+            return
+        if key != "_binary":
+            # same error as for _FrozenClass
+            raise TypeError("Error setting member '{0}' of a CachedDataValue, it is shared and cannot be "
+                            "modified, modify a copy".format(key))
+        object.__setattr__(self, key, value)
+
+
+def _write_cached_datavalue(buf, dv):
+    data = dv._binary
+    if data is not None:
+        buf += data
+        return
+    try:
+        writer = _struct_writers[ua.DataValue]
+    except KeyError:
+        writer = _get_struct_writer(ua.DataValue)
+    pos = len(buf)
+    writer(buf, dv)
+    dv._binary = bytes(buf[pos:])
 
 
 def from_binary(uatype, data):
     """
     unpack data given an uatype as a string or a python class having a ua_types memeber
     """
-    if isinstance(uatype, (str, unicode)) and uatype.startswith("ListOf"):
-        utype = uatype[6:]
-        if hasattr(ua.VariantType, utype):
-            vtype = getattr(ua.VariantType, utype)
-            return unpack_uatype_array(vtype, data)
-        size = Primitives.Int32.unpack(data)
-        return [from_binary(utype, data) for _ in range(size)]
-    elif isinstance(uatype, (str, unicode)) and hasattr(ua.VariantType, uatype):
-        vtype = getattr(ua.VariantType, uatype)
-        return unpack_uatype(vtype, data)
-    elif isinstance(uatype, (str, unicode)) and hasattr(Primitives, uatype):
-        return  getattr(Primitives, uatype).unpack(data)
-    else:
-        return struct_from_binary(uatype, data)
+    if isinstance(uatype, (str, unicode)):
+        return _get_uatype_decoder(uatype)(data)
+    return struct_from_binary(uatype, data)
 
 
 def struct_from_binary(objtype, data):
@@ -488,20 +743,12 @@ def struct_from_binary(objtype, data):
     unpack an ua struct. Arguments are an objtype as Python class or string
     """
     if isinstance(objtype, (unicode, str)):
-        objtype = getattr(ua, objtype)
-    if issubclass(objtype, Enum):
-        return objtype(Primitives.UInt32.unpack(data))
-    obj = objtype()
-    for name, uatype in obj.ua_types:
-        # if our member has a swtich and it is not set we skip it
-        if hasattr(obj, "ua_switches") and name in obj.ua_switches:
-            container_name, idx = obj.ua_switches[name]
-            val = getattr(obj, container_name)
-            if not test_bit(val, idx):
-                continue
-        val = from_binary(uatype, data)
-        setattr(obj, name, val)
-    return obj
+        objtype = _get_uatype_class(objtype)
+    try:
+        decoder = _struct_decoders[objtype]
+    except KeyError:
+        decoder = _get_struct_decoder(objtype)
+    return decoder(data)
 
 
 def header_to_binary(hdr):
@@ -535,3 +782,358 @@ def uatcp_to_binary(message_type, message):
     binmsg = struct_to_binary(message)
     header.body_size = len(binmsg)
     return header_to_binary(header) + binmsg
+
+
+# Compiled struct codecs
+#
+# Walking ua_types for every object we encode or decode is slow, so the first
+# time a class is seen its ua_types and ua_switches are turned into a
+# specialized write and decode function which is cached per class.
+# Writers append to a single bytearray instead of returning bytes objects
+# joined at every nesting level.
+# The wire format is exactly the one of the generic to_binary/from_binary functions.
+
+_struct_writers = {}
+_struct_decoders = {}
+
+
+def _write_enum(buf, val):
+    buf += Primitives.UInt32.pack(val.value)
+
+
+def _write_nodeid(buf, nodeid):
+    buf += nodeid_to_binary(nodeid)
+
+
+def _get_struct_writer(klass):
+    """
+    return the writer for objects of class klass, compile it if necessary
+    """
+    if issubclass(klass, Enum):
+        writer = _write_enum
+    elif issubclass(klass, ua.NodeId):
+        writer = _write_nodeid
+    elif issubclass(klass, ua.Variant):
+        writer = write_variant
+    elif hasattr(klass, "ua_types"):
+        writer = _compile_struct_writer(klass)
+    else:
+        raise UaError("No known way to pack objects of type {0} to ua binary".format(klass.__name__))
+    _struct_writers[klass] = writer
+    return writer
+
+
+def _get_struct_decoder(klass):
+    """
+    return the decoder for objects of class klass, compile it if necessary
+    """
+    if issubclass(klass, Enum):
+        def decoder(data):
+            return klass(Primitives.UInt32.unpack(data))
+    elif issubclass(klass, ua.NodeId):
+        decoder = nodeid_from_binary
+    elif issubclass(klass, ua.Variant):
+        decoder = variant_from_binary
+    else:
+        decoder = _compile_struct_decoder(klass)
+    _struct_decoders[klass] = decoder
+    return decoder
+
+
+def _struct_name_decoder(name):
+    """
+    decoder for a structure or enum referenced by name in a ua_types member.
+    The class is looked up in the type registry at call time since custom
+    structures may be registered or replaced later
+    """
+    def decode(data):
+        try:
+            klass = _uatype_classes[name]
+        except KeyError:
+            klass = _get_uatype_class(name)
+        try:
+            decoder = _struct_decoders[klass]
+        except KeyError:
+            decoder = _get_struct_decoder(klass)
+        return decoder(data)
+    return decode
+
+
+def _field_writer(uatype):
+    """
+    return a function appending a value described by the type string uatype
+    to a bytearray, dispatch is done once here instead of on every value
+    """
+    if uatype.startswith("ListOf"):
+        utype = uatype[6:]
+        if hasattr(Primitives1, utype):
+            pack_array = getattr(Primitives1, utype).pack_array
+
+            def write_primitive_list(buf, val):
+                buf += pack_array(val)
+            return write_primitive_list
+        write_el = _get_uatype_writer(utype)
+        pack_length = Primitives.Int32.pack
+
+        def write_list(buf, val):
+            if val is None:
+                buf += b'\xff\xff\xff\xff'
+                return
+            buf += pack_length(len(val))
+            for el in val:
+                write_el(buf, el)
+        return write_list
+    if hasattr(ua.VariantType, uatype):
+        return _vtype_writers[getattr(ua.VariantType, uatype)]
+    if hasattr(Primitives, uatype):
+        return getattr(Primitives, uatype).write
+    # enums and structures, dispatch on the class of the value
+    return write_struct
+
+
+def _field_decoder(uatype):
+    """
+    return a function unpacking a value described by the type string uatype,
+    dispatch is done once here instead of on every value
+    """
+    unpack_length = Primitives.Int32.unpack
+    if uatype.startswith("ListOf"):
+        utype = uatype[6:]
+        if hasattr(ua.VariantType, utype):
+            vtype = getattr(ua.VariantType, utype)
+            if vtype in _vtype_array_unpackers:
+                unpack_array = _vtype_array_unpackers[vtype]
+
+                def unpack_primitive_list(data):
+                    length = unpack_length(data)
+                    if length == -1:
+                        return None
+                    return list(unpack_array(data, length))
+                return unpack_primitive_list
+            unpack_el = _vtype_unpackers[vtype]
+
+            def unpack_uatype_list(data):
+                length = unpack_length(data)
+                if length == -1:
+                    return None
+                return [unpack_el(data) for _ in range(length)]
+            return unpack_uatype_list
+        unpack_el = _get_uatype_decoder(utype)
+
+        def unpack_list(data):
+            return [unpack_el(data) for _ in range(unpack_length(data))]
+        return unpack_list
+    if hasattr(ua.VariantType, uatype):
+        return _vtype_unpackers[getattr(ua.VariantType, uatype)]
+    if hasattr(Primitives, uatype):
+        return getattr(Primitives, uatype).unpack
+    return _struct_name_decoder(uatype)
+
+
+def _attr(name):
+    return "obj.{0}".format(name)
+
+
+def _fixed_size_code(uatype):
+    """
+    return the struct format character of a fixed size field type
+    or None if the type has a variable size
+    """
+    if uatype == "DateTime":
+        return "q"
+    if hasattr(Primitives1, uatype):
+        return getattr(Primitives1, uatype).code
+    return None
+
+
+def _group_fields(klass):
+    """
+    split ua_types in runs of consecutive fixed size fields, which are packed
+    and unpacked with a single struct.Struct call, and single variable size
+    or optional fields.
+    Yields lists of (name, uatype, code) tuples, code is None for
+    fields which are not part of a run
+    """
+    switches = getattr(klass, "ua_switches", {})
+    run = []
+    for name, uatype in klass.ua_types:
+        code = None if name in switches else _fixed_size_code(uatype)
+        if code is not None:
+            run.append((name, uatype, code))
+            continue
+        if run:
+            yield run
+            run = []
+        yield [(name, uatype, None)]
+    if run:
+        yield run
+
+
+def _compile(source, env, funcname):
+    code = compile(source, "<ua_binary codec {0}>".format(funcname), "exec")
+    exec(code, env)
+    return env[funcname]
+
+
+def _compile_struct_writer(klass):
+    switches = getattr(klass, "ua_switches", {})
+    env = {"_to_win_epoch": ua.datetime_to_win_epoch}
+    lines = ["def write_{0}(buf, obj):".format(klass.__name__)]
+    for name, (container, idx) in switches.items():
+        lines.append("    if {0} is not None:".format(_attr(name)))
+        lines.append("        {0} |= {1}".format(_attr(container), 1 << idx))
+    for idx, fields in enumerate(_group_fields(klass)):
+        handler = "_write{0}".format(idx)
+        name, uatype, code = fields[0]
+        if code is not None:
+            env[handler] = struct.Struct("<" + "".join(field[2] for field in fields)).pack
+            args = []
+            for name, uatype, code in fields:
+                if uatype == "DateTime":
+                    args.append("_to_win_epoch({0})".format(_attr(name)))
+                else:
+                    args.append(_attr(name))
+            lines.append("    buf += {0}({1})".format(handler, ", ".join(args)))
+            continue
+        env[handler] = _get_uatype_writer(uatype)
+        if name in switches and not uatype.startswith("ListOf"):
+            lines.append("    if {0} is not None:".format(_attr(name)))
+            lines.append("        {0}(buf, {1})".format(handler, _attr(name)))
+        else:
+            lines.append("    {0}(buf, {1})".format(handler, _attr(name)))
+    if len(lines) == 1:
+        lines.append("    pass")
+    return _compile("\n".join(lines), env, "write_{0}".format(klass.__name__))
+
+
+def _new_datavalue():
+    return ua.DataValue.from_trusted(ua.Variant.from_trusted(None, ua.VariantType.Null))
+
+
+# constructors used by the decoders instead of calling the class without arguments,
+# for the classes with a costly __init__ decoded on hot paths
+_struct_factories = {
+    ua.DataValue: _new_datavalue,
+}
+
+
+def _compile_struct_decoder(klass):
+    switches = getattr(klass, "ua_switches", {})
+    env = {"klass": _struct_factories.get(klass, klass), "_from_win_epoch": ua.win_epoch_to_datetime}
+    lines = ["def decode_{0}(data):".format(klass.__name__), "    obj = klass()"]
+    for idx, fields in enumerate(_group_fields(klass)):
+        handler = "_unpack{0}".format(idx)
+        name, uatype, code = fields[0]
+        if code is not None:
+            st = struct.Struct("<" + "".join(field[2] for field in fields))
+            env[handler] = st.unpack
+            lines.append("    values = {0}(data.read({1}))".format(handler, st.size))
+            for pos, (name, uatype, code) in enumerate(fields):
+                if uatype == "DateTime":
+                    lines.append("    {0} = _from_win_epoch(values[{1}])".format(_attr(name), pos))
+                else:
+                    lines.append("    {0} = values[{1}]".format(_attr(name), pos))
+            continue
+        indent = "    "
+        if name in switches:
+            container, bit = switches[name]
+            lines.append("    if {0} & {1}:".format(_attr(container), 1 << bit))
+            indent += "    "
+        env[handler] = _get_uatype_decoder(uatype)
+        lines.append("{0}{1} = {2}(data)".format(indent, _attr(name), handler))
+    lines.append("    return obj")
+    return _compile("\n".join(lines), env, "decode_{0}".format(klass.__name__))
+
+
+# Type dispatch tables
+#
+# Handlers are resolved once per VariantType and per type name instead of
+# probing Primitives, Primitives1, ua.VariantType and the ua module for every value.
+# Custom variant types, not in the VariantType enum, are encoded as ByteString.
+
+_vtype_packers = {}
+_vtype_writers = {}
+_vtype_unpackers = {}
+_vtype_array_packers = {}
+_vtype_array_unpackers = {}
+
+_uatype_writers = {}
+_uatype_decoders = {}
+_uatype_classes = {}
+
+
+def _get_uatype_writer(uatype):
+    """
+    return the writer of a value described by the type string uatype
+    """
+    try:
+        return _uatype_writers[uatype]
+    except KeyError:
+        writer = _uatype_writers[uatype] = _field_writer(uatype)
+        return writer
+
+
+def _get_uatype_decoder(uatype):
+    """
+    return the decoder of a value described by the type string uatype
+    """
+    try:
+        return _uatype_decoders[uatype]
+    except KeyError:
+        decoder = _uatype_decoders[uatype] = _field_decoder(uatype)
+        return decoder
+
+
+def _get_uatype_class(name):
+    """
+    return the structure or enum class registered for name, classes not
+    registered are looked up in the ua module once
+    """
+    try:
+        return _uatype_classes[name]
+    except KeyError:
+        pass
+    klass = getattr(ua, name, None)
+    if klass is None:
+        raise UaError("Cannot find structure or enum {0} in ua module".format(name))
+    _uatype_classes[name] = klass
+    return klass
+
+
+def register_uatype_class(name, klass):
+    """
+    Register the structure or enum class used to decode fields of type name.
+    Called when custom structures and enums are registered
+    """
+    _uatype_classes[name] = klass
+
+
+def _build_vtype_tables():
+    for vtype in ua.VariantType:
+        if hasattr(Primitives, vtype.name):
+            primitive = getattr(Primitives, vtype.name)
+            handlers = (primitive.pack, primitive.write, primitive.unpack)
+        elif vtype == ua.VariantType.ExtensionObject:
+            handlers = (extensionobject_to_binary, write_extensionobject, extensionobject_from_binary)
+        elif vtype in (ua.VariantType.NodeId, ua.VariantType.ExpandedNodeId):
+            handlers = (nodeid_to_binary, _write_nodeid, nodeid_from_binary)
+        elif vtype == ua.VariantType.Variant:
+            handlers = (variant_to_binary, write_variant, variant_from_binary)
+        else:
+            handlers = (struct_to_binary, write_struct, _struct_name_decoder(vtype.name))
+        _vtype_packers[vtype], _vtype_writers[vtype], _vtype_unpackers[vtype] = handlers
+        if hasattr(Primitives1, vtype.name):
+            primitive = getattr(Primitives1, vtype.name)
+            _vtype_array_packers[vtype] = primitive.pack_array
+            _vtype_array_unpackers[vtype] = primitive.unpack_array
+
+
+def _build_uatype_classes():
+    for name, klass in vars(ua).items():
+        if isinstance(klass, type) and (hasattr(klass, "ua_types") or issubclass(klass, Enum)):
+            _uatype_classes[name] = klass
+
+
+_build_vtype_tables()
+_build_uatype_classes()
+_struct_writers[CachedDataValue] = _write_cached_datavalue
@@ -279,6 +279,9 @@ class Message(object):
         return self._chunks[0].SecurityHeader
 
     def body(self):
+        if len(self._chunks) == 1:
+            # no need to copy anything, the chunk body might be a view on received data
+            return utils.Buffer(self._chunks[0].Body)
         body = b"".join([c.Body for c in self._chunks])
         return utils.Buffer(body)
 
@@ -19,6 +19,11 @@ from opcua.ua.uaerrors import UaError
 from opcua.ua.uaerrors import UaStatusCodeError
 from opcua.ua.uaerrors import UaStringParsingError
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 logger = logging.getLogger(__name__)
 
 if sys.version_info.major > 2:
@@ -70,12 +75,32 @@ class _FrozenClass(object):
 
 if "PYOPCUA_TYPO_CHECK" in os.environ:
     # typo check is cpu consuming, but it will make debug easy.
-    # set PYOPCUA_TYPO_CHECK will make all uatype classes inherit from _FrozenClass
+    # set PYOPCUA_TYPO_CHECK will make all uatype classes inherit from _FrozenClass.
+    # It has no effect on the _SlotsClass types, which always reject unknown members
     FrozenClass = _FrozenClass
 else:
     FrozenClass = object
 
 
+class _SlotsClass(object):
+    """
+    Base of the core types using __slots__. They are compact and members
+    cannot be added, whatever the typo check setting.
+    Setting an unknown member raises AttributeError, as for any __slots__ class,
+    not the TypeError of _FrozenClass. Before __slots__ were used members could be
+    added unless PYOPCUA_TYPO_CHECK was set, then TypeError was raised.
+    Objects pickled before __slots__ were used are also accepted.
+    """
+    __slots__ = ()
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = state[1]
+        for key, value in state.items():
+            if key != "_freeze":
+                object.__setattr__(self, key, value)
+
+
 class ValueRank(IntEnum):
     """
     Defines dimensions of a variable.
@@ -189,7 +214,7 @@ class EventNotifier(_MaskEnum):
     HistoryWrite = 3
 
 
-class StatusCode(FrozenClass):
+class StatusCode(_SlotsClass):
     """
     :ivar value:
     :vartype value: int
@@ -199,6 +224,8 @@ class StatusCode(FrozenClass):
     :vartype doc: string
     """
 
+    __slots__ = ("value",)
+
     ua_types = [("value", "UInt32")]
 
     def __init__(self, value=0):
@@ -206,7 +233,6 @@ class StatusCode(FrozenClass):
             self.value = getattr(status_codes.StatusCodes, value)
         else:
             self.value = value
-        self._freeze = True
 
     def check(self):
         """
@@ -258,7 +284,7 @@ class NodeIdType(IntEnum):
     ByteString = 5
 
 
-class NodeId(object):
+class NodeId(_SlotsClass):
     """
     NodeId Object
 
@@ -278,41 +304,113 @@ class NodeId(object):
     :vartype ServerIndex: Int
     """
 
-    def __init__(self, identifier=None, namespaceidx=0, nodeidtype=None):
+    __slots__ = ("_identifier", "_namespace_index", "_nodeid_type", "_namespace_uri", "_server_index", "_hash")
 
-        self.Identifier = identifier
-        self.NamespaceIndex = namespaceidx
-        self.NodeIdType = nodeidtype
-        self.NamespaceUri = ""
-        self.ServerIndex = 0
-        self._freeze = True
-        if self.Identifier is None:
-            self.Identifier = 0
+    def __init__(self, identifier=None, namespaceidx=0, nodeidtype=None):
+        # slots are set directly, members are properties because of interning
+        self._namespace_index = namespaceidx
+        self._namespace_uri = ""
+        self._server_index = 0
+        self._hash = None
+        if identifier is None:
+            self._identifier = 0
             if namespaceidx == 0:
-                self.NodeIdType = NodeIdType.TwoByte
+                self._nodeid_type = NodeIdType.TwoByte
             else:  # TwoByte NodeId does not encode namespace.
-                self.NodeIdType = NodeIdType.Numeric
+                self._nodeid_type = NodeIdType.Numeric
             return
-        if self.NodeIdType is None:
-            if isinstance(self.Identifier, int):
-                self.NodeIdType = NodeIdType.Numeric
-            elif isinstance(self.Identifier, str):
-                self.NodeIdType = NodeIdType.String
-            elif isinstance(self.Identifier, bytes):
-                self.NodeIdType = NodeIdType.ByteString
-            elif isinstance(self.Identifier, uuid.UUID):
-                self.NodeIdType = NodeIdType.Guid
+        self._identifier = identifier
+        if nodeidtype is None:
+            if isinstance(identifier, int):
+                nodeidtype = NodeIdType.Numeric
+            elif isinstance(identifier, str):
+                nodeidtype = NodeIdType.String
+            elif isinstance(identifier, bytes):
+                nodeidtype = NodeIdType.ByteString
+            elif isinstance(identifier, uuid.UUID):
+                nodeidtype = NodeIdType.Guid
             else:
                 raise UaError("NodeId: Could not guess type of NodeId, set NodeIdType")
+        self._nodeid_type = nodeidtype
+
+    def _interned_error(self):
+        # an interned nodeid is a key of the address space dicts, changing it would change
+        # its hash. same error as for _FrozenClass
+        return TypeError("NodeId {0} is interned and cannot be modified, modify a copy".format(self.to_string()))
+
+    @property
+    def Identifier(self):
+        return self._identifier
+
+    @Identifier.setter
+    def Identifier(self, value):
+        if self._hash is not None:
+            raise self._interned_error()
+        self._identifier = value
+
+    @property
+    def NamespaceIndex(self):
+        return self._namespace_index
+
+    @NamespaceIndex.setter
+    def NamespaceIndex(self, value):
+        if self._hash is not None:
+            raise self._interned_error()
+        self._namespace_index = value
+
+    @property
+    def NodeIdType(self):
+        return self._nodeid_type
+
+    @NodeIdType.setter
+    def NodeIdType(self, value):
+        if self._hash is not None:
+            raise self._interned_error()
+        self._nodeid_type = value
+
+    @property
+    def NamespaceUri(self):
+        return self._namespace_uri
+
+    @NamespaceUri.setter
+    def NamespaceUri(self, value):
+        if self._hash is not None:
+            raise self._interned_error()
+        self._namespace_uri = value
+
+    @property
+    def ServerIndex(self):
+        return self._server_index
+
+    @ServerIndex.setter
+    def ServerIndex(self, value):
+        if self._hash is not None:
+            raise self._interned_error()
+        self._server_index = value
 
     def __eq__(self, node):
-        return isinstance(node, NodeId) and self.NamespaceIndex == node.NamespaceIndex and self.Identifier == node.Identifier
+        return isinstance(node, NodeId) and self._namespace_index == node._namespace_index \
+            and self._identifier == node._identifier
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def __hash__(self):
-        return hash((self.NamespaceIndex, self.Identifier))
+        # only interned nodeids have a cached hash, they cannot be modified
+        if self._hash is None:
+            return hash((self._namespace_index, self._identifier))
+        return self._hash
+
+    def __getstate__(self):
+        # the cached hash is not copied, copies are not interned
+        # and hash of strings changes between processes
+        return None, {"Identifier": self._identifier, "NamespaceIndex": self._namespace_index,
+                      "NodeIdType": self._nodeid_type, "NamespaceUri": self.NamespaceUri,
+                      "ServerIndex": self.ServerIndex}
+
+    def __setstate__(self, state):
+        self._hash = None
+        _SlotsClass.__setstate__(self, state)
 
     def __lt__(self, other):
         if not isinstance(other, NodeId):
@@ -411,32 +509,104 @@ class NodeId(object):
         return opcua.ua.ua_binary.nodeid_to_binary(self)
 
 
+# Interned NodeIds
+#
+# The nodeids of the server address space are shared by the address space,
+# its references and the decoded requests instead of being rebuilt each time.
+# Shared instances have a precomputed hash and are found in dicts by identity.
+# They are keys of the address space dicts and cannot be modified, setting
+# a member raises TypeError. Copies are not shared and can be modified.
+
+_interned_nodeids = {}
+
+
+def _nodeid_key(nodeid):
+    if nodeid.NamespaceUri or nodeid.ServerIndex:
+        return None
+    return nodeid.NodeIdType, nodeid.NamespaceIndex, nodeid.Identifier
+
+
+def intern_nodeid(nodeid):
+    """
+    Return the shared NodeId equal to nodeid, a copy of nodeid becomes
+    the shared instance if there is none yet.
+    ExpandedNodeIds with a namespace uri or server index are returned unchanged.
+    """
+    key = _nodeid_key(nodeid)
+    if key is None:
+        return nodeid
+    shared = _interned_nodeids.get(key)
+    if shared is None:
+        shared = NodeId(nodeid.Identifier, nodeid.NamespaceIndex, nodeid.NodeIdType)
+        shared._hash = hash((shared.NamespaceIndex, shared.Identifier))
+        shared = _interned_nodeids.setdefault(key, shared)
+    return shared
+
+
+def get_interned_nodeid(nodeidtype, namespaceidx, identifier):
+    """
+    Return the shared NodeId with these members or None if it is not interned
+    """
+    return _interned_nodeids.get((nodeidtype, namespaceidx, identifier))
+
+
+def mutable_nodeid(nodeid):
+    """
+    Return nodeid, or a copy of it if it is shared and cannot be modified
+    """
+    if nodeid._hash is None:
+        return nodeid
+    return NodeId(nodeid.Identifier, nodeid.NamespaceIndex, nodeid.NodeIdType)
+
+
+def release_nodeid(nodeid):
+    """
+    Stop sharing the NodeId equal to nodeid, for example when its node is deleted.
+    Existing references to the shared instance stay valid.
+    """
+    key = _nodeid_key(nodeid)
+    if key is not None:
+        _interned_nodeids.pop(key, None)
+
+
 class TwoByteNodeId(NodeId):
+    __slots__ = ()
+
     def __init__(self, identifier):
         NodeId.__init__(self, identifier, 0, NodeIdType.TwoByte)
 
 
 class FourByteNodeId(NodeId):
+    __slots__ = ()
+
     def __init__(self, identifier, namespace=0):
         NodeId.__init__(self, identifier, namespace, NodeIdType.FourByte)
 
 
 class NumericNodeId(NodeId):
+    __slots__ = ()
+
     def __init__(self, identifier, namespace=0):
         NodeId.__init__(self, identifier, namespace, NodeIdType.Numeric)
 
 
 class ByteStringNodeId(NodeId):
+    __slots__ = ()
+
     def __init__(self, identifier, namespace=0):
         NodeId.__init__(self, identifier, namespace, NodeIdType.ByteString)
 
 
 class GuidNodeId(NodeId):
+    __slots__ = ()
+
     def __init__(self, identifier, namespace=0):
         NodeId.__init__(self, identifier, namespace, NodeIdType.Guid)
 
 
 class StringNodeId(NodeId):
+    __slots__ = ()
+
     def __init__(self, identifier, namespace=0):
         NodeId.__init__(self, identifier, namespace, NodeIdType.String)
 
@@ -444,11 +614,13 @@ class StringNodeId(NodeId):
 ExpandedNodeId = NodeId
 
 
-class QualifiedName(FrozenClass):
+class QualifiedName(_SlotsClass):
     """
     A string qualified with a namespace index.
     """
 
+    __slots__ = ("NamespaceIndex", "Name")
+
     ua_types = [
         ('NamespaceIndex', 'UInt16'),
         ('Name', 'String'),
@@ -459,7 +631,6 @@ class QualifiedName(FrozenClass):
             raise UaError("namespaceidx must be an int")
         self.NamespaceIndex = namespaceidx
         self.Name = name
-        self._freeze = True
 
     def to_string(self):
         return "{0}:{1}".format(self.NamespaceIndex, self.Name)
@@ -484,6 +655,9 @@ class QualifiedName(FrozenClass):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash((self.NamespaceIndex, self.Name))
+
     def __lt__(self, other):
         if not isinstance(other, QualifiedName):
             raise TypeError("Cannot compare QualifiedName and {0}".format(other))
@@ -498,11 +672,13 @@ class QualifiedName(FrozenClass):
     __repr__ = __str__
 
 
-class LocalizedText(FrozenClass):
+class LocalizedText(_SlotsClass):
     """
     A string qualified with a namespace index.
     """
 
+    __slots__ = ("Encoding", "_text", "Locale")
+
     ua_switches = {
         'Locale': ('Encoding', 0),
         'Text': ('Encoding', 1),
@@ -519,7 +695,6 @@ class LocalizedText(FrozenClass):
         if text:
             self.Text = text
         self.Locale = None
-        self._freeze = True
 
     @property
     def Text(self):
@@ -675,8 +850,11 @@ class VariantTypeCustom(object):
     def __eq__(self, other):
         return self.value == other.value
 
+    def __hash__(self):
+        return hash(self.value)
+
 
-class Variant(FrozenClass):
+class Variant(_SlotsClass):
     """
     Create an OPC-UA Variant object.
     if no argument a Null Variant is created.
@@ -693,32 +871,49 @@ class Variant(FrozenClass):
     :vartype is_array: If the variant is an array. Usually guessed from value.
     """
 
+    __slots__ = ("_value", "_variantType", "Dimensions", "is_array")
+
     def __init__(self, value=None, varianttype=None, dimensions=None, is_array=None):
-        self._freeze = False # defers validation until ready.
-        # Value, VariantType
-        self._value = None
-        self._variantType = None
+        # members are set directly, the property setters would validate the half built object
         if isinstance(value, Variant):
-            self.Value = value.Value
-            self.VariantType = value.VariantType
-        else:
-            self.Value = value
-            self.VariantType = varianttype
+            varianttype = value.VariantType
+            value = value.Value
+        self._value = value
+        if varianttype is None:
+            varianttype = self._guess_type(value)
+        self._variantType = varianttype
         # Dimensions
         self.Dimensions = dimensions
-        if dimensions is None and isinstance(self.Value, (list, tuple)):
-            dims = get_shape(self.Value)
+        if dimensions is None and isinstance(value, (list, tuple)):
+            dims = get_shape(value)
             if len(dims) > 1:
                 self.Dimensions = dims
+        elif dimensions is None and _is_ndarray(value) and value.ndim > 1:
+            self.Dimensions = list(value.shape)
         # is_array
         if is_array is not None:
             self.is_array = bool(is_array)
         else:
-            self.is_array = isinstance(self.Value, (list, tuple))
+            self.is_array = isinstance(value, (list, tuple)) or _is_ndarray(value)
         # Validation check
-        self._freeze = True
         self._validate()
 
+    @classmethod
+    def from_trusted(cls, value, varianttype, dimensions=None, is_array=False):
+        """
+        Create a Variant without guessing type, shape or validating value.
+        Only for callers which already know the exact VariantType and shape,
+        such as the binary decoder or the server internals.
+        value must already be of the python type matching varianttype
+        (a float for Double, etc). Use the normal constructor otherwise.
+        """
+        obj = cls.__new__(cls)
+        obj._value = value
+        obj._variantType = varianttype
+        obj.Dimensions = dimensions
+        obj.is_array = is_array
+        return obj
+
     @property
     def Value(self):
         return self._value
@@ -726,7 +921,7 @@ class Variant(FrozenClass):
     @Value.setter
     def Value(self, value):
         if not (self._value is None or isinstance(value, type(self._value))):
-            logger.warning("Datatype changed from {} to {} in Variant {}.".format(type(self._value), type(value), self))
+            logger.warning("Datatype changed from %s to %s in Variant %s.", type(self._value), type(value), self)
         self._value = value
         self._validate()
 
@@ -743,23 +938,28 @@ class Variant(FrozenClass):
         self._validate()
 
     def _validate(self):
-        if self._freeze is False:
-            return
-        elif isinstance(self._value, int) and self.VariantType in (VariantType.Float, VariantType.Double):
+        if isinstance(self._value, int) and self.VariantType in (VariantType.Float, VariantType.Double):
             self._value = float(self._value)
         elif self._value is None and not self.is_array and \
               self.VariantType not in (VariantType.Null, VariantType.String, VariantType.DateTime):
             raise UaError("Non array Variant of type {0} cannot have value None".format(self.VariantType))
 
     def __eq__(self, other):
-        if isinstance(other, Variant) and self.VariantType == other.VariantType and self.Value == other.Value:
-            return True
+        if isinstance(other, Variant) and self.VariantType == other.VariantType:
+            if _is_ndarray(self.Value) or _is_ndarray(other.Value):
+                return bool(numpy.array_equal(self.Value, other.Value))
+            return self.Value == other.Value
         return False
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def _guess_type(self, val):
+        if _is_ndarray(val):
+            try:
+                return _numpy_varianttypes[(val.dtype.kind, val.dtype.itemsize)]
+            except KeyError:
+                raise UaError("Could not guess UA type of numpy array with dtype {0}, specify UA type".format(val.dtype))
         if isinstance(val, (list, tuple)):
             error_val = val
             while val and isinstance(val[0], (list, tuple)):
@@ -812,6 +1012,26 @@ class Variant(FrozenClass):
 
 
 
+# VariantType of numpy arrays, from dtype kind and item size
+_numpy_varianttypes = {
+    ("b", 1): VariantType.Boolean,
+    ("i", 1): VariantType.SByte,
+    ("u", 1): VariantType.Byte,
+    ("i", 2): VariantType.Int16,
+    ("u", 2): VariantType.UInt16,
+    ("i", 4): VariantType.Int32,
+    ("u", 4): VariantType.UInt32,
+    ("i", 8): VariantType.Int64,
+    ("u", 8): VariantType.UInt64,
+    ("f", 4): VariantType.Float,
+    ("f", 8): VariantType.Double,
+}
+
+
+def _is_ndarray(val):
+    return numpy is not None and isinstance(val, numpy.ndarray)
+
+
 def _split_list(l, n):
     n = max(1, n)
     return [l[i:i + n] for i in range(0, len(l), n)]
@@ -850,7 +1070,7 @@ def get_shape(mylist):
     return dims
 
 
-class DataValue(FrozenClass):
+class DataValue(_SlotsClass):
     """
     A value with an associated timestamp, and quality.
     Automatically generated from xml , copied and modified here to fix errors in xml spec
@@ -869,6 +1089,9 @@ class DataValue(FrozenClass):
     :vartype ServerPicoseconds: int
     """
 
+    __slots__ = ("Encoding", "Value", "StatusCode", "SourceTimestamp", "SourcePicoseconds",
+                 "ServerTimestamp", "ServerPicoseconds")
+
     ua_switches = {
         'Value': ('Encoding', 0),
         'StatusCode': ('Encoding', 1),
@@ -901,7 +1124,22 @@ class DataValue(FrozenClass):
         self.SourcePicoseconds = None
         self.ServerTimestamp = None  # DateTime()
         self.ServerPicoseconds = None
-        self._freeze = True
+
+    @classmethod
+    def from_trusted(cls, variant, status=None, source_timestamp=None, server_timestamp=None):
+        """
+        Create a DataValue without checking arguments.
+        variant must be a Variant instance, status a StatusCode or None
+        """
+        obj = cls.__new__(cls)
+        obj.Encoding = 0
+        obj.Value = variant
+        obj.StatusCode = StatusCode() if status is None else status
+        obj.SourceTimestamp = source_timestamp
+        obj.SourcePicoseconds = None
+        obj.ServerTimestamp = server_timestamp
+        obj.ServerPicoseconds = None
+        return obj
 
     def __str__(self):
         s = 'DataValue(Value:{0}'.format(self.Value)
@@ -998,6 +1236,9 @@ def register_extension_object(name, nodeid, class_type):
     # add new extensions objects to ua modules to automate decoding
     import opcua.ua
     setattr(opcua.ua, name, class_type)
+    # make the binary decoder use the new class for fields of this type
+    from opcua.ua.ua_binary import register_uatype_class
+    register_uatype_class(name, class_type)
 
 
 def get_extensionobject_class_type(typeid):
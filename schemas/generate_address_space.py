@@ -328,6 +328,17 @@ def save_aspace_to_disk():
     standard_address_space.fill_address_space(NodeManagementService(aspace))
     aspace.dump(path)
 
+
+def save_aspace_snapshot():
+    sys.path.append("..")
+    from opcua.server.standard_address_space import standard_address_space
+    from opcua.server.address_space import NodeManagementService, AddressSpace
+    path = standard_address_space.SNAPSHOT_PATH
+    print("Saving standard address space snapshot to:", path)
+    aspace = AddressSpace()
+    standard_address_space.fill_address_space(NodeManagementService(aspace))
+    aspace.make_aspace_snapshot(path)
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.WARN)
     for i in (3, 4, 5, 8, 9, 10, 11, 13):
@@ -337,3 +348,4 @@ if __name__ == "__main__":
         c.run()
 
     save_aspace_to_disk()
+    save_aspace_snapshot()
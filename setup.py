@@ -13,6 +13,7 @@ setup(name="opcua",
       author_email="olivier.roulet@gmail.com",
       url='http://freeopcua.github.io/',
       packages=find_packages(),
+      package_data={"opcua.server.standard_address_space": ["*.snapshot"]},
       provides=["opcua"],
       license="GNU Lesser General Public License v3 or later",
       install_requires=install_requires,
@@ -1,23 +1,26 @@
 import unittest
 import os
 import shelve
+import shutil
 import time
 from enum import EnumMeta
 
 from tests_common import CommonTests, add_server_methods
 from tests_xml import XmlTests
-from tests_subscriptions import SubscriptionTests
+from tests_subscriptions import SubscriptionTests, MySubHandler2
 from datetime import timedelta
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkdtemp
 
 import opcua
 from opcua import Server
 from opcua import Client
 from opcua import ua
 from opcua import uamethod
+from opcua.ua import uaerrors
 from opcua.common.event_objects import BaseEvent, AuditEvent, AuditChannelEvent, AuditSecurityEvent, AuditOpenSecureChannelEvent
 from opcua.common import ua_utils
 from opcua.server.registration_service import RegistrationService
+from opcua.server.standard_address_space import standard_address_space
 
 
 port_num = 48540
@@ -146,6 +149,60 @@ class TestServer(unittest.TestCase, CommonTests, SubscriptionTests, XmlTests):
         result = o.call_method(v, ua.Variant(2.1))
         self.assertEqual(result, 4.2)
 
+    def test_set_values(self):
+        o = self.opc.get_objects_node()
+        v1 = o.add_variable(3, 'SetValues1', 1)
+        v2 = o.add_variable(3, 'SetValues2', 2.0)
+        v3 = o.add_variable(3, 'SetValues3', "3")
+        handler = MySubHandler2()
+        sub = self.opc.create_subscription(10, handler)
+        sub.subscribe_data_change([v1, v2])
+        self.opc.set_values([v1, v2.nodeid, v3],
+                            [4, ua.Variant(5.0, ua.VariantType.Double), ua.DataValue(ua.Variant("6"))])
+        self.assertEqual([v.get_value() for v in (v1, v2, v3)], [4, 5.0, "6"])
+        for _ in range(100):
+            if (v1, 4) in handler.results and (v2, 5.0) in handler.results:
+                break
+            time.sleep(0.01)
+        self.assertIn((v1, 4), handler.results)
+        self.assertIn((v2, 5.0), handler.results)
+        with self.assertRaises(ua.UaStatusCodeError):
+            self.opc.set_values([v1, ua.NodeId(999999, 3)], [7, 8])
+        sub.delete()
+
+    def test_set_attribute_value_callback(self):
+        o = self.opc.get_objects_node()
+        v = o.add_variable(3, 'SampledValue', 0)
+        source = [1]
+        self.opc.set_attribute_value_callback(v.nodeid, lambda: ua.DataValue(ua.Variant(source[0])))
+        self.assertEqual(v.get_value(), 1)
+        handler = MySubHandler2()
+        sub = self.opc.create_subscription(50, handler)
+        sub.subscribe_data_change(v)
+        source[0] = 2
+        for _ in range(100):
+            if (v, 2) in handler.results:
+                break
+            time.sleep(0.01)
+        self.assertEqual(handler.results, [(v, 1), (v, 2)])
+        sub.delete()
+        self.opc.set_attribute_value_callback(v.nodeid, None)
+        self.assertEqual(v.get_value(), 0)
+
+    def test_delete_many_monitored_items(self):
+        o = self.opc.get_objects_node()
+        v = o.add_variable(3, 'ManyMonitoredItems', 0)
+        sub = self.opc.create_subscription(100, MySubHandler2())
+        handles = sub.subscribe_data_change([v] * 1000)
+        sub.subscribe_events()
+        srv = self.opc.iserver.subscription_service.subscriptions[sub.subscription_id].monitored_item_srv
+        self.assertEqual(len(srv._monitored_items), 1001)
+        sub.unsubscribe(handles[500])
+        self.assertEqual(len(srv._monitored_datachange), 999)
+        sub.delete()
+        self.assertEqual((srv._monitored_items, srv._monitored_events, srv._monitored_datachange), ({}, {}, {}))
+        self.assertEqual(self.opc.iserver.aspace[v.nodeid].attributes[ua.AttributeIds.Value].datachange_callbacks, {})
+
     def test_historize_variable(self):
         o = self.opc.get_objects_node()
         var = o.add_variable(3, "test_hist", 1.0)
@@ -519,6 +576,33 @@ class TestServer(unittest.TestCase, CommonTests, SubscriptionTests, XmlTests):
         self.assertTrue(hasattr(e, "v3"))
         self.assertEqual(getattr(e, "v3"), 4)
 
+    def test_xml_import_atomic(self):
+        xml = """<?xml version="1.0" encoding="utf-8"?>
+<UANodeSet xmlns="http://opcfoundation.org/UA/2011/03/UANodeSet.xsd">
+  <NamespaceUris>
+    <Uri>http://examples.freeopcua.github.io/atomic</Uri>
+  </NamespaceUris>
+  <UAObject NodeId="ns=1;i=1" BrowseName="1:AtomicFolder">
+    <References>
+      <Reference ReferenceType="HasTypeDefinition">i=61</Reference>
+      <Reference ReferenceType="Organizes" IsForward="false">i=85</Reference>
+    </References>
+  </UAObject>
+  <UAObject NodeId="ns=1;i=2" BrowseName="1:AtomicOrphan">
+    <References>
+      <Reference ReferenceType="HasTypeDefinition">i=58</Reference>
+      <Reference ReferenceType="Organizes" IsForward="false">ns=1;i=1000</Reference>
+    </References>
+  </UAObject>
+</UANodeSet>
+"""
+        # the folder is valid but is not added since the other node is rejected
+        with self.assertRaises(uaerrors.BadParentNodeIdInvalid):
+            self.opc.import_xml(xmlstring=xml)
+        idx = self.opc.get_namespace_index("http://examples.freeopcua.github.io/atomic")
+        with self.assertRaises(uaerrors.BadNodeIdUnknown):
+            self.opc.get_node(ua.NodeId(1, idx)).get_browse_name()
+
 
 
 
@@ -612,6 +696,48 @@ class TestServerCaching(unittest.TestCase):
         os.remove(path)
 
 
+class TestServerStandardSnapshot(unittest.TestCase):
+    """
+    the snapshot of the standard address space shipped with the package is used when it exists,
+    otherwise the address space is built from code
+    """
+
+    def setUp(self):
+        self.path = standard_address_space.SNAPSHOT_PATH
+
+    def tearDown(self):
+        standard_address_space.SNAPSHOT_PATH = self.path
+
+    def _check_server(self, from_snapshot):
+        server = Server()
+        self.assertEqual(server.iserver.aspace._shards[0].snapshot is not None, from_snapshot)
+        self.assertEqual(server.get_node(ua.ObjectIds.Server).get_browse_name(), ua.QualifiedName("Server", 0))
+        self.assertEqual(server.get_namespace_array()[0], "http://opcfoundation.org/UA/")
+
+    def test_shipped_snapshot(self):
+        self.assertTrue(os.path.isfile(self.path))
+        self._check_server(True)
+
+    def test_missing_snapshot(self):
+        tmpdir = mkdtemp()
+        try:
+            standard_address_space.SNAPSHOT_PATH = os.path.join(tmpdir, "missing.snapshot")
+            self._check_server(False)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_unreadable_snapshot(self):
+        tmpdir = mkdtemp()
+        try:
+            path = standard_address_space.SNAPSHOT_PATH = os.path.join(tmpdir, "bad.snapshot")
+            for data in (b"", b"not a snapshot, not a snapshot"):
+                with open(path, "wb") as f:
+                    f.write(data)
+                self._check_server(False)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
 class TestServerStartError(unittest.TestCase):
 
     def test_port_in_use(self):
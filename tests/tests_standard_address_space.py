@@ -1,11 +1,19 @@
 import unittest
 import os.path
+import tempfile
+import shutil
+import sqlite3
+import threading
 import xml.etree.ElementTree as ET
 
 from opcua import ua
 from opcua.server.address_space import AddressSpace
+from opcua.server.address_space import NodeData
 from opcua.server.address_space import NodeManagementService
+from opcua.server.address_space import ViewService
+from opcua.server.address_space_sql import NodeStoreSQLite
 from opcua.server.standard_address_space import standard_address_space
+from opcua.ua.ua_binary import struct_to_binary
 
 def find_elem(parent, name, ns = None):
     if ns is None:
@@ -60,3 +68,372 @@ class StandardAddressSpaceTests(unittest.TestCase):
             refs = set((r.ReferenceTypeId.to_string(), r.NodeId.to_string(), r.IsForward) for r in self.aspace[k].references)
             xml_refs = set((r.attrib['ReferenceType'], r.text, r.attrib.get('IsForward', 'true') == 'true') for r in find_elem(std_nodes[k.to_string()], 'References'))
             self.assertTrue(len(xml_refs-refs)==0)
+
+    def test_reference_index(self):
+        for k in self.aspace.keys():
+            nodedata = self.aspace[k]
+            indexed = [ref for bucket in nodedata.reference_index.values() for ref in bucket.values()]
+            self.assertEqual(len(indexed), len(nodedata.references))
+            for ref in nodedata.references:
+                self.assertIs(nodedata.find_reference(ref.ReferenceTypeId, ref.IsForward, ref.NodeId), ref)
+                first = nodedata.browse_name_index[(ref.ReferenceTypeId, ref.IsForward)][ref.BrowseName]
+                self.assertEqual(first.BrowseName, ref.BrowseName)
+        item = ua.DeleteReferencesItem()
+        item.SourceNodeId = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+        item.TargetNodeId = ua.NodeId(ua.ObjectIds.Server)
+        item.ReferenceTypeId = ua.NodeId(ua.ObjectIds.Organizes)
+        item.IsForward = True
+        self.assertTrue(self.node_mgt_service.delete_references([item])[0].is_good())
+        nodedata = self.aspace[item.SourceNodeId]
+        self.assertIsNone(nodedata.find_reference(item.ReferenceTypeId, True, item.TargetNodeId))
+        self.assertNotIn(item.TargetNodeId, [ref.NodeId for ref in nodedata.references])
+
+    def test_reference_subtypes(self):
+        hierarchical = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+        subtypes = self.aspace.get_reference_subtypes(hierarchical)
+        for refid in (ua.ObjectIds.Organizes, ua.ObjectIds.HasComponent, ua.ObjectIds.HasProperty):
+            self.assertIn(ua.NodeId(refid), subtypes)
+        self.assertNotIn(ua.NodeId(ua.ObjectIds.HasTypeDefinition), subtypes)
+        self.assertIs(self.aspace.get_reference_subtypes(hierarchical), subtypes)
+        # the cache is cleared when a reference type is added
+        item = ua.AddNodesItem()
+        item.RequestedNewNodeId = ua.NodeId(1000, 1)
+        item.BrowseName = ua.QualifiedName("MyOrganizes", 1)
+        item.NodeClass = ua.NodeClass.ReferenceType
+        item.ParentNodeId = ua.NodeId(ua.ObjectIds.Organizes)
+        item.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HasSubtype)
+        item.NodeAttributes = ua.ReferenceTypeAttributes()
+        self.assertTrue(self.node_mgt_service.add_nodes([item])[0].StatusCode.is_good())
+        self.assertIn(item.RequestedNewNodeId, self.aspace.get_reference_subtypes(hierarchical))
+        has_component = ua.NodeId(ua.ObjectIds.HasComponent)
+        self.assertNotIn(item.RequestedNewNodeId, self.aspace.get_reference_subtypes(has_component))
+        # a closure computed while the hierarchy changes is not cached, even if the cache was empty
+        self.aspace.clear_reference_subtypes()
+        get = self.aspace.get
+
+        def get_while_changed(nodeid):
+            del self.aspace.get
+            self.aspace.clear_reference_subtypes()
+            return get(nodeid)
+
+        self.aspace.get = get_while_changed
+        self.aspace.get_reference_subtypes(has_component)
+        self.assertNotIn(has_component, self.aspace._reference_subtypes)
+
+    def test_translate_browse_path(self):
+        view_service = ViewService(self.aspace)
+        path = ua.BrowsePath()
+        path.StartingNode = ua.NodeId(ua.ObjectIds.RootFolder)
+        for name, inverse in (("Objects", False), ("Server", False), ("ServerStatus", False), ("Server", True)):
+            el = ua.RelativePathElement()
+            el.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+            el.IncludeSubtypes = True
+            el.IsInverse = inverse
+            el.TargetName = ua.QualifiedName(name, 0)
+            path.RelativePath.Elements.append(el)
+        result = view_service.translate_browsepaths_to_nodeids([path])[0]
+        self.assertTrue(result.StatusCode.is_good())
+        self.assertEqual(result.Targets[0].TargetId, ua.NodeId(ua.ObjectIds.Server))
+        # direction and reference type are checked
+        path.RelativePath.Elements[-1].IsInverse = False
+        self.assertEqual(view_service.translate_browsepaths_to_nodeids([path])[0].StatusCode.value,
+                         ua.StatusCodes.BadNoMatch)
+        path.RelativePath.Elements[-1].IsInverse = True
+        path.RelativePath.Elements[-1].ReferenceTypeId = ua.NodeId(ua.ObjectIds.HasProperty)
+        self.assertEqual(view_service.translate_browsepaths_to_nodeids([path])[0].StatusCode.value,
+                         ua.StatusCodes.BadNoMatch)
+
+    def _check_same_nodes(self, aspace):
+        self.assertEqual(set(aspace.keys()), set(self.aspace.keys()))
+        for k in self.aspace.keys():
+            expected = self.aspace[k]
+            nodedata = aspace[k]
+            self.assertEqual(set(nodedata.attributes.keys()), set(expected.attributes.keys()))
+            for attr, attval in expected.attributes.items():
+                self.assertEqual(struct_to_binary(nodedata.attributes[attr].value), struct_to_binary(attval.value))
+            self.assertEqual([struct_to_binary(ref) for ref in nodedata.references],
+                             [struct_to_binary(ref) for ref in expected.references])
+            self.assertEqual(nodedata.reference_index.keys(), expected.reference_index.keys())
+
+    def test_shipped_snapshot_up_to_date(self):
+        # the server loads the shipped snapshot instead of the generated code, when this fails
+        # regenerate it with schemas/generate_address_space.py
+        aspace = AddressSpace()
+        aspace.load_aspace_snapshot(standard_address_space.SNAPSHOT_PATH)
+        self._check_same_nodes(aspace)
+
+    def test_aspace_snapshot(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.aspace.make_aspace_snapshot(path)
+            aspace = AddressSpace()
+            aspace.load_aspace_snapshot(path)
+            self._check_same_nodes(aspace)
+            nodeclass = aspace.get_attribute_value(ua.NodeId(ua.ObjectIds.Server), ua.AttributeIds.NodeClass)
+            self.assertIsInstance(nodeclass.Value.Value, ua.NodeClass)
+            # nodes not decoded yet can be deleted
+            aspace = AddressSpace()
+            aspace.load_aspace_snapshot(path)
+            nodeid = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+            self.assertIn(nodeid, aspace)
+            del aspace[nodeid]
+            self.assertNotIn(nodeid, aspace)
+            self.assertIsNone(aspace.get(nodeid))
+            self.assertNotIn(nodeid, aspace.keys())
+        finally:
+            os.remove(path)
+
+    def test_aspace_shelf_concurrent_reads(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "aspace")
+        try:
+            self.aspace.make_aspace_shelf(path)
+            aspace = AddressSpace()
+            aspace.load_aspace_shelf(path)
+            nodeids = [ua.NodeId(ua.ObjectIds.Server), ua.NodeId(ua.ObjectIds.ObjectsFolder)]
+            results = []
+
+            def reader():
+                results.append([aspace.get(nodeid) for nodeid in nodeids])
+
+            threads = [threading.Thread(target=reader) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            # every reader got the node loaded in the cache, a write would be seen by all
+            for nodes in results:
+                self.assertIs(nodes[0], results[0][0])
+                self.assertIs(nodes[1], results[0][1])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_node_store_sqlite(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "aspace.db")
+        try:
+            expected = dict((k, struct_to_binary(self.aspace[k].attributes[ua.AttributeIds.BrowseName].value))
+                            for k in self.aspace.keys())
+            store = NodeStoreSQLite(path, cache_size=100)
+            self.aspace.set_node_store(store)
+            self.assertEqual(set(self.aspace.keys()), set(expected.keys()))
+            # nodes are written back when they leave the cache
+            nodeid = ua.NodeId(ua.ObjectIds.Server_ServiceLevel)
+            dv = ua.DataValue(ua.Variant(42, ua.VariantType.Byte))
+            self.assertTrue(self.aspace.set_attribute_value(nodeid, ua.AttributeIds.Value, dv).is_good())
+            item = ua.AddNodesItem()
+            item.RequestedNewNodeId = ua.NodeId("MyFolder", 2)
+            item.BrowseName = ua.QualifiedName("MyFolder", 2)
+            item.NodeClass = ua.NodeClass.Object
+            item.ParentNodeId = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+            item.ReferenceTypeId = ua.NodeId(ua.ObjectIds.Organizes)
+            item.TypeDefinition = ua.NodeId(ua.ObjectIds.FolderType)
+            item.NodeAttributes = ua.ObjectAttributes()
+            self.assertTrue(self.node_mgt_service.add_nodes([item])[0].StatusCode.is_good())
+            for k in expected:
+                self.assertEqual(struct_to_binary(self.aspace[k].attributes[ua.AttributeIds.BrowseName].value),
+                                 expected[k])
+            # equal nodeids with another encoding find the same node
+            self.assertIn(ua.TwoByteNodeId(ua.ObjectIds.ObjectsFolder), self.aspace)
+            del self.aspace[ua.NodeId(ua.ObjectIds.Server_ServerRedundancy)]
+            store.close()
+
+            aspace = AddressSpace()
+            aspace.set_node_store(NodeStoreSQLite(path, cache_size=100))
+            self.assertEqual(aspace.get_attribute_value(nodeid, ua.AttributeIds.Value).Value.Value, 42)
+            self.assertIn(item.RequestedNewNodeId, aspace)
+            objects = aspace[ua.NodeId(ua.ObjectIds.ObjectsFolder)]
+            self.assertIsNotNone(objects.find_reference(item.ReferenceTypeId, True, item.RequestedNewNodeId))
+            self.assertNotIn(ua.NodeId(ua.ObjectIds.Server_ServerRedundancy), aspace)
+            self.assertEqual(len(aspace.keys()), len(expected))
+            store = aspace._default_store
+            self.assertEqual(store.keys(2), [item.RequestedNewNodeId])
+            self.assertEqual(len(store.keys(0)), len(expected) - 1)
+            self.assertEqual([key for key, _ in store.items(2)], [item.RequestedNewNodeId])
+            # a callback keeps the node in memory while other nodes go through the cache
+            changes = []
+            aspace.add_datachange_callback(nodeid, ua.AttributeIds.Value, lambda handle, dv: changes.append(dv))
+            for k in list(expected)[:300]:
+                aspace.get(k)
+            aspace.set_attribute_value(nodeid, ua.AttributeIds.Value, ua.DataValue(ua.Variant(43, ua.VariantType.Byte)))
+            self.assertEqual([dv.Value.Value for dv in changes], [43])
+            store.close()
+
+            # changes are committed without waiting for flush() once enough nodes are changed
+            store = NodeStoreSQLite(path, cache_size=100, commit_interval=3600, commit_size=2)
+            aspace = AddressSpace()
+            aspace.set_node_store(store)
+            for value in (44, 45):
+                dv = ua.DataValue(ua.Variant(value, ua.VariantType.Byte))
+                aspace.set_attribute_value(nodeid, ua.AttributeIds.Value, dv)
+            aspace2 = AddressSpace()
+            aspace2.set_node_store(NodeStoreSQLite(path, cache_size=100))
+            self.assertEqual(aspace2.get_attribute_value(nodeid, ua.AttributeIds.Value).Value.Value, 45)
+            aspace2._default_store.close()
+            # or once commit_interval is elapsed
+            store._commit_interval = 0
+            aspace.set_attribute_value(nodeid, ua.AttributeIds.Value, ua.DataValue(ua.Variant(46, ua.VariantType.Byte)))
+            aspace2 = AddressSpace()
+            aspace2.set_node_store(NodeStoreSQLite(path, cache_size=100))
+            self.assertEqual(aspace2.get_attribute_value(nodeid, ua.AttributeIds.Value).Value.Value, 46)
+            aspace2._default_store.close()
+            store.close()
+
+            # databases without the NamespaceIndex column are upgraded
+            conn = sqlite3.connect(path)
+            conn.execute('CREATE TABLE Old AS SELECT NodeId, Data FROM Nodes')
+            conn.execute('DROP TABLE Nodes')
+            conn.execute('ALTER TABLE Old RENAME TO Nodes')
+            conn.commit()
+            conn.close()
+            store = NodeStoreSQLite(path)
+            self.assertEqual(store.keys(2), [item.RequestedNewNodeId])
+            store.close()
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_bulk_add_nodes(self):
+        def make_item(nodeid, parent, name):
+            item = ua.AddNodesItem()
+            item.RequestedNewNodeId = nodeid
+            item.BrowseName = ua.QualifiedName(name, 2)
+            item.NodeClass = ua.NodeClass.Variable
+            item.ParentNodeId = parent
+            item.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HasComponent)
+            item.TypeDefinition = ua.NodeId(ua.ObjectIds.BaseDataVariableType)
+            attrs = ua.VariableAttributes()
+            attrs.DisplayName = ua.LocalizedText(name)
+            attrs.Value = ua.Variant(1.0)
+            item.NodeAttributes = attrs
+            return item
+
+        objects = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+        folder = make_item(ua.NodeId("Folder", 2), objects, "Folder")
+        folder.NodeClass = ua.NodeClass.Object
+        folder.ReferenceTypeId = ua.NodeId(ua.ObjectIds.Organizes)
+        folder.TypeDefinition = ua.NodeId(ua.ObjectIds.FolderType)
+        folder.NodeAttributes = ua.ObjectAttributes()
+        items = [
+            make_item(ua.NodeId("Child", 2), folder.RequestedNewNodeId, "Child"),  # parent comes later
+            folder,
+            make_item(ua.NodeId("Folder", 2), objects, "Duplicate"),
+            make_item(ua.NodeId("Orphan", 2), ua.NodeId("Missing", 2), "Orphan"),
+            make_item(ua.NodeId("OrphanChild", 2), ua.NodeId("Orphan", 2), "OrphanChild"),
+            make_item(ua.NodeId(0, 2), folder.RequestedNewNodeId, "Generated"),
+        ]
+        ref = ua.AddReferencesItem()
+        ref.SourceNodeId = ua.NodeId("Child", 2)
+        ref.TargetNodeId = folder.RequestedNewNodeId
+        ref.ReferenceTypeId = ua.NodeId(ua.ObjectIds.Organizes)
+        ref.IsForward = True
+        bad_ref = ua.AddReferencesItem()
+        bad_ref.SourceNodeId = ua.NodeId("Orphan", 2)
+        bad_ref.TargetNodeId = objects
+        results, ref_results = self.node_mgt_service.bulk_add_nodes(items, [ref, bad_ref])
+        self.assertEqual([r.StatusCode.value for r in results],
+                         [ua.StatusCodes.Good, ua.StatusCodes.Good, ua.StatusCodes.BadNodeIdExists,
+                          ua.StatusCodes.BadParentNodeIdInvalid, ua.StatusCodes.BadParentNodeIdInvalid,
+                          ua.StatusCodes.Good])
+        self.assertEqual([sc.value for sc in ref_results],
+                         [ua.StatusCodes.Good, ua.StatusCodes.BadSourceNodeIdInvalid])
+        generated = results[-1].AddedNodeId
+        self.assertFalse(generated.has_null_identifier())
+        self.assertNotIn(ua.NodeId("Orphan", 2), self.aspace)
+
+        has_component = ua.NodeId(ua.ObjectIds.HasComponent)
+        organizes = ua.NodeId(ua.ObjectIds.Organizes)
+        folderdata = self.aspace[folder.RequestedNewNodeId]
+        self.assertIsNotNone(folderdata.find_reference(has_component, True, ua.NodeId("Child", 2)))
+        self.assertIsNotNone(folderdata.find_reference(has_component, True, generated))
+        self.assertIsNotNone(self.aspace[objects].find_reference(organizes, True, folder.RequestedNewNodeId))
+        childdata = self.aspace[ua.NodeId("Child", 2)]
+        self.assertEqual(childdata.attributes[ua.AttributeIds.BrowseName].value.Value.Value,
+                         ua.QualifiedName("Child", 2))
+        self.assertEqual(childdata.attributes[ua.AttributeIds.Value].value.Value.Value, 1.0)
+        parentref = childdata.find_reference(has_component, False, folder.RequestedNewNodeId)
+        self.assertEqual(parentref.NodeClass, ua.NodeClass.Object)
+        self.assertEqual(parentref.BrowseName, ua.QualifiedName("Folder", 2))
+        self.assertIsNotNone(childdata.find_reference(ua.NodeId(ua.ObjectIds.HasTypeDefinition), True,
+                                                      ua.NodeId(ua.ObjectIds.BaseDataVariableType)))
+        self.assertEqual(childdata.find_reference(organizes, True, folder.RequestedNewNodeId).BrowseName,
+                         ua.QualifiedName("Folder", 2))
+        self.assertEqual(folderdata.find_reference(has_component, True, generated).BrowseName,
+                         ua.QualifiedName("Generated", 2))
+
+        # atomic: nothing is added when a node is rejected
+        ref.SourceNodeId = ua.NodeId("Atomic", 2)
+        items = [make_item(ua.NodeId("Atomic", 2), objects, "Atomic"),
+                 make_item(ua.NodeId("Child", 2), objects, "Child")]
+        results, ref_results = self.node_mgt_service.bulk_add_nodes(items, [ref], atomic=True)
+        self.assertEqual([r.StatusCode.value for r in results],
+                         [ua.StatusCodes.BadOperationAbandoned, ua.StatusCodes.BadNodeIdExists])
+        self.assertEqual([sc.value for sc in ref_results], [ua.StatusCodes.BadOperationAbandoned])
+        self.assertNotIn(ua.NodeId("Atomic", 2), self.aspace)
+        self.assertIsNone(self.aspace[objects].find_reference(has_component, True, ua.NodeId("Atomic", 2)))
+        # the nodes added before a conflicting node added after the validation are removed
+        add_nodes = self.aspace.add_nodes
+
+        def add_nodes_after_other(nodes):
+            self.aspace[ua.NodeId("Late", 2)] = NodeData(ua.NodeId("Late", 2))
+            return add_nodes(nodes)
+
+        self.aspace.add_nodes = add_nodes_after_other
+        items = [make_item(ua.NodeId("Atomic", 2), objects, "Atomic"), make_item(ua.NodeId("Late", 2), objects, "Late")]
+        results, ref_results = self.node_mgt_service.bulk_add_nodes(items, [ref], atomic=True)
+        del self.aspace.add_nodes
+        self.assertEqual([r.StatusCode.value for r in results],
+                         [ua.StatusCodes.BadOperationAbandoned, ua.StatusCodes.BadNodeIdExists])
+        self.assertNotIn(ua.NodeId("Atomic", 2), self.aspace)
+        self.assertIsNone(self.aspace[objects].find_reference(has_component, True, ua.NodeId("Atomic", 2)))
+
+    def test_generate_nodeid(self):
+        self.assertEqual(self.aspace.generate_nodeid(3), ua.NodeId(1, 3))
+        self.aspace[ua.NodeId(1000, 3)] = NodeData(ua.NodeId(1000, 3))
+        self.assertEqual(self.aspace.generate_nodeid(3), ua.NodeId(2, 3))
+        # on a collision the identifiers jump above the biggest one of the namespace
+        self.aspace[ua.NodeId(3, 3)] = NodeData(ua.NodeId(3, 3))
+        self.assertEqual(self.aspace.generate_nodeid(3), ua.NodeId(1001, 3))
+        self.assertEqual(self.aspace.generate_nodeid(3), ua.NodeId(1002, 3))
+        # a namespace used before starts after its biggest identifier
+        self.aspace[ua.NodeId(50, 4)] = NodeData(ua.NodeId(50, 4))
+        self.assertEqual(self.aspace.generate_nodeid(4), ua.NodeId(51, 4))
+        for _ in range(100):
+            self.assertNotIn(self.aspace.generate_nodeid(0), self.aspace)
+
+    def test_namespace_shards(self):
+        tmpdir = tempfile.mkdtemp()
+        snapshot_path = os.path.join(tmpdir, "aspace.snapshot")
+        db_path = os.path.join(tmpdir, "aspace.db")
+        try:
+            # standard address space from a snapshot, application nodes in a database
+            self.aspace.make_aspace_snapshot(snapshot_path)
+            aspace = AddressSpace()
+            aspace.load_aspace_snapshot(snapshot_path)
+            store = NodeStoreSQLite(db_path)
+            aspace.set_node_store(store, namespaces=[2])
+            item = ua.AddNodesItem()
+            item.RequestedNewNodeId = ua.NodeId("MyFolder", 2)
+            item.BrowseName = ua.QualifiedName("MyFolder", 2)
+            item.NodeClass = ua.NodeClass.Object
+            item.ParentNodeId = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+            item.ReferenceTypeId = ua.NodeId(ua.ObjectIds.Organizes)
+            item.TypeDefinition = ua.NodeId(ua.ObjectIds.FolderType)
+            item.NodeAttributes = ua.ObjectAttributes()
+            self.assertTrue(NodeManagementService(aspace).add_nodes([item])[0].StatusCode.is_good())
+            self.assertIn(item.RequestedNewNodeId, store)
+            self.assertNotIn(item.ParentNodeId, store)
+            self.assertEqual(set(aspace.keys()), set(self.aspace.keys()) | set([item.RequestedNewNodeId]))
+            self.assertEqual(aspace.generate_nodeid(2).NamespaceIndex, 2)
+
+            # readers of namespace 0 do not wait on a writer to namespace 2
+            results = []
+            reader = threading.Thread(target=lambda: results.append(aspace.get(ua.NodeId(ua.ObjectIds.Server))))
+            with aspace._get_shard(2).lock.write:
+                reader.start()
+                reader.join(5)
+                self.assertEqual(len(results), 1)
+                self.assertIsNotNone(results[0])
+            store.close()
+        finally:
+            shutil.rmtree(tmpdir)
@@ -218,6 +218,37 @@ class SubscriptionTests(object):
         with self.assertRaises(ua.UaStatusCodeError):
             sub.unsubscribe(handle1)  # sub does not exist anymore
 
+    def test_subscription_data_change_shared(self):
+        """
+        the value change of a node monitored by several subscriptions is encoded once
+        and sent to all of them
+        """
+        myhandler1 = MySubHandler()
+        myhandler2 = MySubHandler()
+        o = self.opc.get_objects_node()
+        v1 = o.add_variable(3, 'SubscriptionVariableShared', 1.5)
+        sub1 = self.opc.create_subscription(100, myhandler1)
+        sub2 = self.opc.create_subscription(100, myhandler2)
+        sub1.subscribe_data_change(v1)
+        sub2.subscribe_data_change(v1)
+        for myhandler in (myhandler1, myhandler2):
+            node, val, data = myhandler.future.result(5)
+            self.assertEqual(val, 1.5)
+            myhandler.reset()
+
+        timestamp = datetime(2018, 1, 2, 3, 4, 5)
+        dv = ua.DataValue(ua.Variant(2.5, ua.VariantType.Double))
+        dv.SourceTimestamp = timestamp
+        v1.set_value(dv)
+        for myhandler in (myhandler1, myhandler2):
+            node, val, data = myhandler.future.result(5)
+            self.assertEqual(node, v1)
+            self.assertEqual(val, 2.5)
+            self.assertEqual(data.monitored_item.Value.SourceTimestamp, timestamp)
+
+        sub1.delete()
+        sub2.delete()
+
     def test_subscription_data_change_bool(self):
         """
         test subscriptions. This is far too complicated for
@@ -2,26 +2,44 @@
 #! /usr/bin/env python
 import logging
 import io
+import copy
 from datetime import datetime
 import unittest
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import uuid
+import threading
+import time
 
 from opcua import ua
 from opcua.ua.ua_binary import extensionobject_from_binary
 from opcua.ua.ua_binary import extensionobject_to_binary
 from opcua.ua.ua_binary import nodeid_to_binary, variant_to_binary, _reshape, variant_from_binary, nodeid_from_binary
-from opcua.ua.ua_binary import struct_to_binary, struct_from_binary
+from opcua.ua.ua_binary import struct_to_binary, struct_from_binary, write_struct, use_numpy_arrays
+from opcua.ua.ua_binary import use_lazy_extension_objects, LazyExtensionObject, CachedDataValue
 from opcua.ua import flatten, get_shape
-from opcua.server.internal_subscription import WhereClauseEvaluator
+from opcua.server.internal_subscription import WhereClauseEvaluator, InternalSubscription
+from opcua.server.subscription_service import SubscriptionService
 from opcua.common.event_objects import BaseEvent
+from opcua.common.node import Node
 from opcua.common.ua_utils import string_to_variant, variant_to_string, string_to_val, val_to_string
 from opcua.common.xmlimporter import XmlImporter
 from opcua.ua.uatypes import _MaskEnum
 from opcua.common.structures import StructGenerator
 from opcua.common.connection import MessageChunk
+from opcua.common.utils import ReadWriteLock, ThreadLoop
+from opcua.server.timer_wheel import TimerWheel
 from opcua.ua.uaerrors import UaError
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
 
 class TestUnit(unittest.TestCase):
 
@@ -255,6 +273,409 @@ class TestUnit(unittest.TestCase):
         obj2 = struct_from_binary(ua.XmlElement, ua.utils.Buffer(b))
         self.assertEqual(obj, obj2)
 
+    def test_struct_codec(self):
+        resp = ua.ReadResponse()
+        dv = ua.DataValue(ua.Variant(4.5))
+        dv.SourceTimestamp = datetime(2017, 4, 5, 12, 30)
+        resp.Results = [dv, ua.DataValue(ua.Variant("titi"), ua.StatusCode(ua.StatusCodes.BadNotReadable))]
+        b = struct_to_binary(resp)
+        self.assertIn(ua.ReadResponse, ua.ua_binary._struct_writers)
+        self.assertEqual(dv.Encoding, 0b0111)  # switches are set when encoding
+        resp2 = struct_from_binary(ua.ReadResponse, ua.utils.Buffer(b))
+        self.assertIn(ua.ReadResponse, ua.ua_binary._struct_decoders)
+        self.assertEqual(resp2.Results[0].Value, dv.Value)
+        self.assertEqual(resp2.Results[0].SourceTimestamp, dv.SourceTimestamp)
+        self.assertIsNone(resp2.Results[0].ServerTimestamp)
+        self.assertEqual(resp2.Results[1].StatusCode, ua.StatusCode(ua.StatusCodes.BadNotReadable))
+        self.assertEqual(struct_to_binary(resp2), b)
+
+    def test_buffer_memoryview(self):
+        wv = ua.WriteValue()
+        wv.NodeId = ua.NodeId("titi", 3)
+        wv.IndexRange = "1:2"
+        wv.Value = ua.DataValue(ua.Variant(b"\x01\x02\x03" * 1000))
+        data = struct_to_binary(wv)
+        buf = ua.utils.Buffer(memoryview(data))
+        self.assertIsInstance(buf.copy(4).read(4), memoryview)
+        wv2 = struct_from_binary(ua.WriteValue, buf)
+        self.assertEqual(len(buf), 0)
+        self.assertIsInstance(wv2.Value.Value.Value, bytes)
+        self.assertEqual(wv2.Value.Value.Value, wv.Value.Value.Value)
+        self.assertEqual(wv2.NodeId, wv.NodeId)
+        self.assertEqual(wv2.IndexRange, "1:2")
+
+    def test_struct_codec_fixed_size_runs(self):
+        runs = list(ua.ua_binary._group_fields(ua.RequestHeader))
+        self.assertEqual([[field[0] for field in run] for run in runs],
+                         [["AuthenticationToken"], ["Timestamp", "RequestHandle", "ReturnDiagnostics"],
+                          ["AuditEntryId"], ["TimeoutHint"], ["AdditionalHeader"]])
+        hdr = ua.RequestHeader()
+        hdr.RequestHandle = 7
+        hdr.TimeoutHint = 1000
+        # the struct codes are text whatever the type of Struct.format
+        self.assertEqual([field[2] for field in runs[1]], ["q", "I", "I"])
+        data = struct_to_binary(hdr)
+        self.assertEqual(data, b"".join([
+            nodeid_to_binary(hdr.AuthenticationToken),
+            ua.ua_binary.Primitives.DateTime.pack(hdr.Timestamp),
+            ua.ua_binary.Primitives.UInt32.pack(7),
+            ua.ua_binary.Primitives.UInt32.pack(0),
+            ua.ua_binary.Primitives.String.pack(None),
+            ua.ua_binary.Primitives.UInt32.pack(1000),
+            extensionobject_to_binary(None)]))
+        hdr2 = struct_from_binary(ua.RequestHeader, ua.utils.Buffer(data))
+        self.assertEqual(hdr2.Timestamp, hdr.Timestamp)
+        self.assertEqual(hdr2.RequestHandle, 7)
+        self.assertEqual(hdr2.TimeoutHint, 1000)
+
+    def test_write_struct(self):
+        req = ua.WriteRequest()
+        wv = ua.WriteValue()
+        wv.NodeId = ua.NodeId("titi", 3)
+        wv.Value = ua.DataValue(ua.Variant(ua.Argument()))
+        req.Parameters.NodesToWrite = [wv, wv]
+        buf = bytearray(b"head")
+        write_struct(buf, req)
+        self.assertEqual(bytes(buf[:4]), b"head")
+        self.assertEqual(bytes(buf[4:]), struct_to_binary(req))
+        req2 = struct_from_binary(ua.WriteRequest, ua.utils.Buffer(bytes(buf[4:])))
+        self.assertEqual(req2.Parameters.NodesToWrite[1].Value.Value.Value.Name,
+                         wv.Value.Value.Value.Name)
+        # length of ExtensionObject body is patched after the body is written
+        arg = ua.Argument()
+        arg.Name = "x" * 300
+        b = extensionobject_to_binary(arg)
+        self.assertEqual(ua.ua_binary.Primitives.Int32.unpack(ua.utils.Buffer(b[5:9])), len(b) - 9)
+        self.assertEqual(extensionobject_from_binary(ua.utils.Buffer(b)).Name, arg.Name)
+
+    def test_lazy_extension_object(self):
+        params = ua.MonitoredItemCreateRequest()
+        params.RequestedParameters.Filter = ua.DataChangeFilter()
+        params.RequestedParameters.Filter.DeadbandValue = 2.5
+        params.RequestedParameters.QueueSize = 7
+        b = struct_to_binary(params)
+        use_lazy_extension_objects()
+        try:
+            params2 = struct_from_binary(ua.MonitoredItemCreateRequest, ua.utils.Buffer(b))
+        finally:
+            use_lazy_extension_objects(False)
+        filt = params2.RequestedParameters.Filter
+        self.assertIs(type(filt), LazyExtensionObject)
+        self.assertIsInstance(filt, ua.DataChangeFilter)
+        self.assertEqual(struct_to_binary(params2), b)
+        self.assertFalse(filt.is_decoded())
+        self.assertEqual(filt.DeadbandValue, 2.5)
+        self.assertTrue(filt.is_decoded())
+        filt.DeadbandValue = 4
+        params3 = struct_from_binary(ua.MonitoredItemCreateRequest, ua.utils.Buffer(struct_to_binary(params2)))
+        self.assertIsInstance(params3.RequestedParameters.Filter, ua.DataChangeFilter)
+        self.assertEqual(params3.RequestedParameters.Filter.DeadbandValue, 4)
+        self.assertEqual(params3.RequestedParameters.QueueSize, 7)
+
+    def test_uatype_registry(self):
+        class RegistryStruct(object):
+            ua_types = [("Value", "Int32")]
+
+            def __init__(self):
+                self.Value = 0
+
+        class RegistryContainer(object):
+            ua_types = [("Child", "RegistryStruct"), ("Children", "ListOfRegistryStruct")]
+
+            def __init__(self):
+                self.Child = RegistryStruct()
+                self.Children = []
+
+        ua.register_extension_object("RegistryStruct", ua.NodeId(5010, 2), RegistryStruct)
+        c = RegistryContainer()
+        c.Child.Value = 5
+        c.Children = [RegistryStruct()]
+        b = struct_to_binary(c)
+        self.assertIsInstance(struct_from_binary(RegistryContainer, ua.utils.Buffer(b)).Child, RegistryStruct)
+
+        # registering a new class for the name updates the decoders
+        class RegistryStruct2(RegistryStruct):
+            pass
+        ua.register_extension_object("RegistryStruct", ua.NodeId(5010, 2), RegistryStruct2)
+        c2 = struct_from_binary(RegistryContainer, ua.utils.Buffer(b))
+        self.assertIsInstance(c2.Child, RegistryStruct2)
+        self.assertIsInstance(c2.Children[0], RegistryStruct2)
+        self.assertEqual(c2.Child.Value, 5)
+        self.assertEqual(ua.ua_binary.from_binary("ListOfRegistryStruct", ua.utils.Buffer(b[4:]))[0].Value, 0)
+
+    def test_core_types_slots(self):
+        for obj in (ua.NodeId(1, 2), ua.StringNodeId("a", 2), ua.QualifiedName("a", 1), ua.LocalizedText("a"),
+                    ua.StatusCode(), ua.Variant(1), ua.DataValue(1)):
+            self.assertFalse(hasattr(obj, "__dict__"))
+            with self.assertRaises(AttributeError):
+                obj.Typo = 1
+        # state of objects pickled when these classes had a __dict__
+        nid = ua.NodeId.__new__(ua.NodeId)
+        nid.__setstate__({"Identifier": 5, "NamespaceIndex": 2, "NodeIdType": ua.NodeIdType.Numeric,
+                          "NamespaceUri": "", "ServerIndex": 0, "_freeze": True})
+        self.assertEqual(nid, ua.NodeId(5, 2))
+
+    def test_nodeid_interning(self):
+        nid = ua.NodeId("interning_test", 3)
+        shared = ua.intern_nodeid(nid)
+        self.assertIsNot(shared, nid)
+        self.assertEqual(shared, nid)
+        self.assertEqual(hash(shared), hash(nid))
+        self.assertIs(ua.intern_nodeid(ua.StringNodeId("interning_test", 3)), shared)
+        # decoded nodeids are the shared instance
+        self.assertIs(nodeid_from_binary(ua.utils.Buffer(nodeid_to_binary(nid))), shared)
+        self.assertIsNot(nodeid_from_binary(ua.utils.Buffer(nodeid_to_binary(ua.NodeId("other", 3)))), shared)
+        # copies are not shared
+        nid2 = copy.copy(shared)
+        nid2.NamespaceIndex = 4
+        self.assertEqual(hash(nid2), hash(ua.NodeId("interning_test", 4)))
+        # a shared nodeid cannot be modified, its copies can
+        for name, value in (("Identifier", "interning_test2"), ("NamespaceIndex", 4),
+                            ("NodeIdType", ua.NodeIdType.ByteString), ("NamespaceUri", "urn:test"),
+                            ("ServerIndex", 1)):
+            with self.assertRaises(TypeError):
+                setattr(shared, name, value)
+        self.assertIs(ua.get_interned_nodeid(ua.NodeIdType.String, 3, "interning_test"), shared)
+        self.assertEqual(shared, nid)
+        self.assertEqual(hash(shared), hash(nid))
+        nid3 = copy.deepcopy(shared)
+        nid3.Identifier = "interning_test2"
+        self.assertEqual(nid3, ua.NodeId("interning_test2", 3))
+        self.assertIs(ua.mutable_nodeid(nid), nid)
+        nid3 = ua.mutable_nodeid(shared)
+        self.assertIsNot(nid3, shared)
+        nid3.Identifier = "interning_test2"
+        # nodes may be pointed at other nodes by their user
+        node = Node(None, shared)
+        node.nodeid.NamespaceIndex = 4
+        self.assertEqual(shared, nid)
+        ua.release_nodeid(nid)
+        self.assertIsNot(ua.intern_nodeid(nid), shared)
+
+    def test_read_write_lock(self):
+        lock = ReadWriteLock()
+        with lock.write:
+            with lock.write:
+                with lock.read:
+                    pass
+        with lock.read:
+            with lock.read:
+                with self.assertRaises(RuntimeError):
+                    lock.acquire_write()
+        events = []
+
+        def reader():
+            with lock.read:
+                events.append("read")
+
+        with lock.read:
+            # readers share the lock
+            t = threading.Thread(target=reader)
+            t.start()
+            t.join()
+        self.assertEqual(events, ["read"])
+        with lock.write:
+            t = threading.Thread(target=reader)
+            t.start()
+            t.join(0.1)
+            self.assertTrue(t.is_alive())
+            events.append("write")
+        t.join()
+        self.assertEqual(events, ["read", "write", "read"])
+
+        def writer():
+            with lock.write:
+                events.append("write")
+
+        # the readers waiting when the writer releases the lock go before the next writer
+        del events[:]
+        with lock.write:
+            t1 = threading.Thread(target=reader)
+            t1.start()
+            t1.join(0.1)
+            t2 = threading.Thread(target=writer)
+            t2.start()
+            t2.join(0.1)
+        t1.join()
+        t2.join()
+        self.assertEqual(events, ["read", "write"])
+
+    def test_timer_wheel(self):
+        fired = []
+        done = threading.Event()
+
+        def callback(objs):
+            fired.append(sorted(objs))
+            for obj in objs:
+                if obj == "a" and fired.count(["a"]) < 3:
+                    wheel.schedule(obj, 0.02)
+            if len(wheel) == 0:
+                done.set()
+
+        class SmallTimerWheel(TimerWheel):
+            size = 16
+
+        wheel = SmallTimerWheel(callback)
+        # timers scheduled before the loop is set wait for it
+        wheel.schedule("a", 0.02)
+        loop = ThreadLoop()
+        loop.start()
+        try:
+            wheel.set_loop(loop)
+            wheel.schedule("b", 0.1)
+            wheel.schedule("c", 0.1)
+            # longer than a turn of the wheel
+            wheel.schedule("d", wheel.tick * (wheel.size + 10))
+            self.assertTrue(done.wait(10))
+            self.assertEqual(fired, [["a"], ["a"], ["a"], ["b", "c"], ["d"]])
+            wheel.set_loop(None)
+            wheel.schedule("e", 0.01)
+            time.sleep(0.05)
+            self.assertEqual(len(fired), 5)
+        finally:
+            loop.stop()
+            loop.join()
+            loop.close()
+
+    def test_timer_wheel_wakeups(self):
+        fired = []
+        ticks = []
+
+        class CountingTimerWheel(TimerWheel):
+            def _tick(self, generation):
+                ticks.append(generation)
+                TimerWheel._tick(self, generation)
+
+        wheel = CountingTimerWheel(lambda objs: fired.append((objs, time.time())))
+        loop = ThreadLoop()
+        loop.start()
+        try:
+            wheel.set_loop(loop)
+            start = time.time()
+            wheel.schedule("late", 0.5)
+            time.sleep(0.2)
+            # no tick with nothing due
+            self.assertEqual(ticks, [])
+            # a timer due before the next wake up
+            wheel.schedule("early", 0.05)
+            time.sleep(0.5)
+            self.assertEqual([objs for objs, _ in fired], [["early"], ["late"]])
+            self.assertLess(fired[0][1] - start, 0.4)
+            self.assertLessEqual(len(ticks), 4)
+        finally:
+            wheel.set_loop(None)
+            loop.stop()
+            loop.join()
+            loop.close()
+
+    def test_timer_wheel_wall_clock_step_back(self):
+        fired = []
+
+        def callback(objs):
+            fired.extend(objs)
+            for obj in objs:
+                wheel.schedule(obj, 0.02)
+
+        wheel = TimerWheel(callback)
+        loop = ThreadLoop()
+        loop.start()
+        try:
+            wheel.set_loop(loop)
+            wheel.schedule("a", 0.02)
+            time.sleep(0.2)
+            self.assertGreater(len(fired), 0)
+            real_time = time.time
+            with mock.patch("time.time", side_effect=lambda: real_time() - 5):
+                count = len(fired)
+                time.sleep(0.3)
+                # the wheel does not wait for the wall clock to catch up
+                self.assertGreater(len(fired) - count, 5)
+        finally:
+            wheel.set_loop(None)
+            loop.stop()
+            loop.join()
+            loop.close()
+
+    def test_pop_notifications_round_robin(self):
+        queue = OrderedDict([(1, ["a1", "a2", "a3"]), (2, ["b1"]), (3, ["c1", "c2"])])
+        self.assertEqual(InternalSubscription._pop_notifications(queue, 2), ["a1", "b1"])
+        # the item not served goes first next time
+        self.assertEqual(list(queue.items()), [(3, ["c1", "c2"]), (1, ["a2", "a3"])])
+        self.assertEqual(InternalSubscription._pop_notifications(queue, 3), ["c1", "a2", "c2"])
+        self.assertEqual(list(queue.items()), [(1, ["a3"])])
+        self.assertEqual(InternalSubscription._pop_notifications(queue, None), ["a3"])
+        self.assertEqual(queue, {})
+        # a limit which is not a multiple of the number of items
+        queue = OrderedDict((mid, [mid] * 20) for mid in "ABC")
+        popped = []
+        for _ in range(6):
+            popped.extend(InternalSubscription._pop_notifications(queue, 5))
+        self.assertEqual([popped.count(mid) for mid in "ABC"], [10, 10, 10])
+
+    def test_max_notifications_per_publish(self):
+        service = SubscriptionService(None)
+        params = ua.CreateSubscriptionParameters()
+        params.RequestedPublishingInterval = 1000
+        params.RequestedLifetimeCount = 100
+        params.RequestedMaxKeepAliveCount = 10
+        params.MaxNotificationsPerPublish = 4
+        sub = service.subscriptions[service.create_subscription(params, None).SubscriptionId]
+        self.assertEqual(sub.max_notifications, 4)
+        sub.enqueue_datachange_events([(mid, ua.MonitoredItemNotification(), 0) for mid in range(3) for _ in range(3)])
+        for _ in range(3):
+            sub.enqueue_event(10, ua.EventFieldList(), 0)
+        result = sub._pop_publish_result()
+        self.assertTrue(result.MoreNotifications)
+        datachanges, events = result.NotificationMessage.NotificationData
+        self.assertEqual((len(datachanges.MonitoredItems), len(events.Events)), (2, 2))
+        result = sub._pop_publish_result()
+        self.assertTrue(result.MoreNotifications)
+        datachanges, events = result.NotificationMessage.NotificationData
+        self.assertEqual((len(datachanges.MonitoredItems), len(events.Events)), (3, 1))
+        result = sub._pop_publish_result()
+        self.assertFalse(result.MoreNotifications)
+        self.assertEqual(len(result.NotificationMessage.NotificationData[0].MonitoredItems), 4)
+        # a message has one status change at most
+        sub.enqueue_statuschange(ua.StatusCode(ua.StatusCodes.BadTimeout))
+        sub.enqueue_statuschange(ua.StatusCode(ua.StatusCodes.BadTimeout))
+        self.assertTrue(sub._pop_publish_result().MoreNotifications)
+        # the queued status change is published at the next cycle, not counted as a keep-alive
+        self.assertTrue(sub.has_published_results())
+        self.assertFalse(sub._pop_publish_result().MoreNotifications)
+        self.assertFalse(sub.has_published_results())
+        # no client limit, the server one applies
+        params.MaxNotificationsPerPublish = 0
+        sub = service.subscriptions[service.create_subscription(params, None).SubscriptionId]
+        self.assertEqual(sub.max_notifications, SubscriptionService.max_notifications_per_publish)
+        # with a limit of 1 events are published while datachanges keep coming
+        params.MaxNotificationsPerPublish = 1
+        sub = service.subscriptions[service.create_subscription(params, None).SubscriptionId]
+        for _ in range(2):
+            sub.enqueue_event(10, ua.EventFieldList(), 0)
+        published = []
+        for _ in range(4):
+            sub.enqueue_datachange_events([(1, ua.MonitoredItemNotification(), 0)])
+            data, = sub._pop_publish_result().NotificationMessage.NotificationData
+            published.append(type(data))
+        self.assertEqual(published.count(ua.EventNotificationList), 2)
+        self.assertEqual(published.count(ua.DataChangeNotification), 2)
+
+    def test_from_trusted(self):
+        v = ua.Variant.from_trusted([1, 2], ua.VariantType.Int32, is_array=True)
+        self.assertEqual(v, ua.Variant([1, 2], ua.VariantType.Int32))
+        self.assertIsNone(v.Dimensions)
+        dv = ua.DataValue.from_trusted(v, source_timestamp=datetime(2017, 1, 1))
+        self.assertEqual(dv.Value, v)
+        self.assertTrue(dv.StatusCode.is_good())
+        self.assertEqual(dv.SourceTimestamp, datetime(2017, 1, 1))
+        self.assertIsNone(dv.ServerTimestamp)
+        self.assertEqual(dv.Encoding, 0)
+        # decoded DataValues are built without validation, check defaults are right
+        dv = struct_from_binary(ua.DataValue, ua.utils.Buffer(struct_to_binary(ua.DataValue())))
+        self.assertEqual(dv.Value, ua.Variant())
+        self.assertTrue(dv.StatusCode.is_good())
+        self.assertIsNone(dv.SourcePicoseconds)
+
     def test_variant_dimensions(self):
         l = [[[1.0, 1.0, 1.0, 1.0], [2.0, 2.0, 2.0, 2.0], [3.0, 3.0, 3.0, 3.0]], [[5.0, 5.0, 5.0, 5.0], [7.0, 8.0, 9.0, 01.0], [1.0, 1.0, 1.0, 1.0]]]
         v = ua.Variant(l)
@@ -271,6 +692,41 @@ class TestUnit(unittest.TestCase):
         self.assertEqual(v.Dimensions, v2.Dimensions)
         self.assertEqual(v, v2)
 
+    @unittest.skipIf(numpy is None, "numpy not available")
+    def test_variant_numpy(self):
+        a = numpy.arange(24, dtype="f8").reshape(2, 3, 4)
+        v = ua.Variant(a)
+        self.assertEqual(v.VariantType, ua.VariantType.Double)
+        self.assertEqual(v.Dimensions, [2, 3, 4])
+        self.assertTrue(v.is_array)
+        b = variant_to_binary(v)
+        self.assertEqual(b, variant_to_binary(ua.Variant(a.tolist())))
+        v2 = variant_from_binary(ua.utils.Buffer(b))
+        self.assertIsInstance(v2.Value, list)
+        self.assertEqual(v, v2)
+        use_numpy_arrays()
+        try:
+            v3 = variant_from_binary(ua.utils.Buffer(memoryview(b)))
+            self.assertIsInstance(v3.Value, numpy.ndarray)
+            self.assertEqual(v3.Value.shape, (2, 3, 4))
+            self.assertEqual(v3, v)
+            v = ua.Variant(numpy.array([1, -2, 3], dtype="i2"))
+            self.assertEqual(v.VariantType, ua.VariantType.Int16)
+            v2 = variant_from_binary(ua.utils.Buffer(variant_to_binary(v)))
+            self.assertEqual(v2.Value.tolist(), [1, -2, 3])
+            self.assertEqual(v2.Dimensions, None)
+            # dimensions not matching the number of elements
+            for dimensions in ([2, 2], [0], [-1, 3]):
+                v = ua.Variant([1, 2, 3], ua.VariantType.Int16, dimensions)
+                v2 = variant_from_binary(ua.utils.Buffer(variant_to_binary(v)))
+                self.assertEqual(v2.Value.tolist(), [1, 2, 3])
+                self.assertEqual(v2.Dimensions, dimensions)
+            # types without a numpy dtype are still decoded as lists
+            v = ua.Variant(["a", "b"])
+            self.assertEqual(variant_from_binary(ua.utils.Buffer(variant_to_binary(v))).Value, ["a", "b"])
+        finally:
+            use_numpy_arrays(False)
+
     def test_flatten(self):
         l = [[[1.0, 1.0, 1.0, 1.0], [1.0, 1.0, 1.0, 1.0], [1.0, 1.0, 1.0, 1.0]], [[1.0, 1.0, 1.0, 1.0], [1.0, 1.0, 1.0, 1.0], [1.0, 1.0, 1.0, 1.0]]]
         l2 = flatten(l)
@@ -496,6 +952,28 @@ class TestUnit(unittest.TestCase):
         now = datetime.utcnow()
         dv.SourceTimestamp = now
 
+    def test_cached_datavalue(self):
+        dv = ua.DataValue(ua.Variant(1.5, ua.VariantType.Double))
+        dv.SourceTimestamp = datetime.utcnow()
+        cached = CachedDataValue.from_datavalue(dv)
+        self.assertIsInstance(cached, ua.DataValue)
+        notif = ua.MonitoredItemNotification()
+        notif.ClientHandle = 7
+        notif.Value = dv
+        expected = struct_to_binary(notif)
+        notif.Value = cached
+        self.assertEqual(struct_to_binary(notif), expected)
+        # the bytes are reused, the object shared by the subscriptions cannot be modified
+        with self.assertRaises(TypeError):
+            cached.Value = ua.Variant(2.5, ua.VariantType.Double)
+        with self.assertRaises(TypeError):
+            cached.SourceTimestamp = datetime.utcnow()
+        self.assertEqual(cached.Value.Value, 1.5)
+        self.assertEqual(struct_to_binary(notif), expected)
+        decoded = struct_from_binary(ua.MonitoredItemNotification, ua.utils.Buffer(expected))
+        self.assertEqual(type(decoded.Value), ua.DataValue)
+        self.assertEqual(decoded.Value.Value.Value, 1.5)
+
     def test_variant(self):
         dv = ua.Variant(True, ua.VariantType.Boolean)
         self.assertEqual(dv.Value, True)
@@ -588,6 +1066,10 @@ class TestUnit(unittest.TestCase):
             seq += 1
             chunk.SequenceHeader.SequenceNumber = seq
             self.assertTrue(len(chunk.to_binary()) <= 28)
+        buf = bytearray()
+        for chunk in chunks:
+            chunk.write(buf)
+        self.assertEqual(bytes(buf), b"".join(chunk.to_binary() for chunk in chunks))
 
     def test_null(self):
         n = ua.NodeId(uuid.UUID('00000000-0000-0000-0000-000000000000'), 0, nodeidtype=ua.NodeIdType.Guid)